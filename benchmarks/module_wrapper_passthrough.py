@@ -0,0 +1,58 @@
+'''
+Micro-benchmark of the ModuleWrapper attribute passthrough.
+
+Compares the current passthrough with the previous implementation, that raised and caught
+an AttributeError for every delegated attribute and scanned a list in '__setattr__'.
+
+Run with:
+    python benchmarks/module_wrapper_passthrough.py
+'''
+import timeit
+
+import torch
+
+from pytorch_probing import Interceptor
+from pytorch_probing.interceptor import InterceptorLayer
+
+class _PreviousInterceptorLayer(InterceptorLayer):
+    '''
+    InterceptorLayer with the previous passthrough implementation.
+    '''
+
+    def __getattr__(self, name):
+        try:
+            return torch.nn.Module.__getattr__(self, name)
+        except AttributeError:
+            return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        member_names = list(self.__dict__.get("_member_names", ["_member_names", "_module", "_reduced"]))
+        if name in ["_member_names", "_module"] or name in member_names:
+            torch.nn.Module.__setattr__(self, name, value)
+        else:
+            return setattr(self._module, name, value)
+
+def _nest(wrapper_class, depth:int) -> torch.nn.Module:
+    module : torch.nn.Module = torch.nn.Linear(4, 4)
+    module.dummy_attribute = 0 # type: ignore
+    for _ in range(depth):
+        module = wrapper_class(module)
+    return module
+
+def main(depth:int=4, number:int=100000) -> None:
+    for name, wrapper_class in [("previous", _PreviousInterceptorLayer), ("current", InterceptorLayer)]:
+        module = _nest(wrapper_class, depth)
+
+        get_time = timeit.timeit(lambda: module.dummy_attribute, number=number)
+        set_time = timeit.timeit(lambda: setattr(module, "dummy_attribute", 1), number=number)
+
+        print(f"{name:>8}: getattr {get_time/number*1e9:8.1f} ns, setattr {set_time/number*1e9:8.1f} ns "
+              f"(depth={depth})")
+
+    interceptor = Interceptor(torch.nn.Sequential(torch.nn.Linear(4, 4)), ["0"])
+    get_time = timeit.timeit(lambda: interceptor.training, number=number)
+    print(f"Interceptor.training: {get_time/number*1e9:8.1f} ns")
+    interceptor.reduce()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from .cka import LinearCKA
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Iterable, Any, Tuple
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from pytorch_probing.interceptor import Interceptor
+
+class _PairStatistics:
+    '''
+    Statistics of a pair of paths, accumulated in float64.
+    '''
+
+    def __init__(self, n_feature_a:int, n_feature_b:int, device:torch.device) -> None:
+        '''
+        _PairStatistics init.
+
+        Args:
+            n_feature_a (int): Number of features of the first path.
+            n_feature_b (int): Number of features of the second path.
+            device (torch.device): Device to accumulate.
+        '''
+        options : Dict[str, Any] = {"dtype":torch.float64, "device":device}
+
+        # Sum of x yᵀ, x ||y||², y ||x||² and ||x||² ||y||² of each sample
+        self.xty = torch.zeros(n_feature_a, n_feature_b, **options)
+        self.x_norm_y = torch.zeros(n_feature_a, **options)
+        self.y_norm_x = torch.zeros(n_feature_b, **options)
+        self.norm_xy = torch.zeros((), **options)
+
+class LinearCKA:
+    '''
+    Computes the linear centered kernel alignment (CKA) between all the pairs of paths, with a single pass over the data.
+
+    The HSIC of the linear kernels K = XXᵀ and L = YYᵀ is computed from statistics in the feature space, as XᵀY
+    and the feature sums, so the memory does not depend on the number of samples. Supports the biased HSIC
+    estimator and the unbiased estimator of Song et al. (2012), that corrects the bias of the CKA with few samples
+    and many features. Paths with many features can be projected to random features, approximating the linear
+    kernel with bounded memory.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pytorch_probing.analysis import LinearCKA
+    >>> x = torch.randn(100, 5)
+    >>> cka = LinearCKA()
+    >>> cka.update({"a":x, "b":2*x, "c":torch.randn(100, 5)})
+    >>> round(cka.cka("a", "b"), 4)
+    1.0
+    >>> cka.matrix().shape
+    torch.Size([3, 3])
+    '''
+
+    def __init__(self, paths:Optional[List[str]]=None, unbiased:bool=True,
+                 n_random_feature:Optional[int]=None, seed:int=0) -> None:
+        '''
+        LinearCKA init.
+
+        Args:
+            paths (Optional[List[str]], optional): Paths to compare. If 'None', compares all the paths of the first
+                batch. Defaults to None.
+            unbiased (bool, optional): If should use the unbiased HSIC estimator. Requires more than 3 samples.
+                Defaults to True.
+            n_random_feature (Optional[int], optional): Number of random features. Paths with more features are
+                projected with a random orthogonal matrix, so each pair uses at most n_random_feature² memory. If 'None',
+                uses the exact features. Defaults to None.
+            seed (int, optional): Seed of the random projections. Defaults to 0.
+
+        Raises:
+            ValueError: If the number of random features is not positive.
+        '''
+        if n_random_feature is not None and n_random_feature <= 0:
+            raise ValueError("'n_random_feature' must be positive.")
+
+        self._paths = list(paths) if paths is not None else None
+        self._unbiased = unbiased
+        self._n_random_feature = n_random_feature
+        self._seed = seed
+
+        self._n = 0
+        self._sums : Dict[str, torch.Tensor] = {}
+        self._norm_sums : Dict[str, torch.Tensor] = {}
+        self._pairs : Dict[Tuple[str, str], _PairStatistics] = {}
+        self._projections : Dict[str, torch.Tensor] = {}
+
+    @property
+    def paths(self) -> List[str]:
+        '''
+        Compared paths, in order.
+        '''
+        if self._paths is not None:
+            return list(self._paths)
+        return list(self._sums.keys())
+
+    @property
+    def n_sample(self) -> int:
+        '''
+        Number of accumulated samples.
+        '''
+        return self._n
+
+    def _features(self, path:str, activation:Any) -> torch.Tensor:
+        '''
+        Gets the features of a batch of activations, projected if using random features.
+
+        Args:
+            path (str): Path of the activations.
+            activation (Any): Activations, with shape [batch, ...].
+
+        Raises:
+            ValueError: If the activation is not a tensor.
+
+        Returns:
+            torch.Tensor: Features with shape [batch, n_feature], in float64.
+        '''
+        if not isinstance(activation, torch.Tensor):
+            raise ValueError(f"Activation of path '{path}' is not a tensor.")
+
+        x = activation.detach().reshape(activation.shape[0], -1).to(torch.float64)
+
+        if self._n_random_feature is not None and x.shape[1] > self._n_random_feature:
+            if path not in self._projections:
+                generator = torch.Generator().manual_seed(self._seed+len(self._projections))
+                gaussian = torch.randn(x.shape[1], self._n_random_feature, generator=generator, dtype=torch.float64)
+                # Orthogonal features distort the kernel less than gaussian ones
+                projection, _ = torch.linalg.qr(gaussian)
+                self._projections[path] = projection*math.sqrt(x.shape[1]/self._n_random_feature)
+            x = x @ self._projections[path].to(x.device)
+
+        return x
+
+    def update(self, activations:Dict[str, Any]) -> None:
+        '''
+        Accumulates a batch.
+
+        Args:
+            activations (Dict[str, Any]): Activations of each path, with shape [batch, ...].
+
+        Raises:
+            ValueError: If a path activation is not a tensor, or a compared path is missing.
+        '''
+        if self._paths is None:
+            self._paths = list(activations.keys())
+
+        features : Dict[str, torch.Tensor] = {}
+        for path in self._paths:
+            if path not in activations:
+                raise ValueError(f"Activations of path '{path}' are missing.")
+            features[path] = self._features(path, activations[path])
+
+        norms = {path:x.square().sum(dim=1) for path, x in features.items()}
+
+        for index, path_a in enumerate(self._paths):
+            x = features[path_a]
+            if path_a not in self._sums:
+                self._sums[path_a] = torch.zeros(x.shape[1], dtype=torch.float64, device=x.device)
+                self._norm_sums[path_a] = torch.zeros((), dtype=torch.float64, device=x.device)
+            self._sums[path_a] += x.sum(dim=0)
+            self._norm_sums[path_a] += norms[path_a].sum()
+
+            for path_b in self._paths[index:]:
+                y = features[path_b].to(x.device)
+                norm_y = norms[path_b].to(x.device)
+
+                if (path_a, path_b) not in self._pairs:
+                    self._pairs[(path_a, path_b)] = _PairStatistics(x.shape[1], y.shape[1], x.device)
+                statistics = self._pairs[(path_a, path_b)]
+
+                statistics.xty += x.T @ y
+                statistics.x_norm_y += x.T @ norm_y
+                statistics.y_norm_x += y.T @ norms[path_a]
+                statistics.norm_xy += (norms[path_a]*norm_y).sum()
+
+        self._n += len(next(iter(features.values()))) if len(features) != 0 else 0
+
+    def update_from_dataset(self, dataset:Dataset, batch_size:int=256, num_workers:int=0) -> None:
+        '''
+        Accumulates all the samples of a collected dataset.
+
+        Args:
+            dataset (Dataset): CollectedDataset or IterableCollectedDataset.
+            batch_size (int, optional): Batch size used to read the dataset. Defaults to 256.
+            num_workers (int, optional): Number of DataLoader workers. Defaults to 0.
+        '''
+        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+
+        for batch in dataloader:
+            if isinstance(batch, (list, tuple)):
+                batch = batch[0]
+
+            self.update(batch)
+
+    def update_from_interceptor(self, interceptor:Interceptor, dataloader:Iterable,
+                                device:Optional[torch.device]=None) -> None:
+        '''
+        Accumulates the intercepted outputs while executing the module over a dataloader.
+
+        Args:
+            interceptor (Interceptor): Interceptor of the paths to compare.
+            dataloader (Iterable): Dataloader returning (input, target) batches.
+            device (Optional[torch.device], optional): Device to send the inputs. If 'None', does not move the inputs. Defaults to None.
+        '''
+        with torch.no_grad():
+            for x, _ in dataloader:
+                if device is not None:
+                    x = x.to(device)
+
+                interceptor(x)
+                outputs = interceptor.outputs
+                assert outputs is not None
+
+                self.update(outputs)
+                interceptor.interceptor_clear()
+
+    def hsic(self, path_a:str, path_b:str) -> float:
+        '''
+        Computes the HSIC between the linear kernels of two paths.
+
+        Args:
+            path_a (str): First path.
+            path_b (str): Second path.
+
+        Raises:
+            ValueError: If a path was not accumulated, or there are not enough samples for the estimator.
+
+        Returns:
+            float: HSIC estimate.
+        '''
+        paths = self.paths
+        for path in [path_a, path_b]:
+            if path not in self._sums:
+                raise ValueError(f"Path '{path}' was not accumulated.")
+        if paths.index(path_a) > paths.index(path_b):
+            path_a, path_b = path_b, path_a
+
+        n = self._n
+        statistics = self._pairs[(path_a, path_b)]
+        sum_x = self._sums[path_a]
+        sum_y = self._sums[path_b].to(sum_x.device)
+
+        if not self._unbiased:
+            if n < 2:
+                raise ValueError("The biased estimator requires at least 2 samples.")
+
+            centered = statistics.xty - torch.outer(sum_x, sum_y)/n
+            return float(centered.square().sum())/(n-1)**2
+
+        if n < 4:
+            raise ValueError("The unbiased estimator requires at least 4 samples.")
+
+        # Terms of the kernels with zero diagonal, K̃ and L̃, from the feature statistics
+        trace_kl = statistics.xty.square().sum() - statistics.norm_xy
+        sum_k = sum_x.dot(sum_x) - self._norm_sums[path_a]
+        sum_l = sum_y.dot(sum_y) - self._norm_sums[path_b].to(sum_y.device)
+        sum_kl = (sum_x @ statistics.xty @ sum_y - sum_x.dot(statistics.x_norm_y)
+                  - sum_y.dot(statistics.y_norm_x) + statistics.norm_xy)
+
+        hsic = trace_kl + sum_k*sum_l/((n-1)*(n-2)) - 2*sum_kl/(n-2)
+        return float(hsic)/(n*(n-3))
+
+    def cka(self, path_a:str, path_b:str) -> float:
+        '''
+        Computes the linear CKA between two paths.
+
+        Args:
+            path_a (str): First path.
+            path_b (str): Second path.
+
+        Raises:
+            ValueError: If a path was not accumulated, or there are not enough samples for the estimator.
+
+        Returns:
+            float: CKA, 1 for representations equal up to rotation and isotropic scaling.
+        '''
+        denominator = math.sqrt(max(self.hsic(path_a, path_a)*self.hsic(path_b, path_b), 0.0))
+        if denominator == 0:
+            return 0.0
+
+        return self.hsic(path_a, path_b)/denominator
+
+    def matrix(self) -> torch.Tensor:
+        '''
+        Computes the linear CKA between all the pairs of paths.
+
+        Returns:
+            torch.Tensor: Symmetric CKA matrix, with the paths in the order of 'paths'.
+        '''
+        paths = self.paths
+        hsic = torch.zeros(len(paths), len(paths), dtype=torch.float64)
+        for i, path_a in enumerate(paths):
+            for j in range(i, len(paths)):
+                hsic[i, j] = hsic[j, i] = self.hsic(path_a, paths[j])
+
+        scale = hsic.diagonal().clamp_min(0).sqrt()
+        denominator = torch.outer(scale, scale)
+
+        return torch.where(denominator == 0, torch.zeros_like(hsic), hsic/denominator)
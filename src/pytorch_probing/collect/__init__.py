@@ -1,2 +1,8 @@
 from .collect import collect
-from .collected_dataset import CollectedDataset
\ No newline at end of file
+from .collection_cache import CollectionCache
+from .collection_job import CollectionJob, collect_in_background
+from .collected_dataset import CollectedDataset
+from .iterable_collected_dataset import IterableCollectedDataset
+from .shared_chunk_cache import SharedChunkCache
+from .maintenance import transform_datasets
+from .estimate import CollectionEstimate, estimate_collection
@@ -2,18 +2,54 @@ from __future__ import annotations
 
 import os
 import json
+import types
+import typing
+import hashlib
 import datetime
-from typing import List, Tuple, Union, Optional, Dict
+import contextlib
+from typing import Callable, List, Tuple, Union, Optional, Dict, Any
 
 import torch
 from torch.utils.data import DataLoader
 import numpy as np
 
 from pytorch_probing import Interceptor
+from .collection_cache import CollectionCache, fingerprint_dataloader
+from .storage import STORAGES, Storage, create_storage, _select, _concatenate, _dtype_from_name
+from .statistics import RunningStatistics
+from .ragged import pack_sequences
+from .sparse import encode_csr, encode_topk, _sparse_spec
 
 ModuleData = Union[torch.Tensor, List["ModuleData"], 
                    Tuple["ModuleData"], Dict[str, "ModuleData"]]
 
+_AUTOCAST_DTYPES = ["bfloat16", "float16"]
+
+# Options that change the execution speed, but not the collected data
+_EXECUTION_ONLY_OPTIONS = ["num_threads", "detect_aliases"]
+
+def _autocast_dtype_name(autocast_dtype:Optional[str|torch.dtype]) -> Optional[str]:
+    '''
+    Gets the name of an autocast dtype.
+
+    Args:
+        autocast_dtype (Optional[str | torch.dtype]): Dtype or its name.
+
+    Raises:
+        ValueError: If the dtype is not supported by autocast.
+
+    Returns:
+        Optional[str]: Dtype name, as "bfloat16", or None if no autocast.
+    '''
+    if autocast_dtype is None:
+        return None
+
+    name = str(autocast_dtype).split(".")[-1]
+    if name not in _AUTOCAST_DTYPES:
+        raise ValueError(f"Unsupported autocast dtype '{autocast_dtype}'. Avaiable: {', '.join(_AUTOCAST_DTYPES)}.")
+    
+    return name
+
 def _to_cpu(x : ModuleData, detach:bool=False) -> ModuleData:
     '''
     Sends the data to the CPU.
@@ -35,20 +71,170 @@ def _to_cpu(x : ModuleData, detach:bool=False) -> ModuleData:
         result = []
         for element in x:
             result.append(_to_cpu(element, detach))
-    else:
+    elif isinstance(x, dict):
         result = {}
         for key in x:
             result[key] = _to_cpu(x[key], detach)
+    else:
+        # Other values, like None fields of structured outputs
+        result = x
 
     return result
 
+def _collection_options(save_input:bool, save_target:bool, save_prediction:bool, storage:str,
+                        compute_statistics:bool, shuffle_buffer:int, shuffle_seed:int, inference_mode:bool,
+                        autocast_dtype:Optional[str|torch.dtype], channels_last:bool,
+                        num_threads:Optional[int], sequence_mask:Optional[Callable[[Any], torch.Tensor]]=None,
+                        ragged_paths:Optional[List[str]]=None,
+                        sparse:Optional[Dict[str, str|int]]=None, detect_aliases:bool=False) -> Dict[str, Any]:
+    '''
+    Validates the collection options, as described in 'collect'.
+
+    Raises:
+        ValueError: If the storage or autocast dtype is unknown, the shuffle buffer is negative, the number
+            of threads is not positive or the ragged or sparse options are invalid.
+
+    Returns:
+        Dict[str, Any]: Options passed to '_collect'. JSON serializable.
+    '''
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown storage '{storage}'. Avaiable: {', '.join(STORAGES)}.")
+    if shuffle_buffer < 0:
+        raise ValueError("'shuffle_buffer' must not be negative.")
+    if num_threads is not None and num_threads <= 0:
+        raise ValueError("'num_threads' must be positive.")
+    if sequence_mask is None and ragged_paths is not None:
+        raise ValueError("'ragged_paths' requires a 'sequence_mask'.")
+    if sequence_mask is not None:
+        if storage == "memmap":
+            raise ValueError("The memmap storage does not support ragged outputs.")
+        if shuffle_buffer > 1:
+            raise ValueError("Shuffle-on-write does not support ragged outputs.")
+
+    sparse_specs = {path:_sparse_spec(encoding) for path, encoding in (sparse or {}).items()}
+    if any(spec["encoding"] == "csr" for spec in sparse_specs.values()):
+        if storage == "memmap":
+            raise ValueError("The memmap storage does not support the csr encoding.")
+        if shuffle_buffer > 1:
+            raise ValueError("Shuffle-on-write does not support the csr encoding.")
+    if ragged_paths is not None and any(path in sparse_specs for path in ragged_paths):
+        raise ValueError("Ragged paths can't be sparse encoded.")
+
+    return {"save_input":save_input,
+            "save_target":save_target,
+            "save_prediction":save_prediction,
+            "storage":storage,
+            "compute_statistics":compute_statistics,
+            "shuffle_buffer":shuffle_buffer,
+            "shuffle_seed":shuffle_seed,
+            "inference_mode":inference_mode,
+            "autocast_dtype":_autocast_dtype_name(autocast_dtype),
+            "channels_last":channels_last,
+            "num_threads":num_threads,
+            "sequence_mask":_callable_name(sequence_mask),
+            "ragged_paths":list(ragged_paths) if ragged_paths is not None else None,
+            "sparse":sparse_specs,
+            "detect_aliases":detect_aliases}
+
+def _callable_name(function:Optional[Callable]) -> Optional[str]:
+    '''
+    Gets the qualified name of a function, identifying it in the collection options.
+
+    Args:
+        function (Optional[Callable]): Function.
+
+    Returns:
+        Optional[str]: Module and qualified name, or None if no function.
+    '''
+    if function is None:
+        return None
+    
+    module_name = getattr(function, "__module__", None)
+    name = getattr(function, "__qualname__", type(function).__qualname__)
+
+    return f"{module_name}.{name}"
+
+def _value_bytes(value:Any) -> Optional[bytes]:
+    '''
+    Gets a stable byte representation of a value captured by a function, as a constant or a closure variable.
+
+    Args:
+        value (Any): Value.
+
+    Returns:
+        Optional[bytes]: Representation, or None if the value can't be represented stably.
+    '''
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value).encode()
+    if isinstance(value, (list, tuple, frozenset, set)):
+        elements = [_value_bytes(element) for element in value]
+        if any(element is None for element in elements):
+            return None
+
+        element_bytes = typing.cast(List[bytes], elements)
+        if isinstance(value, (set, frozenset)):
+            element_bytes = sorted(element_bytes)
+        return type(value).__name__.encode() + b"(" + b",".join(element_bytes) + b")"
+    if isinstance(value, dict):
+        return _value_bytes(sorted(value.items(), key=lambda item: repr(item[0])))
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu().numpy()
+    if isinstance(value, np.ndarray):
+        return f"{value.dtype}{value.shape}".encode() + value.tobytes()
+    if isinstance(value, types.CodeType):
+        constants = _value_bytes(value.co_consts)
+        if constants is None:
+            return None
+        return value.co_code + constants + repr(value.co_names).encode()
+    if isinstance(value, types.FunctionType):
+        fingerprint = _callable_fingerprint(value)
+        return fingerprint.encode() if fingerprint is not None else None
+
+    return None
+
+def _callable_fingerprint(function:Callable) -> Optional[str]:
+    '''
+    Fingerprints a function by its name, bytecode, constants, default arguments and closure values, identifying it 
+    in the collection cache key.
+
+    Args:
+        function (Callable): Function.
+
+    Returns:
+        Optional[str]: Name and digest, or None if the function can't be fingerprinted, as builtins and callable
+            objects.
+    '''
+    if not isinstance(function, types.FunctionType):
+        return None
+
+    closure = tuple(cell.cell_contents for cell in function.__closure__ or ())
+    parts = [_value_bytes(function.__code__), _value_bytes(function.__defaults__), _value_bytes(closure)]
+    if any(part is None for part in parts):
+        return None
+
+    digest = hashlib.sha1(b"\0".join(typing.cast(List[bytes], parts))).hexdigest()
+
+    return f"{_callable_name(function)}:{digest}"
+
 def collect(module:torch.nn.Module, paths:List[str], dataloader:DataLoader, 
             save_path:Optional[str] = None, dataset_name:Optional[str] = None,
             device_name:Optional[str]=None, 
-            save_input:bool=False, save_target:bool=False, save_prediction:bool=False) -> str:
+            save_input:bool=False, save_target:bool=False, save_prediction:bool=False,
+            cache_dir:Optional[str]=None, cache_max_bytes:Optional[int]=None,
+            data_fingerprint:Optional[str]=None, storage:str="torch",
+            compute_statistics:bool=False, shuffle_buffer:int=0, shuffle_seed:int=0,
+            inference_mode:bool=False, autocast_dtype:Optional[str|torch.dtype]=None,
+            channels_last:bool=False, num_threads:Optional[int]=None,
+            sequence_mask:Optional[Callable[[Any], torch.Tensor]]=None, 
+            ragged_paths:Optional[List[str]]=None, sparse:Optional[Dict[str, str|int]]=None,
+            detect_aliases:bool=False) -> str:
     '''
     Executes a PyTorch module over a dataset, saving intermediary outputs.
 
+    If 'cache_dir' is set, the dataset is stored in a content-addressed cache keyed by the module weights, 
+    the paths, the collection options and the data fingerprint. If the same collection was already made, 
+    returns the cached dataset path without executing the module.
+
     Args:
         module (torch.nn.Module): ,odule to execute.
         paths (List[str]): Paths of the modules to collect outputs. Can be submodules as "my_module.submodule.subsubmodule".
@@ -59,25 +245,157 @@ def collect(module:torch.nn.Module, paths:List[str], dataloader:DataLoader,
         save_input (bool, optional): If should save the dataset input. Defaults to False.
         save_target (bool, optional): If should save the dataset targets. Defaults to False.
         save_prediction (bool, optional): If should save the dataset prediction. Defaults to False.
+        cache_dir (Optional[str], optional): Directory of the collection cache. If set, 'save_path' is ignored and the dataset is 
+            stored in the cache. If 'None', does not use cache. Defaults to None.
+        cache_max_bytes (Optional[int], optional): Maximum size of the cache in bytes, least recently used datasets are 
+            evicted when exceeded. If 'None', never evicts. Defaults to None.
+        data_fingerprint (Optional[str], optional): Fingerprint identifying the dataloader data in the cache. If 'None', 
+            computes from the dataset type, lenghts and first batch. Defaults to None.
+        storage (str, optional): Storage layout: "torch" saves a '.pt' file per chunk, "append" appends all the chunks 
+            to a single file and "memmap" saves each tensor in a raw file memory mapped when reading, for fast random
+            access. Defaults to "torch".
+        compute_statistics (bool, optional): If should accumulate the per-feature mean, standard deviation, minimum and 
+            maximum of each path during the collection, in the module device, to normalize the samples when reading
+            without an extra pass over the dataset. Defaults to False.
+        shuffle_buffer (int, optional): Number of batches permuted together before writing. The samples of each
+            group of batches are shuffled with a seeded permutation and written as chunks with the batches sizes, 
+            so sequential chunk reads produce mixed batches. The original index of each sample is saved, and can be 
+            recovered with 'CollectedDataset.original_indices'. If 0 or 1, writes in the dataloader order. Defaults to 0.
+        shuffle_seed (int, optional): Seed of the shuffle-on-write permutations. Defaults to 0.
+        inference_mode (bool, optional): If should execute the module under torch.inference_mode instead of
+            torch.no_grad. Defaults to False.
+        autocast_dtype (Optional[str | torch.dtype], optional): Dtype to execute the module with autocast, "bfloat16" or 
+            "float16", in any device including the CPU. The outputs are saved with the autocast dtypes. If 'None', 
+            executes in the module precision. Defaults to None.
+        channels_last (bool, optional): If should convert the module and the 4D inputs to the channels last memory
+            format. The module is converted back to the contiguous format after the collection. Defaults to False.
+        num_threads (Optional[int], optional): Number of intra-op threads during the collection. If 'None', keeps
+            the current number. Defaults to None.
+        sequence_mask (Optional[Callable[[Any], torch.Tensor]], optional): Function that receives the input batch 
+            and returns the boolean mask of the valid positions, with shape (batch, sequence), or the lenght of each
+            sequence, with shape (batch,). If set, the ragged outputs are stored packed, with only the valid positions
+            of the sequence dimension (the second) and the lenght of each sample, and are read without padding. The
+            function bytecode, constants and captured values are part of the cache key, and functions that can't be
+            fingerprinted, as callable objects, can't be cached. Not supported by the memmap storage and shuffle-on-write.
+            If 'None', stores the outputs padded. Defaults to None.
+        ragged_paths (Optional[List[str]], optional): Intercepted paths stored packed. If 'None' and 'sequence_mask'
+            is set, packs all the paths not sparse encoded. Defaults to None.
+        sparse (Optional[Dict[str, str | int]], optional): Sparse encoding of intercepted paths, for mostly zero outputs
+            like post-ReLU activations. "csr" stores the non-zero features of each sample, exactly, and an integer k 
+            stores the k features of largest magnitude of each sample. The outputs are decoded when read, as in
+            CollectedDataset. The statistics are computed from the outputs before the encoding. The memmap storage 
+            and shuffle-on-write only support the top-k encoding. If 'None', stores all the paths dense. Defaults to None.
+        detect_aliases (bool, optional): If should store only once the paths producing the same tensor, as a container 
+            and its last child. The aliases are detected in the first batch, and must hold in all the batches. The
+            aliased paths are expanded when read, as in CollectedDataset. Defaults to False.
+
+    Raises:
+        ValueError: If the storage or autocast dtype is unknown, the shuffle buffer is negative, the number
+            of threads is not positive, the ragged or sparse options are invalid, a ragged output does not match the
+            sequence mask, a sparse encoded output is not a tensor, the sequence mask can't be fingerprinted for
+            the cache or an alias of the first batch does not hold
+            in a later batch.
 
     Returns:
         str: the created dataset path.
     '''
-    
-    original_mode = module.training
-    module.eval()
+    options = _collection_options(save_input, save_target, save_prediction, storage, compute_statistics,
+                                  shuffle_buffer, shuffle_seed, inference_mode, autocast_dtype, channels_last,
+                                  num_threads, sequence_mask, ragged_paths, sparse, detect_aliases)
+
+    cache : Optional[CollectionCache] = None
+    cache_key = ""
+    if cache_dir is not None:
+        cache = CollectionCache(cache_dir, cache_max_bytes)
+
+        if data_fingerprint is None:
+            data_fingerprint = fingerprint_dataloader(dataloader)
+        data_options = {key:value for key, value in options.items() if key not in _EXECUTION_ONLY_OPTIONS}
+        if sequence_mask is not None:
+            data_options["sequence_mask"] = _callable_fingerprint(sequence_mask)
+            if data_options["sequence_mask"] is None:
+                raise ValueError("The 'sequence_mask' can't be fingerprinted for the collection cache. Use a function "
+                                 "capturing only tensors and plain values, or collect without 'cache_dir'.")
+        cache_key = CollectionCache.make_key(module, paths, data_options, data_fingerprint)
+
+        cached_path = cache.get(cache_key)
+        if cached_path is not None:
+            return cached_path
+
+    if dataset_name is None:
+        if cache is not None:
+            dataset_name = cache_key
+        else:
+            dataset_name = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
+
+    if cache is not None:
+        dataset_path = cache.staging_path(cache_key)
+        try:
+            _collect(module, paths, dataloader, dataset_path, dataset_name, device_name, options, sequence_mask)
+        except BaseException:
+            cache.discard(dataset_path)
+            raise
+
+        return cache.put(cache_key, dataset_path)
 
     if save_path is None:
         save_path = "."
-    
-    if dataset_name is None:
-        dataset_name = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
 
     dataset_path = os.path.join(save_path, dataset_name)
 
     if not os.path.exists(dataset_path):
         os.makedirs(dataset_path)
-    
+
+    _collect(module, paths, dataloader, dataset_path, dataset_name, device_name, options, sequence_mask)
+
+    return dataset_path
+
+def _collect(module:torch.nn.Module, paths:List[str], dataloader:DataLoader, 
+             dataset_path:str, dataset_name:str, device_name:Optional[str], 
+             options:Dict[str, Any], sequence_mask:Optional[Callable[[Any], torch.Tensor]]=None) -> None:
+    '''
+    Executes the collection, writing the dataset in a existing directory.
+
+    The info is updated after each chunk is written, with "complete" false until the collection ends, so the
+    written chunks can be read during the collection.
+
+    Args:
+        module (torch.nn.Module): Module to execute.
+        paths (List[str]): Paths of the modules to collect outputs.
+        dataloader (DataLoader): Dataloader with the data.
+        dataset_path (str): Directory to write the dataset.
+        dataset_name (str): Name of the dataset.
+        device_name (Optional[str]): Device to execute the module. If 'None', uses the device of the first module parameter.
+        options (Dict[str, Any]): Collection options, with the 'save_*' flags, the storage name, if should
+            compute statistics, the shuffle-on-write buffer and seed, the execution options, the ragged paths and
+            the sparse encodings.
+        sequence_mask (Optional[Callable[[Any], torch.Tensor]], optional): Function returning the sequence mask or
+            lenghts of an input batch, to store the ragged outputs packed. Defaults to None.
+    '''
+    save_input = options["save_input"]
+    save_target = options["save_target"]
+    save_prediction = options["save_prediction"]
+
+    statistics : Optional[RunningStatistics] = None
+    if options.get("compute_statistics", False):
+        statistics = RunningStatistics()
+
+    inference_mode = options.get("inference_mode", False)
+    autocast_dtype = options.get("autocast_dtype")
+    channels_last = options.get("channels_last", False)
+    num_threads = options.get("num_threads")
+
+    storage = create_storage(options["storage"], dataset_path)
+    chunk_sizes : List[int] = []
+
+    shuffle_buffer = options.get("shuffle_buffer", 0)
+    shuffle_seed = options.get("shuffle_seed", 0)
+    shuffler : Optional[_ShuffleBuffer] = None
+    if shuffle_buffer > 1:
+        shuffler = _ShuffleBuffer(shuffle_buffer, shuffle_seed)
+
+    original_mode = module.training
+    module.eval()
 
     if device_name is None:
         device = next(module.parameters()).device
@@ -87,43 +405,258 @@ def collect(module:torch.nn.Module, paths:List[str], dataloader:DataLoader,
 
     n_sample = 0
 
-    with Interceptor(module, paths) as interceptor:
-        with torch.no_grad():
-            for chunk_index, (x, y) in enumerate(dataloader):
-                x_device = x.to(device)
+    info = {"dataset_name":dataset_name, 
+            "n_chunk": 0,
+            "n_sample": 0,
+            "has_input":save_input,
+            "has_target":save_target,
+            "has_prediction":save_prediction,
+            "module_name":module.__class__.__name__,
+            "n_chunk_total":len(dataloader),
+            "storage":storage.name,
+            "storage_info":storage.metadata(),
+            "chunk_sizes":chunk_sizes,
+            "has_statistics":False,
+            "paths":list(paths),
+            "aliases":{},
+            "ragged_paths":[],
+            "sparse":{},
+            "shuffle_buffer":shuffle_buffer if shuffler is not None else 0,
+            "shuffle_seed":shuffle_seed,
+            "execution":{"inference_mode":inference_mode,
+                         "autocast_dtype":autocast_dtype,
+                         "channels_last":channels_last,
+                         "num_threads":num_threads if num_threads is not None else torch.get_num_threads(),
+                         "device":str(device),
+                         "torch_version":torch.__version__},
+            "complete":False}
+    _write_info(dataset_path, info)
+
+    grad_context : contextlib.AbstractContextManager = torch.inference_mode() if inference_mode else torch.no_grad()
+    autocast_context : contextlib.AbstractContextManager = contextlib.nullcontext()
+    if autocast_dtype is not None:
+        autocast_context = torch.autocast(device.type, dtype=_dtype_from_name(autocast_dtype))
+
+    original_num_threads = torch.get_num_threads()
+
+    try:
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        if channels_last:
+            module = module.to(memory_format=torch.channels_last)
+
+        with Interceptor(module, paths, detect_aliases=options.get("detect_aliases", False)) as interceptor:
+            info["paths"] = interceptor.intercept_paths
+
+            sparse : Dict[str, Dict[str, Any]] = options.get("sparse") or {}
+            for path in sparse:
+                if path not in info["paths"]:
+                    raise ValueError(f"Sparse path '{path}' is not an intercepted path.")
+
+            ragged_paths : List[str] = []
+            if sequence_mask is not None:
+                ragged_paths = options.get("ragged_paths") or [path for path in info["paths"] if path not in sparse]
+                for path in ragged_paths:
+                    if path not in info["paths"]:
+                        raise ValueError(f"Ragged path '{path}' is not an intercepted path.")
+                info["ragged_paths"] = ragged_paths
+
+            aliases : Optional[Dict[str, str]] = None
+            with grad_context, autocast_context:
+                for x, y in dataloader:
+                    x_device = x.to(device)
+                    if channels_last and x_device.dim() == 4:
+                        x_device = x_device.contiguous(memory_format=torch.channels_last)
+
+                    n_sample += len(x)
+
+                    pred : torch.Tensor | Tuple[torch.Tensor] = interceptor(x_device)
 
-                n_sample += len(x)
+                    intercepted_outputs = interceptor.outputs
+                    assert intercepted_outputs is not None
 
-                pred : torch.Tensor | Tuple[torch.Tensor] = interceptor(x_device)
+                    # Aliases of the first batch are recorded and not stored, so all the chunks have the same paths
+                    if aliases is None:
+                        aliases = interceptor.aliases
+                        info["aliases"] = aliases
+                    batch_aliases = interceptor.aliases
+                    for path, source in aliases.items():
+                        if batch_aliases.get(path) != source:
+                            raise ValueError(f"Path '{path}' is an alias of '{source}' in the first batch, but not "
+                                             "in a later batch. Collect without 'detect_aliases'.")
+                    intercepted_outputs = {path:output for path, output in intercepted_outputs.items() 
+                                           if path not in aliases}
 
-                intercepted_outputs = interceptor.outputs
-                intercepted_outputs = _to_cpu(intercepted_outputs, detach=True)
-               
-                chunk = {"intercepted_outputs":intercepted_outputs, "index":chunk_index}
+                    # Ragged outputs are packed in the device, aliased ones are stored packed in the source path
+                    ragged : Dict[str, Any] = {}
+                    if sequence_mask is not None:
+                        mask_or_lengths = sequence_mask(x)
+                        for path in ragged_paths:
+                            if path in intercepted_outputs:
+                                ragged[path] = pack_sequences(intercepted_outputs.pop(path), mask_or_lengths)
 
-                if save_input:
-                    chunk["input"] = x
-                if save_target:
-                    chunk["target"] = y
-                if save_prediction:
-                    pred_cpu = _to_cpu(pred, detach=True)
-                    chunk["prediction"] = pred_cpu                        
+                    if statistics is not None:
+                        statistics.update(intercepted_outputs)
+                        statistics.update({path:packed["values"] for path, packed in ragged.items()})
+
+                    # Top-k encodings have the same size for all the samples and are stored as outputs, the 
+                    # csr encodings are packed with the ragged outputs
+                    for path, spec in sparse.items():
+                        if path not in intercepted_outputs:
+                            continue
+
+                        output = intercepted_outputs[path]
+                        if not isinstance(output, torch.Tensor):
+                            raise ValueError(f"Sparse path '{path}' output must be a tensor.")
+                        if path not in info["sparse"]:
+                            info["sparse"][path] = {**spec, "shape":list(output.shape[1:])}
+
+                        if spec["encoding"] == "topk":
+                            intercepted_outputs[path] = encode_topk(output, spec["k"])
+                        else:
+                            ragged[path] = encode_csr(intercepted_outputs.pop(path))
+
+                    intercepted_outputs = _to_cpu(intercepted_outputs, detach=True)
                 
-                chunk_path = os.path.join(dataset_path, str(chunk_index)+".pt")
+                    chunk = {"intercepted_outputs":intercepted_outputs}
+                    if len(ragged) != 0:
+                        chunk["ragged"] = _to_cpu(ragged, detach=True)
 
-                torch.save(chunk, chunk_path)
+                    if save_input:
+                        chunk["input"] = x
+                    if save_target:
+                        chunk["target"] = y
+                    if save_prediction:
+                        pred_cpu = _to_cpu(pred, detach=True)
+                        chunk["prediction"] = pred_cpu                        
+                    
+                    if shuffler is None:
+                        _write_chunk(storage, chunk, len(x), chunk_sizes, dataset_path, info)
+                    else:
+                        chunk["original_index"] = torch.arange(n_sample-len(x), n_sample)
+                        for shuffled_chunk, size in shuffler.add(chunk, len(x)):
+                            _write_chunk(storage, shuffled_chunk, size, chunk_sizes, dataset_path, info)
 
-    module.train(original_mode)
+        if shuffler is not None:
+            for shuffled_chunk, size in shuffler.flush():
+                _write_chunk(storage, shuffled_chunk, size, chunk_sizes, dataset_path, info)
 
-    info = {"dataset_name":dataset_name, 
-            "n_chunk": len(dataloader),
-            "n_sample": n_sample,
-            "has_input":save_input,
-            "has_target":save_target,
-            "has_prediction":save_prediction,
-            "module_name":module.__class__.__name__}
+        storage.finalize()
+    except BaseException as exception:
+        info["error"] = repr(exception)
+        _write_info(dataset_path, info)
+        raise
+    finally:
+        module.train(original_mode)
+        if channels_last:
+            module.to(memory_format=torch.contiguous_format)
+        torch.set_num_threads(original_num_threads)
+
+    if statistics is not None:
+        statistics.save(dataset_path)
+        info["has_statistics"] = True
+
+    info["storage_info"] = storage.metadata()
+    info["complete"] = True
+    _write_info(dataset_path, info)
+
+def _write_chunk(storage:Storage, chunk:Dict[str, Any], n_chunk_sample:int, chunk_sizes:List[int],
+                 dataset_path:str, info:Dict[str, Any]) -> None:
+    '''
+    Writes the next chunk of the dataset and publishes it in the info.
+
+    Args:
+        storage (Storage): Dataset storage.
+        chunk (Dict[str, Any]): Chunk data, without index.
+        n_chunk_sample (int): Number of samples of the chunk.
+        chunk_sizes (List[int]): Sizes of the written chunks, updated with the chunk size.
+        dataset_path (str): Dataset directory.
+        info (Dict[str, Any]): Dataset info, updated and written.
+    '''
+    chunk_index = len(chunk_sizes)
+
+    chunk["index"] = chunk_index
+    storage.write_chunk(chunk_index, chunk)
+    chunk_sizes.append(n_chunk_sample)
+
+    info["n_chunk"] = chunk_index+1
+    info["n_sample"] += n_chunk_sample
+    info["storage_info"] = storage.metadata()
+    _write_info(dataset_path, info)
+
+class _ShuffleBuffer:
+    '''
+    Buffer of batches, permuting their samples together before writing.
+    '''
+
+    def __init__(self, n_batch:int, seed:int) -> None:
+        '''
+        _ShuffleBuffer init.
+
+        Args:
+            n_batch (int): Number of batches permuted together.
+            seed (int): Seed of the permutations.
+        '''
+        self._n_batch = n_batch
+        self._generator = torch.Generator().manual_seed(seed)
+
+        self._chunks : List[Dict[str, Any]] = []
+        self._sizes : List[int] = []
+
+    def add(self, chunk:Dict[str, Any], size:int) -> List[Tuple[Dict[str, Any], int]]:
+        '''
+        Adds a batch to the buffer.
+
+        Args:
+            chunk (Dict[str, Any]): Batch data, with samples in the first dimension.
+            size (int): Number of samples of the batch.
+
+        Returns:
+            List[Tuple[Dict[str, Any], int]]: Shuffled chunks to write and their sizes, empty if the buffer is not full.
+        '''
+        self._chunks.append(chunk)
+        self._sizes.append(size)
+
+        if len(self._chunks) < self._n_batch:
+            return []
+
+        return self.flush()
+
+    def flush(self) -> List[Tuple[Dict[str, Any], int]]:
+        '''
+        Shuffles the buffered batches, emptying the buffer.
+
+        Returns:
+            List[Tuple[Dict[str, Any], int]]: Shuffled chunks and their sizes, the sizes of the buffered batches.
+        '''
+        if len(self._chunks) == 0:
+            return []
+
+        data = _concatenate(self._chunks)
+        permutation = torch.randperm(sum(self._sizes), generator=self._generator)
+
+        chunks = []
+        start = 0
+        for size in self._sizes:
+            chunks.append((_select(data, permutation[start:start+size]), size))
+            start += size
+
+        self._chunks = []
+        self._sizes = []
+
+        return chunks
+
+def _write_info(dataset_path:str, info:Dict[str, Any]) -> None:
+    '''
+    Writes the dataset info atomically, so readers never see a partially written file.
+
+    Args:
+        dataset_path (str): Dataset directory.
+        info (Dict[str, Any]): Dataset info.
+    '''
     info_path = os.path.join(dataset_path, "info.json") 
-    with open(info_path, "w") as file:
-        json.dump(info, file)
+    temp_path = info_path+".tmp"
 
-    return dataset_path
+    with open(temp_path, "w") as file:
+        json.dump(info, file)
+    os.replace(temp_path, info_path)
@@ -3,48 +3,78 @@ from __future__ import annotations
 import os
 import json
 import math
+import bisect
 import typing
-from typing import Tuple
+import hashlib
+import threading
+from typing import List, Sequence, Tuple, Dict, Any, Optional
 
 import torch
 from torch.utils.data import Dataset
 import numpy as np
 
 from pytorch_probing.collect.collect import ModuleData
+from pytorch_probing.collect.shared_chunk_cache import SharedChunkCache
+from pytorch_probing.collect.storage import Storage, create_storage, _select, _concatenate, _SAMPLE_KEYS
+from pytorch_probing.collect.ragged import unpack_sequences, slice_sequences, pad_sequences
+from pytorch_probing.collect.sparse import SPARSE_FORMATS, decode_sparse
+from pytorch_probing.collect.statistics import RunningStatistics
 
 @typing.no_type_check
-def _get_element(x:ModuleData, index:int) -> ModuleData:
+def _get_length(x:ModuleData) -> int:
     '''
-    Get element from a complex data.
+    Gets the number of elements of a complex data.
 
     Args:
-        x (ModuleData): Data to get element from.
-        index (int): Index of the element.
+        x (ModuleData): Data to get the lenght.
 
     Returns:
-        ModuleData: Data element.
+        int: Number of elements, from the first tensor found.
     '''
     if isinstance(x, torch.Tensor) or isinstance(x, np.ndarray):
-        result = x[index]
+        return len(x)
 
-    elif isinstance(x, list) or isinstance(x, tuple):
-        result = []
-        for element in x:
-            result.append(_get_element(element, index))
+    if isinstance(x, list) or isinstance(x, tuple):
+        values = x
+    elif isinstance(x, dict):
+        values = list(x.values())
     else:
-        result = {}
-        for key in x:
-            result[key] = _get_element(x[key], index)
+        values = []
+
+    for value in values:
+        length = _get_length(value)
+        if length != 0:
+            return length
+    
+    return 0
 
-    return result
+def _get_chunk_length(chunk:Dict[str, Any]) -> int:
+    '''
+    Gets the number of samples of a loaded chunk.
+
+    Args:
+        chunk (Dict[str, Any]): Chunk data.
+
+    Returns:
+        int: Number of samples.
+    '''
+    if len(chunk["intercepted_outputs"]) == 0 and len(chunk.get("ragged", {})) != 0:
+        return len(next(iter(chunk["ragged"].values()))["lengths"])
+    
+    return _get_length(chunk["intercepted_outputs"])
 
 class CollectedDataset(Dataset):
     '''
     Dataset to access collected data from pytorch_probing.collect
+
+    Ragged outputs, collected with a 'sequence_mask', are returned without padding: each item has the valid
+    positions of the sample, and batches are padded to the longest sample of the batch. Sparse encoded outputs
+    are decoded when read.
     '''
     def __init__(self, dataset_path:str, 
                  get_target=False, get_prediction=False,
-                 get_input=False) -> None:
+                 get_input=False, chunk_cache:Optional[SharedChunkCache]=None,
+                 normalize:bool=False, eps:float=1e-8, sparse_format:str="dense") -> None:
         '''
         CollectedDataset init.
 
@@ -53,22 +83,26 @@ class CollectedDataset(Dataset):
             get_target (bool, optional): If should return the saved target, if avaiable. Defaults to False.
             get_prediction (bool, optional): If should return the saved prediction, if avaiable. Defaults to False.
             get_input (bool, optional): If should return the saved input, if avaiable. Defaults to False.
+            chunk_cache (Optional[SharedChunkCache], optional): Cache to share the loaded chunks between processes, 
+                like DataLoader workers. If 'None', each process loads its own chunks. Defaults to None.
+            normalize (bool, optional): If should standardize the intercepted outputs with the per-feature mean and
+                standard deviation computed during the collection. Defaults to False.
+            eps (float, optional): Minimum standard deviation used in the normalization. Defaults to 1e-8.
+            sparse_format (str, optional): Format of the sparse encoded outputs: "dense" decodes to dense tensors,
+                with zeros in the features not stored, and "sparse" to sparse COO tensors. Defaults to "dense".
 
         Raises:
-            ValueError: If get_* is true, but * is not avaiable in the collected dataset.
+            ValueError: If get_* is true, but * is not avaiable in the collected dataset, if 'normalize' is true,
+                but the dataset doesn't have statistics, or if the sparse format is unknown or is "sparse" with
+                'normalize'.
         '''
         super().__init__()
         
         self._dataset_path = dataset_path
 
-        info_path = os.path.join(dataset_path, "info.json")
-        with open(info_path) as file:
-            self._info = json.load(file)
-
-        self._size = self._info["n_sample"]
-        self._n_chunk = self._info["n_chunk"]
-        self._name = self._info["dataset_name"]
-        self._sample_per_chunk = math.ceil(self._size / self._n_chunk)
+        # Guards the state updated by 'refresh', that can run in other thread while iterating
+        self._lock = threading.Lock()
+        self.refresh()
 
         if get_target and not self._info["has_target"]:
             raise ValueError("'get_target' is true, but given dataset doesn't have saved target.")
@@ -77,6 +111,20 @@ class CollectedDataset(Dataset):
         if get_input and not self._info["has_input"]:
             raise ValueError("'get_input' is true, but given dataset doesn't have saved inputs.")
 
+        if sparse_format not in SPARSE_FORMATS:
+            raise ValueError(f"Unknown sparse format '{sparse_format}'. Avaiable: {', '.join(SPARSE_FORMATS)}.")
+        if sparse_format == "sparse" and normalize:
+            raise ValueError("Normalized outputs are not sparse, use 'sparse_format' \"dense\" with 'normalize'.")
+        self._sparse_format = sparse_format
+
+        self._normalization : Optional[Dict[str, Tuple[torch.Tensor, torch.Tensor]]] = None
+        if normalize:
+            statistics = self.statistics
+            if statistics is None:
+                raise ValueError("'normalize' is true, but given dataset doesn't have statistics. Collect it with 'compute_statistics=True'.")
+            self._normalization = {path:(statistics.mean(path).float(), statistics.std(path).float().clamp_min(eps))
+                                   for path in statistics.paths}
+
         self._get_target = get_target
         self._get_prediction = get_prediction
         self._get_input = get_input
@@ -87,6 +135,138 @@ class CollectedDataset(Dataset):
             "input":get_input
         }
 
+        self._chunk_cache = chunk_cache
+        self._cache_prefix = hashlib.sha1(os.path.abspath(dataset_path).encode()).hexdigest()
+
+        self._current_chunk_index : Optional[int] = None
+        self._current_chunk : Optional[Dict[str, Any]] = None
+
+    def refresh(self) -> None:
+        '''
+        Reloads the dataset info, updating the avaiable chunks of a dataset being collected.
+        '''
+        info_path = os.path.join(self._dataset_path, "info.json")
+        with open(info_path) as file:
+            info = json.load(file)
+
+        with self._lock:
+            self._update_info(info)
+
+    def _update_info(self, info:Dict[str, Any]) -> None:
+        '''
+        Updates the dataset state from the dataset info.
+
+        Args:
+            info (Dict[str, Any]): Dataset info, as saved in "info.json".
+        '''
+        self._info = info
+
+        self._size = self._info["n_sample"]
+        self._n_chunk = self._info["n_chunk"]
+        self._name = self._info["dataset_name"]
+
+        self._chunk_offsets : Optional[List[int]] = None
+        if "chunk_sizes" in self._info:
+            self._chunk_offsets = [0]
+            for chunk_size in self._info["chunk_sizes"][:self._n_chunk]:
+                self._chunk_offsets.append(self._chunk_offsets[-1]+chunk_size)
+        else:
+            # Legacy datasets, only the last chunk can be smaller
+            self._sample_per_chunk = math.ceil(self._size / max(self._n_chunk, 1))
+
+        self._paths : Optional[List[str]] = self._info.get("paths")
+        self._aliases : Dict[str, str] = self._info.get("aliases", {})
+        self._ragged_paths : List[str] = self._info.get("ragged_paths", [])
+        self._sparse : Dict[str, Dict[str, Any]] = self._info.get("sparse", {})
+
+        self._storage : Storage = create_storage(self._info.get("storage", "torch"), self._dataset_path,
+                                                 self._info.get("storage_info", {}))
+
+    @property
+    def complete(self) -> bool:
+        '''
+        If the collection of the dataset finished. Datasets being collected only have the written chunks avaiable.
+        '''
+        return self._info.get("complete", True)
+    
+    @property
+    def statistics(self) -> Optional[RunningStatistics]:
+        '''
+        Per-feature statistics of the intercepted outputs computed during the collection, if avaiable.
+        '''
+        if not self._info.get("has_statistics", False):
+            return None
+        return RunningStatistics.load(self._dataset_path)
+
+    @property
+    def aliases(self) -> Dict[str, str]:
+        '''
+        Paths with the same output of an earlier path, stored only once, indexed by the alias path with the path 
+        storing the output as value.
+        '''
+        return dict(self._aliases)
+
+    @property
+    def paths(self) -> List[str]:
+        '''
+        Intercepted paths of the items, in collection order.
+        '''
+        if self._paths is not None:
+            return list(self._paths)
+        
+        # Legacy datasets, without the paths in the info
+        return list(self._storage.read_sample(0, 0, ["intercepted_outputs"])["intercepted_outputs"].keys())
+
+    @property
+    def ragged_paths(self) -> List[str]:
+        '''
+        Paths stored packed, without the padding of the sequence dimension.
+        '''
+        return list(self._ragged_paths)
+
+    @property
+    def sparse(self) -> Dict[str, Dict[str, Any]]:
+        '''
+        Sparse encoded paths, with the "encoding", "csr" or "topk", the "k" of the top-k encoding and the "shape" 
+        of the outputs of a sample.
+        '''
+        return {path:dict(spec) for path, spec in self._sparse.items()}
+
+    def _has_packed(self) -> bool:
+        '''
+        If the chunks have packed outputs, ragged or csr encoded, that are not indexed by sample.
+        '''
+        return len(self._ragged_paths) != 0 or any(spec["encoding"] == "csr" for spec in self._sparse.values())
+
+    @property
+    def shuffled(self) -> bool:
+        '''
+        If the samples were shuffled when written, with the 'shuffle_buffer' of 'collect'.
+        '''
+        return self._info.get("shuffle_buffer", 0) > 1
+
+    def original_indices(self) -> torch.Tensor:
+        '''
+        Gets the index of each sample in the collection order, before the shuffle-on-write.
+
+        Returns:
+            torch.Tensor: Original index of each avaiable sample. If the dataset is not shuffled, is the sample index.
+        '''
+        if not self.shuffled:
+            return torch.arange(self._size)
+        
+        parts = [self._storage.read_chunk(chunk_index, ["original_index"])["original_index"] 
+                 for chunk_index in range(self._n_chunk)]
+        
+        return torch.cat(parts) if len(parts) != 0 else torch.zeros(0, dtype=torch.long)
+
+    @property
+    def error(self) -> Optional[str]:
+        '''
+        Error that stopped the collection of the dataset, if any.
+        '''
+        return self._info.get("error")
+
     @property
     def name(self) -> str:
         '''
@@ -117,26 +297,318 @@ class CollectedDataset(Dataset):
         Returns:
             Tuple[torch.Tensor] | torch.Tensor: Item.
         '''
-        chunk_index = index // self._sample_per_chunk
-        sample_index_in_chunk = index % self._sample_per_chunk
+        chunk_index, sample_index_in_chunk = self._locate(index)
+
+        if self._storage.random_access and self._chunk_cache is None and not self._has_packed():
+            sample = self._storage.read_sample(chunk_index, sample_index_in_chunk, self._keys())
+            return self._format_item(sample)
 
-        chunk_path = os.path.join(self._dataset_path, str(chunk_index)+".pt")
-        chunk = torch.load(chunk_path)
+        chunk = self._get_chunk(chunk_index)
 
+        return self._get_sample(chunk, sample_index_in_chunk)
+    
+    def get_batch(self, indices:Sequence[int], pad_ragged:bool=True) -> Tuple[Any, ...] | Any:
+        '''
+        Gets a batch of items, reading the samples of each chunk together.
+
+        Args:
+            indices (Sequence[int]): Indices of the items.
+            pad_ragged (bool, optional): If should pad the ragged outputs with zeros to the longest sample of the 
+                batch. If false, the ragged outputs are lists with the output of each sample. The lenghts are 
+                avaiable with 'get_lengths'. Defaults to True.
+
+        Returns:
+            Tuple[Any, ...] | Any: Batch in the same format of '__getitem__', with the samples stacked in the first dimension.
+        '''
+        locations = [self._locate(index) for index in indices]
+
+        order : Dict[int, List[int]] = {}
+        for position, (chunk_index, _) in enumerate(locations):
+            order.setdefault(chunk_index, []).append(position)
+
+        parts = []
+        positions : List[int] = []
+        ragged : Dict[str, List[Any]] = {}
+        for chunk_index, chunk_positions in order.items():
+            sample_indices = [locations[position][1] for position in chunk_positions]
+            if not self._has_packed():
+                parts.append(self._storage.read_batch(chunk_index, sample_indices, self._keys()))
+            else:
+                chunk = self._get_chunk(chunk_index)
+                parts.append({key:_select(chunk[key], torch.tensor(sample_indices, dtype=torch.long)) 
+                              for key in self._keys()})
+                for path, packed in chunk.get("ragged", {}).items():
+                    if path in self._sparse:
+                        ragged.setdefault(path, []).extend(slice_sequences(packed, index, index+1) 
+                                                           for index in sample_indices)
+                    else:
+                        ragged.setdefault(path, []).extend(unpack_sequences(packed, sample_indices))
+            positions += chunk_positions
+
+        batch = _concatenate(parts)
         
-        return_value = []
+        inverse = torch.empty(len(positions), dtype=torch.long)
+        inverse[torch.tensor(positions, dtype=torch.long)] = torch.arange(len(positions))
+
+        batch = _select(batch, inverse)
+        for path, sequences in ragged.items():
+            sequences = [sequences[position] for position in inverse.tolist()]
+            batch["intercepted_outputs"][path] = _concatenate(sequences) if path in self._sparse else sequences
+
+        return self._format_item(batch, pad_ragged)
+
+    def get_lengths(self, indices:Sequence[int]) -> Dict[str, torch.Tensor]:
+        '''
+        Gets the lenghts of the ragged outputs of items.
+
+        Args:
+            indices (Sequence[int]): Indices of the items.
+
+        Returns:
+            Dict[str, torch.Tensor]: Lenght of the output of each item, indexed by ragged path, including the
+                paths aliased to ragged paths.
+        '''
+        lengths : Dict[str, List[int]] = {}
+        for index in indices:
+            chunk_index, sample_index = self._locate(index)
+            for path, packed in self._get_chunk(chunk_index).get("ragged", {}).items():
+                if path in self._ragged_paths:
+                    lengths.setdefault(path, []).append(int(packed["lengths"][sample_index]))
 
-        intercepted_outputs = chunk["intercepted_outputs"]
-        return_value.append(_get_element(intercepted_outputs, sample_index_in_chunk))
+        for alias, path in self._aliases.items():
+            if path in lengths:
+                lengths[alias] = lengths[path]
+
+        return {path:torch.tensor(value, dtype=torch.long) for path, value in lengths.items()}
+
+    def _locate(self, index:int) -> Tuple[int, int]:
+        '''
+        Gets the chunk of a sample.
+
+        Args:
+            index (int): Index of the sample.
+
+        Raises:
+            IndexError: If the index is out of range.
+
+        Returns:
+            Tuple[int, int]: Index of the chunk and of the sample in the chunk.
+        '''
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError(f"Index {index} out of range for dataset with {self._size} samples.")
+
+        if self._chunk_offsets is None:
+            return index // self._sample_per_chunk, index % self._sample_per_chunk
+
+        chunk_index = bisect.bisect_right(self._chunk_offsets, index)-1
         
-        names = ["target", "prediction", "input"]
-        for name in names:
-            if self._need_to_get[name]:
-                data = chunk[name]
-                    
-                sample = _get_element(data, sample_index_in_chunk)
-
-                return_value.append(sample)
+        return chunk_index, index-self._chunk_offsets[chunk_index]
+    
+    def _chunk_size(self, chunk_index:int) -> int:
+        '''
+        Gets the number of samples of a chunk.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+
+        Returns:
+            int: Number of samples.
+        '''
+        if self._chunk_offsets is None:
+            start = chunk_index*self._sample_per_chunk
+            return min(self._sample_per_chunk, self._size-start)
+        
+        return self._chunk_offsets[chunk_index+1]-self._chunk_offsets[chunk_index]
+
+    def _keys(self) -> List[str]:
+        '''
+        Gets the keys of the chunk data returned in the items.
+        '''
+        return ["intercepted_outputs"] + [name for name in ["target", "prediction", "input"] if self._need_to_get[name]]
+
+    def _chunk_keys(self) -> List[str]:
+        '''
+        Gets the keys of the chunk data loaded to get the items, with the packed ragged outputs.
+        '''
+        if not self._has_packed():
+            return self._keys()
+        return self._keys() + ["ragged"]
+
+    @property
+    def n_chunk(self) -> int:
+        '''
+        Number of chunks of the saved dataset.
+        '''
+        return self._n_chunk
+    
+    @property
+    def storage(self) -> Storage:
+        '''
+        Storage backend of the saved dataset.
+        '''
+        return self._storage
+
+    def _get_chunk(self, chunk_index:int) -> Dict[str, Any]:
+        '''
+        Gets a chunk, keeping the last used chunk loaded.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+
+        Returns:
+            Dict[str, Any]: Chunk data.
+        '''
+        if self._current_chunk_index == chunk_index and self._current_chunk is not None:
+            return self._current_chunk
+
+        if self._chunk_cache is not None:
+            if self._current_chunk_index is not None:
+                self._chunk_cache.release(self._chunk_key(self._current_chunk_index))
+            self._chunk_cache.acquire(self._chunk_key(chunk_index))
+
+        self._current_chunk = self._load_chunk(chunk_index)
+        self._current_chunk_index = chunk_index
+
+        return self._current_chunk
+
+    def _chunk_key(self, chunk_index:int) -> str:
+        '''
+        Gets the key of a chunk in the shared cache.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+
+        Returns:
+            str: Chunk key.
+        '''
+        return f"{self._cache_prefix}-{chunk_index}"
+
+    def _load_chunk(self, chunk_index:int) -> Dict[str, Any]:
+        '''
+        Loads a chunk from the shared cache, if avaiable, or from the disk.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+
+        Returns:
+            Dict[str, Any]: Chunk data.
+        '''
+        with self._lock:
+            storage = self._storage
+            chunk_keys = self._chunk_keys()
+
+        if self._chunk_cache is not None:
+            return self._chunk_cache.get(self._chunk_key(chunk_index), 
+                                         lambda: storage.read_chunk(chunk_index, _SAMPLE_KEYS+["ragged"]))
+
+        return storage.read_chunk(chunk_index, chunk_keys)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_current_chunk_index"] = None
+        state["_current_chunk"] = None
+        del state["_lock"]
+
+        return state
+
+    def __setstate__(self, state:Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_sample(self, chunk:Dict[str, Any], sample_index_in_chunk:int) -> Tuple[torch.Tensor] | torch.Tensor:
+        '''
+        Gets a item from a loaded chunk, in the same format of '__getitem__'.
+
+        Args:
+            chunk (Dict[str, Any]): Chunk data.
+            sample_index_in_chunk (int): Index of the sample in the chunk.
+
+        Returns:
+            Tuple[torch.Tensor] | torch.Tensor: Item.
+        '''
+        with self._lock:
+            sample = {key:_select(chunk[key], sample_index_in_chunk) for key in self._keys()}
+            for path, packed in chunk.get("ragged", {}).items():
+                if path in self._sparse:
+                    encoded = slice_sequences(packed, sample_index_in_chunk, sample_index_in_chunk+1)
+                    sample["intercepted_outputs"][path] = {"values":encoded["values"], "indices":encoded["indices"]}
+                else:
+                    sample["intercepted_outputs"][path] = unpack_sequences(packed, [sample_index_in_chunk])[0]
+
+            return self._format_item(sample)
+    
+    def _normalize(self, intercepted_outputs:Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Standardizes the intercepted outputs of one or more samples.
+
+        Args:
+            intercepted_outputs (Dict[str, Any]): Outputs indexed by path.
+
+        Returns:
+            Dict[str, Any]: Normalized outputs. Paths without statistics are not changed.
+        '''
+        assert self._normalization is not None
+
+        result = {}
+        for path, value in intercepted_outputs.items():
+            if path in self._normalization and isinstance(value, torch.Tensor):
+                mean, std = self._normalization[path]
+                value = (value-mean.to(value.dtype))/std.to(value.dtype)
+            elif path in self._normalization and path in self._ragged_paths and isinstance(value, list):
+                mean, std = self._normalization[path]
+                value = [(sequence-mean.to(sequence.dtype))/std.to(sequence.dtype) for sequence in value]
+            result[path] = value
+
+        return result
+
+    def _expand_aliases(self, intercepted_outputs:Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Adds the outputs of the aliased paths, stored only once in the dataset.
+
+        Args:
+            intercepted_outputs (Dict[str, Any]): Stored outputs indexed by path.
+
+        Returns:
+            Dict[str, Any]: Outputs of all the collected paths, in collection order.
+        '''
+        result = dict(intercepted_outputs)
+        for alias, path in self._aliases.items():
+            if alias not in result:
+                result[alias] = result[path]
+
+        if self._paths is not None:
+            result = {path:result[path] for path in self._paths if path in result}
+
+        return result
+
+    def _format_item(self, sample:Dict[str, Any], pad_ragged:bool=False) -> Tuple[Any, ...] | Any:
+        '''
+        Formats the data of a item as returned by '__getitem__'.
+
+        Args:
+            sample (Dict[str, Any]): Item data, indexed by the chunk keys.
+            pad_ragged (bool, optional): If should pad the ragged outputs of a batch, lists with the output of each
+                sample. Padding is made after the normalization, so the padded positions are zero. Defaults to False.
+
+        Returns:
+            Tuple[Any, ...] | Any: Item.
+        '''
+        for path, spec in self._sparse.items():
+            if isinstance(sample["intercepted_outputs"].get(path), dict):
+                sample["intercepted_outputs"][path] = decode_sparse(sample["intercepted_outputs"][path], spec["shape"],
+                                                                    self._sparse_format)
+        if self._normalization is not None:
+            sample["intercepted_outputs"] = self._normalize(sample["intercepted_outputs"])
+        if pad_ragged:
+            for path in self._ragged_paths:
+                if isinstance(sample["intercepted_outputs"].get(path), list):
+                    sample["intercepted_outputs"][path] = pad_sequences(sample["intercepted_outputs"][path])[0]
+        if len(self._aliases) != 0 or self._has_packed():
+            sample["intercepted_outputs"] = self._expand_aliases(sample["intercepted_outputs"])
+
+        return_value = [sample[key] for key in self._keys()]
 
         if len(return_value) == 1:
             return return_value[0]
@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from typing import List, Optional, Dict, Any
+
+import torch
+from torch.utils.data import DataLoader
+
+def _hash_tensor(hasher:Any, tensor:torch.Tensor) -> None:
+    '''
+    Updates a hasher with the content of a tensor.
+
+    Args:
+        hasher (Any): hashlib hasher to update.
+        tensor (torch.Tensor): Tensor to hash.
+    '''
+    tensor = tensor.detach().cpu().contiguous().reshape(-1)
+
+    hasher.update(str(tensor.dtype).encode())
+    hasher.update(tensor.view(torch.uint8).numpy().tobytes())
+
+def _hash_data(hasher:Any, x:Any) -> None:
+    '''
+    Updates a hasher with the content of a complex data (tensors, lists, tuples, dicts or other values).
+
+    Args:
+        hasher (Any): hashlib hasher to update.
+        x (Any): Data to hash.
+    '''
+    if isinstance(x, torch.Tensor):
+        hasher.update(str(tuple(x.shape)).encode())
+        _hash_tensor(hasher, x)
+    elif isinstance(x, list) or isinstance(x, tuple):
+        for element in x:
+            _hash_data(hasher, element)
+    elif isinstance(x, dict):
+        for key in sorted(x.keys(), key=str):
+            hasher.update(str(key).encode())
+            _hash_data(hasher, x[key])
+    else:
+        hasher.update(repr(x).encode())
+
+def hash_state_dict(module:torch.nn.Module) -> str:
+    '''
+    Computes a hash of the module weights.
+
+    Args:
+        module (torch.nn.Module): Module to hash.
+
+    Returns:
+        str: Hex digest of the module state_dict.
+    '''
+    hasher = hashlib.sha256()
+    hasher.update(module.__class__.__name__.encode())
+
+    state_dict = module.state_dict()
+    for key in sorted(state_dict.keys()):
+        hasher.update(key.encode())
+        _hash_data(hasher, state_dict[key])
+
+    return hasher.hexdigest()
+
+def fingerprint_dataloader(dataloader:DataLoader) -> str:
+    '''
+    Computes a fingerprint of a dataloader.
+
+    The fingerprint uses the dataset class, lengths, batch size and the content of the first batch.
+    It does not read the full dataset, so datasets that change after the first batch must be
+    identified with an explicit fingerprint.
+
+    Args:
+        dataloader (DataLoader): Dataloader to fingerprint.
+
+    Returns:
+        str: Hex digest of the dataloader.
+    '''
+    hasher = hashlib.sha256()
+
+    dataset = dataloader.dataset
+    hasher.update(dataset.__class__.__name__.encode())
+
+    try:
+        dataset_len = len(dataset) # type: ignore
+    except TypeError:
+        dataset_len = -1
+    try:
+        dataloader_len = len(dataloader)
+    except TypeError:
+        dataloader_len = -1
+
+    hasher.update(str((dataset_len, dataloader_len, dataloader.batch_size, dataloader.drop_last)).encode())
+
+    for batch in dataloader:
+        _hash_data(hasher, batch)
+        break
+
+    return hasher.hexdigest()
+
+class _CacheLock:
+    '''
+    Inter-process lock based on the atomic creation of a lock file.
+    '''
+
+    def __init__(self, lock_path:str, timeout:float=600, stale_after:float=600,
+                 poll_interval:float=0.05) -> None:
+        '''
+        _CacheLock init.
+
+        Args:
+            lock_path (str): Path of the lock file.
+            timeout (float, optional): Maximum time to wait for the lock, in seconds. Defaults to 600.
+            stale_after (float, optional): Age after which a lock file is considered abandoned, in seconds. Defaults to 600.
+            poll_interval (float, optional): Time between lock attempts, in seconds. Defaults to 0.05.
+        '''
+        self._lock_path = lock_path
+        self._timeout = timeout
+        self._stale_after = stale_after
+        self._poll_interval = poll_interval
+
+    def acquire(self) -> None:
+        '''
+        Acquires the lock, waiting for it if necessary.
+
+        Raises:
+            TimeoutError: If the lock could not be acquired before the timeout.
+        '''
+        start = time.monotonic()
+        while True:
+            try:
+                fd = os.open(self._lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return
+            except FileExistsError:
+                pass
+
+            try:
+                age = time.time() - os.path.getmtime(self._lock_path)
+                if age > self._stale_after:
+                    os.remove(self._lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+
+            if time.monotonic() - start > self._timeout:
+                raise TimeoutError(f"Could not acquire cache lock '{self._lock_path}'.")
+
+            time.sleep(self._poll_interval)
+
+    def release(self) -> None:
+        '''
+        Releases the lock.
+        '''
+        try:
+            os.remove(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.release()
+
+class CollectionCache:
+    '''
+    Content-addressed cache of collected datasets.
+
+    Each entry is a collected dataset stored in a directory named by a key computed from
+    the module weights, the collected paths, the collection options and a data fingerprint.
+    Entries are evicted in least recently used order when the cache exceeds its size.
+    All index operations are protected by a lock file, allowing concurrent processes to
+    share the same cache directory.
+    '''
+
+    _LOCK_NAME = ".lock"
+    _STAGING_PREFIX = ".staging-"
+    _ACCESS_NAME = "last_access"
+
+    def __init__(self, cache_dir:str, max_bytes:Optional[int]=None) -> None:
+        '''
+        CollectionCache init.
+
+        Args:
+            cache_dir (str): Directory of the cache. Created if it does not exist.
+            max_bytes (Optional[int], optional): Maximum size of the cache in bytes. If 'None', never evicts entries. Defaults to None.
+        '''
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = _CacheLock(os.path.join(cache_dir, self._LOCK_NAME))
+
+    @property
+    def cache_dir(self) -> str:
+        '''
+        Directory of the cache.
+        '''
+        return self._cache_dir
+
+    @staticmethod
+    def make_key(module:torch.nn.Module, paths:List[str], options:Dict[str, Any],
+                 data_fingerprint:str) -> str:
+        '''
+        Computes the key of a collection.
+
+        Args:
+            module (torch.nn.Module): Collected module.
+            paths (List[str]): Collected paths.
+            options (Dict[str, Any]): Collection options. Must be JSON serializable.
+            data_fingerprint (str): Fingerprint of the collected data.
+
+        Returns:
+            str: Collection key.
+        '''
+        hasher = hashlib.sha256()
+        hasher.update(hash_state_dict(module).encode())
+        hasher.update(json.dumps(list(paths)).encode())
+        hasher.update(json.dumps(options, sort_keys=True).encode())
+        hasher.update(data_fingerprint.encode())
+
+        return hasher.hexdigest()
+
+    def entry_path(self, key:str) -> str:
+        '''
+        Gets the path where the entry with the key is stored.
+
+        Args:
+            key (str): Entry key.
+
+        Returns:
+            str: Entry path.
+        '''
+        return os.path.join(self._cache_dir, key)
+
+    def get(self, key:str) -> Optional[str]:
+        '''
+        Gets a cached dataset, marking it as recently used.
+
+        Args:
+            key (str): Entry key.
+
+        Returns:
+            Optional[str]: Path of the cached dataset. Is None if there is no entry with the key.
+        '''
+        with self._lock:
+            path = self.entry_path(key)
+            if not os.path.exists(os.path.join(path, "info.json")):
+                return None
+
+            self._touch(key)
+
+        return path
+
+    def staging_path(self, key:str) -> str:
+        '''
+        Creates a unique directory to write an entry before inserting it in the cache.
+
+        Args:
+            key (str): Entry key.
+
+        Returns:
+            str: Staging directory path.
+        '''
+        name = f"{self._STAGING_PREFIX}{key}-{os.getpid()}-{uuid.uuid4().hex}"
+        path = os.path.join(self._cache_dir, name)
+        os.makedirs(path)
+
+        return path
+
+    def put(self, key:str, staging_path:str) -> str:
+        '''
+        Inserts a staged dataset in the cache and evicts entries if the cache is too big.
+
+        If other process already inserted the key, the staged dataset is discarded.
+
+        Args:
+            key (str): Entry key.
+            staging_path (str): Staging directory, created with 'staging_path'.
+
+        Returns:
+            str: Path of the cached dataset.
+        '''
+        with self._lock:
+            path = self.entry_path(key)
+
+            if os.path.exists(path):
+                shutil.rmtree(staging_path, ignore_errors=True)
+            else:
+                os.replace(staging_path, path)
+
+            self._touch(key)
+            self._evict(keep=key)
+
+        return path
+
+    def discard(self, staging_path:str) -> None:
+        '''
+        Removes a staged dataset that will not be inserted.
+
+        Args:
+            staging_path (str): Staging directory.
+        '''
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    def keys(self) -> List[str]:
+        '''
+        Gets the keys of the cached entries.
+
+        Returns:
+            List[str]: Entry keys.
+        '''
+        keys = []
+        for name in os.listdir(self._cache_dir):
+            if name.startswith("."):
+                continue
+            if os.path.isdir(os.path.join(self._cache_dir, name)):
+                keys.append(name)
+
+        return keys
+
+    def size(self) -> int:
+        '''
+        Gets the total size of the cached entries.
+
+        Returns:
+            int: Cache size in bytes.
+        '''
+        return sum(self._entry_size(key) for key in self.keys())
+
+    def evict(self) -> None:
+        '''
+        Evicts least recently used entries until the cache fits its maximum size.
+        '''
+        with self._lock:
+            self._evict()
+
+    def _touch(self, key:str) -> None:
+        access_path = os.path.join(self.entry_path(key), self._ACCESS_NAME)
+        with open(access_path, "a"):
+            pass
+        os.utime(access_path)
+
+    def _last_access(self, key:str) -> float:
+        access_path = os.path.join(self.entry_path(key), self._ACCESS_NAME)
+        try:
+            return os.path.getmtime(access_path)
+        except FileNotFoundError:
+            return 0.0
+
+    def _entry_size(self, key:str) -> int:
+        size = 0
+        for root, _, files in os.walk(self.entry_path(key)):
+            for file in files:
+                size += os.path.getsize(os.path.join(root, file))
+
+        return size
+
+    def _evict(self, keep:Optional[str]=None) -> None:
+        if self._max_bytes is None:
+            return
+
+        keys = self.keys()
+        sizes = {key:self._entry_size(key) for key in keys}
+        total = sum(sizes.values())
+
+        keys.sort(key=self._last_access)
+        for key in keys:
+            if total <= self._max_bytes:
+                break
+            if key == keep:
+                continue
+
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            total -= sizes[key]
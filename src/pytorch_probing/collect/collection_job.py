@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import os
+import inspect
+import datetime
+import threading
+from typing import Any, Optional
+
+from .collect import collect, _collection_options
+
+class CollectionJob:
+    '''
+    Collection running in a background thread.
+
+    The dataset can be read while collected with IterableCollectedDataset in follow mode.
+    '''
+
+    def __init__(self, dataset_path:str, thread:threading.Thread) -> None:
+        '''
+        CollectionJob init. Use 'collect_in_background' to create.
+
+        Args:
+            dataset_path (str): Path of the dataset being collected.
+            thread (threading.Thread): Thread executing the collection, not started.
+        '''
+        self._dataset_path = dataset_path
+        self._thread = thread
+        self._exception : Optional[BaseException] = None
+
+    @property
+    def dataset_path(self) -> str:
+        '''
+        Path of the dataset being collected.
+        '''
+        return self._dataset_path
+
+    @property
+    def done(self) -> bool:
+        '''
+        If the collection ended, successfully or not.
+        '''
+        return not self._thread.is_alive()
+
+    def join(self, timeout:Optional[float]=None) -> str:
+        '''
+        Waits the collection end.
+
+        Args:
+            timeout (Optional[float], optional): Maximum time to wait, in seconds. If 'None', waits indefinitely.
+                Defaults to None.
+
+        Raises:
+            TimeoutError: If the collection did not end before the timeout.
+            Exception: The exception raised by the collection, if failed.
+
+        Returns:
+            str: The created dataset path.
+        '''
+        self._thread.join(timeout)
+
+        if self._thread.is_alive():
+            raise TimeoutError("Collection did not end before the timeout.")
+        if self._exception is not None:
+            raise self._exception
+
+        return self._dataset_path
+
+    def _set_exception(self, exception:BaseException) -> None:
+        self._exception = exception
+
+def collect_in_background(*args:Any, **kwargs:Any) -> CollectionJob:
+    '''
+    Executes 'collect' in a background thread, returning immediately.
+
+    Receives the same arguments as 'collect', except the collection cache. Each chunk is published when
+    completely written, so the dataset can be consumed during the collection, as with
+    IterableCollectedDataset(..., follow=True). The statistics are avaiable only when the collection completes.
+    The module must not be used in other threads during the collection.
+
+    Raises:
+        ValueError: If the arguments are invalid, as in 'collect', or a cache directory is given.
+
+    Returns:
+        CollectionJob: Running collection, with the dataset path.
+    '''
+    arguments = inspect.signature(collect).bind(*args, **kwargs)
+    arguments.apply_defaults()
+    values = arguments.arguments
+
+    if values["cache_dir"] is not None:
+        raise ValueError("'collect_in_background' does not support the collection cache.")
+
+    # Invalid options are raised here, not in the collection thread
+    option_names = inspect.signature(_collection_options).parameters
+    _collection_options(**{name:values[name] for name in option_names})
+
+    if values["dataset_name"] is None:
+        values["dataset_name"] = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
+    if values["save_path"] is None:
+        values["save_path"] = "."
+
+    dataset_path = os.path.join(values["save_path"], values["dataset_name"])
+    os.makedirs(dataset_path, exist_ok=True)
+
+    def run() -> None:
+        try:
+            collect(**values)
+        except BaseException as exception:
+            job._set_exception(exception)
+
+    thread = threading.Thread(target=run, daemon=True)
+    job = CollectionJob(dataset_path, thread)
+    thread.start()
+
+    return job
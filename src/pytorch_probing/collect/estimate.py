@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import os
+import time
+import typing
+import tempfile
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+from torch.utils.data import DataLoader
+
+from .collect import _collect, _collection_options
+from .collected_dataset import CollectedDataset
+from .statistics import STATISTICS_FILE
+
+_METADATA_FILES = ["info.json", STATISTICS_FILE]
+
+def _format_bytes(n_byte:float) -> str:
+    '''
+    Formats a size in bytes with a binary unit.
+
+    Args:
+        n_byte (float): Size in bytes.
+
+    Returns:
+        str: Formatted size.
+    '''
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if abs(n_byte) < 1024 or unit == "TiB":
+            return f"{n_byte:.1f} {unit}" if unit != "B" else f"{int(n_byte)} B"
+        n_byte /= 1024
+    return ""
+
+def _describe(x:Any) -> Tuple[Any, Any, int]:
+    '''
+    Describes the shape, dtype and size of a sample of complex data.
+
+    Args:
+        x (Any): Tensor, or list, tuple or dict of tensors, of one sample.
+
+    Returns:
+        Tuple[Any, Any, int]: Shape and dtype, with the same structure as the data, and size in bytes.
+    '''
+    if isinstance(x, torch.Tensor):
+        return tuple(x.shape), str(x.dtype).split(".")[-1], x.nelement()*x.element_size()
+
+    if isinstance(x, list) or isinstance(x, tuple):
+        descriptions = [_describe(element) for element in x]
+        return ([shape for shape, _, _ in descriptions], [dtype for _, dtype, _ in descriptions],
+                sum(n_byte for _, _, n_byte in descriptions))
+
+    descriptions_dict = {key:_describe(x[key]) for key in x}
+    return ({key:value[0] for key, value in descriptions_dict.items()},
+            {key:value[1] for key, value in descriptions_dict.items()},
+            sum(value[2] for value in descriptions_dict.values()))
+
+class CollectionEstimate:
+    '''
+    Estimated size and duration of a collection, from a dry-run over the first batches.
+
+    Printing the estimate shows a report with the per-path sizes and the extrapolated totals.
+    '''
+
+    def __init__(self, path_shapes:Dict[str, Any], path_dtypes:Dict[str, Any], path_bytes:Dict[str, int],
+                 storage:str, n_sampled:int, sample_bytes:float, fixed_bytes:int, seconds_per_sample:float,
+                 n_sample:Optional[int], n_chunk:Optional[int], shuffle_buffer_bytes:int,
+                 aliases:Dict[str, str]) -> None:
+        '''
+        CollectionEstimate init. Use 'estimate_collection' to create.
+
+        Args:
+            path_shapes (Dict[str, Any]): Shape of a sample of each path, of the first sample for ragged paths.
+            path_dtypes (Dict[str, Any]): Dtype of each path.
+            path_bytes (Dict[str, int]): Size in bytes of a sample of each path.
+            storage (str): Storage layout.
+            n_sampled (int): Number of samples in the dry-run.
+            sample_bytes (float): Disk size of each sample in the storage layout, in bytes.
+            fixed_bytes (int): Disk size not dependent on the number of samples, in bytes.
+            seconds_per_sample (float): Collection time of each sample, in seconds.
+            n_sample (Optional[int]): Number of samples of the full collection, if known.
+            n_chunk (Optional[int]): Number of chunks of the full collection, if known.
+            shuffle_buffer_bytes (int): Memory used by the shuffle-on-write buffer, in bytes.
+            aliases (Dict[str, str]): Paths with the same output of other path, stored once.
+        '''
+        self._path_shapes = path_shapes
+        self._path_dtypes = path_dtypes
+        self._path_bytes = path_bytes
+        self._storage = storage
+        self._n_sampled = n_sampled
+        self._sample_bytes = sample_bytes
+        self._fixed_bytes = fixed_bytes
+        self._seconds_per_sample = seconds_per_sample
+        self._n_sample = n_sample
+        self._n_chunk = n_chunk
+        self._shuffle_buffer_bytes = shuffle_buffer_bytes
+        self._aliases = aliases
+
+    @property
+    def path_shapes(self) -> Dict[str, Any]:
+        '''
+        Shape of a sample of each path, without the batch dimension.
+        '''
+        return self._path_shapes
+
+    @property
+    def path_dtypes(self) -> Dict[str, Any]:
+        '''
+        Dtype name of each path.
+        '''
+        return self._path_dtypes
+
+    @property
+    def path_bytes(self) -> Dict[str, int]:
+        '''
+        Size in bytes of a sample of each path, before storage overhead.
+        '''
+        return self._path_bytes
+
+    @property
+    def aliases(self) -> Dict[str, str]:
+        '''
+        Paths with the same output of an earlier path, indexed by the alias path. Are not stored, so are
+        not included in the disk size.
+        '''
+        return self._aliases
+
+    @property
+    def storage(self) -> str:
+        '''
+        Storage layout of the estimated collection.
+        '''
+        return self._storage
+
+    @property
+    def sample_bytes(self) -> float:
+        '''
+        Disk size of each sample in the storage layout, with all the saved data and the storage overhead.
+        '''
+        return self._sample_bytes
+
+    @property
+    def seconds_per_sample(self) -> float:
+        '''
+        Measured collection time of each sample, including data loading and writing.
+        '''
+        return self._seconds_per_sample
+
+    @property
+    def n_sample(self) -> Optional[int]:
+        '''
+        Number of samples of the full collection. Is None if the dataloader has no lenght.
+        '''
+        return self._n_sample
+
+    @property
+    def n_chunk(self) -> Optional[int]:
+        '''
+        Number of chunks of the full collection. Is None if the dataloader has no lenght.
+        '''
+        return self._n_chunk
+
+    @property
+    def total_bytes(self) -> Optional[int]:
+        '''
+        Estimated disk size of the full collection. Is None if the dataloader has no lenght.
+        '''
+        if self._n_sample is None:
+            return None
+        return int(self._sample_bytes*self._n_sample)+self._fixed_bytes
+
+    @property
+    def total_seconds(self) -> Optional[float]:
+        '''
+        Estimated duration of the full collection. Is None if the dataloader has no lenght.
+        '''
+        if self._n_sample is None:
+            return None
+        return self._seconds_per_sample*self._n_sample
+
+    @property
+    def shuffle_buffer_bytes(self) -> int:
+        '''
+        Memory used by the shuffle-on-write buffer.
+        '''
+        return self._shuffle_buffer_bytes
+
+    def __str__(self) -> str:
+        lines = [f"Collection estimate ({self._storage} storage, measured on {self._n_sampled} samples)"]
+
+        name_width = max([len(path) for path in self._path_shapes]+[4])
+        for path in self._path_shapes:
+            if path in self._aliases:
+                lines.append(f"  {path:<{name_width}}  alias of {self._aliases[path]}, not stored")
+                continue
+            lines.append(f"  {path:<{name_width}}  shape={self._path_shapes[path]}  dtype={self._path_dtypes[path]}  "
+                         f"{_format_bytes(self._path_bytes[path])}/sample")
+
+        lines.append(f"  Disk per sample: {_format_bytes(self._sample_bytes)}")
+        if self._shuffle_buffer_bytes != 0:
+            lines.append(f"  Shuffle buffer memory: {_format_bytes(self._shuffle_buffer_bytes)}")
+
+        total_bytes = self.total_bytes
+        total_seconds = self.total_seconds
+        if total_bytes is None or total_seconds is None:
+            lines.append("  Totals unknown: the dataloader has no lenght.")
+        else:
+            lines.append(f"  Samples: {self._n_sample}  Chunks: {self._n_chunk}")
+            lines.append(f"  Total disk: {_format_bytes(total_bytes)}")
+            lines.append(f"  Total time: {total_seconds:.1f} s")
+
+        return "\n".join(lines)
+
+def estimate_collection(module:torch.nn.Module, paths:List[str], dataloader:DataLoader,
+                        device_name:Optional[str]=None,
+                        save_input:bool=False, save_target:bool=False, save_prediction:bool=False,
+                        storage:str="torch", compute_statistics:bool=False, shuffle_buffer:int=0,
+                        inference_mode:bool=False, autocast_dtype:Optional[str|torch.dtype]=None,
+                        channels_last:bool=False, num_threads:Optional[int]=None,
+                        sequence_mask:Optional[Callable[[Any], torch.Tensor]]=None,
+                        ragged_paths:Optional[List[str]]=None, sparse:Optional[Dict[str, str|int]]=None,
+                        detect_aliases:bool=False, n_batch:int=1) -> CollectionEstimate:
+    '''
+    Estimates the size and duration of a collection without executing it.
+
+    Collects the first batches to a temporary directory with the same options as 'collect', measuring
+    the disk size of the chosen storage layout and the time per sample, and extrapolates to the full
+    dataloader.
+
+    Args:
+        module (torch.nn.Module): Module to execute.
+        paths (List[str]): Paths of the modules to collect outputs.
+        dataloader (DataLoader): Dataloader with the data, as in 'collect'.
+        device_name (Optional[str], optional): Device to execute the module. If 'None', uses the device of the first module parameter. Defaults to None.
+        save_input (bool, optional): If should save the dataset input. Defaults to False.
+        save_target (bool, optional): If should save the dataset targets. Defaults to False.
+        save_prediction (bool, optional): If should save the dataset prediction. Defaults to False.
+        storage (str, optional): Storage layout, as in 'collect'. Defaults to "torch".
+        compute_statistics (bool, optional): If should compute the per-path statistics, as in 'collect'. Defaults to False.
+        shuffle_buffer (int, optional): Number of batches permuted together before writing, as in 'collect'. Defaults to 0.
+        inference_mode (bool, optional): If should execute under torch.inference_mode, as in 'collect'. Defaults to False.
+        autocast_dtype (Optional[str | torch.dtype], optional): Autocast dtype, as in 'collect'. Defaults to None.
+        channels_last (bool, optional): If should use the channels last memory format, as in 'collect'. Defaults to False.
+        num_threads (Optional[int], optional): Number of intra-op threads, as in 'collect'. Defaults to None.
+        sequence_mask (Optional[Callable[[Any], torch.Tensor]], optional): Function returning the sequence mask or lenghts
+            of an input batch, to store the ragged outputs packed, as in 'collect'. Defaults to None.
+        ragged_paths (Optional[List[str]], optional): Intercepted paths stored packed, as in 'collect'. Defaults to None.
+        sparse (Optional[Dict[str, str | int]], optional): Sparse encoding of intercepted paths, "csr" or the k of the
+            top-k encoding, as in 'collect'. Defaults to None.
+        detect_aliases (bool, optional): If should store only once the paths producing the same tensor, as in 'collect'.
+            Defaults to False.
+        n_batch (int, optional): Number of batches of the dry-run. More batches reduce the effect of the first
+            batch overheads in the time estimate. Defaults to 1.
+
+    Raises:
+        ValueError: If an option is invalid, as in 'collect', 'n_batch' is not positive or the dataloader is empty.
+
+    Returns:
+        CollectionEstimate: Estimated size and duration.
+    '''
+    if n_batch <= 0:
+        raise ValueError("'n_batch' must be positive.")
+
+    options = _collection_options(save_input, save_target, save_prediction, storage, compute_statistics,
+                                  shuffle_buffer, 0, inference_mode, autocast_dtype, channels_last, num_threads,
+                                  sequence_mask, ragged_paths, sparse, detect_aliases)
+
+    start = time.perf_counter()
+    batches = list(itertools.islice(iter(dataloader), n_batch))
+    load_seconds = time.perf_counter()-start
+
+    if len(batches) == 0:
+        raise ValueError("The dataloader is empty.")
+
+    n_sampled = sum(len(x) for x, _ in batches)
+
+    with tempfile.TemporaryDirectory() as dataset_path:
+        start = time.perf_counter()
+        _collect(module, paths, batches, dataset_path, "estimate", device_name, options, sequence_mask) # type: ignore[arg-type]
+        collect_seconds = time.perf_counter()-start
+
+        data_bytes = 0
+        fixed_bytes = 0
+        for name in os.listdir(dataset_path):
+            n_byte = os.path.getsize(os.path.join(dataset_path, name))
+            if name in _METADATA_FILES:
+                fixed_bytes += n_byte
+            else:
+                data_bytes += n_byte
+
+        dataset = CollectedDataset(dataset_path)
+        sample = dataset.storage.read_sample(0, 0)
+        intercepted_outputs = typing.cast(Dict[str, Any], dataset[0])
+        aliases = dataset.aliases
+
+        path_shapes : Dict[str, Any] = {}
+        path_dtypes : Dict[str, Any] = {}
+        path_bytes : Dict[str, int] = {}
+        for path, output in intercepted_outputs.items():
+            path_shapes[path], path_dtypes[path], path_bytes[path] = _describe(output)
+
+        sample_memory = sum(_describe(value)[2] for value in sample.values())
+        del sample, intercepted_outputs, dataset
+
+    shuffle_buffer_bytes = 0
+    if shuffle_buffer > 1:
+        shuffle_buffer_bytes = sample_memory*shuffle_buffer*(n_sampled//len(batches))
+
+    n_sample : Optional[int] = None
+    n_chunk : Optional[int] = None
+    try:
+        n_chunk = len(dataloader)
+        n_sample = len(dataloader.dataset) # type: ignore[arg-type]
+        if dataloader.drop_last and dataloader.batch_size is not None:
+            n_sample = n_chunk*dataloader.batch_size
+    except TypeError:
+        if n_chunk is not None:
+            n_sample = n_chunk*(n_sampled//len(batches))
+
+    return CollectionEstimate(path_shapes, path_dtypes, path_bytes, storage, n_sampled, data_bytes/n_sampled,
+                              fixed_bytes, (load_seconds+collect_seconds)/n_sampled, n_sample, n_chunk,
+                              shuffle_buffer_bytes, aliases)
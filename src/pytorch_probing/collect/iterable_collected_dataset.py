@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import os
+import time
+import queue
+import random
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple, Any, Dict
+
+import torch
+import torch.distributed
+from torch.utils.data import IterableDataset, get_worker_info
+
+from pytorch_probing.collect.collected_dataset import CollectedDataset, _get_chunk_length
+
+_END = object()
+
+class IterableCollectedDataset(IterableDataset):
+    '''
+    Streaming version of CollectedDataset.
+
+    Reads the chunks sequentially, shuffling the samples inside a buffer. Chunks are sharded
+    across DataLoader workers and distributed ranks, so each chunk is read by only one of them.
+    As DistributedSampler, all the ranks read the same number of samples, repeating samples or
+    dropping the last ones. Optionally loads the next chunks in a background thread while the
+    current one is consumed.
+
+    In follow mode, reads a dataset while it is being collected, as by 'collect_in_background', waiting
+    for new chunks until the collection is complete.
+    '''
+
+    def __init__(self, dataset_path:str,
+                 get_target=False, get_prediction=False,
+                 get_input=False, shuffle_buffer_size:int=0,
+                 shuffle_chunks:bool=False, seed:int=0, prefetch:int=1,
+                 rank:Optional[int]=None, world_size:Optional[int]=None,
+                 follow:bool=False, poll_interval:float=0.1, follow_timeout:Optional[float]=None,
+                 normalize:bool=False, drop_last:bool=False) -> None:
+        '''
+        IterableCollectedDataset init.
+
+        Args:
+            dataset_path (str): Path of the collected dataset.
+            get_target (bool, optional): If should return the saved target, if avaiable. Defaults to False.
+            get_prediction (bool, optional): If should return the saved prediction, if avaiable. Defaults to False.
+            get_input (bool, optional): If should return the saved input, if avaiable. Defaults to False.
+            shuffle_buffer_size (int, optional): Size of the buffer used to shuffle the samples. If 0 or 1,
+                does not shuffle the samples. Defaults to 0.
+            shuffle_chunks (bool, optional): If should shuffle the chunks order each epoch. Defaults to False.
+            seed (int, optional): Seed of the shuffling. Defaults to 0.
+            prefetch (int, optional): Number of chunks to load ahead in a background thread. If 0, loads
+                the chunks in the iterating thread. Defaults to 1.
+            rank (Optional[int], optional): Distributed rank. If 'None', uses torch.distributed rank if
+                initialized, otherwise 0. Defaults to None.
+            world_size (Optional[int], optional): Distributed world size. If 'None', uses torch.distributed
+                world size if initialized, otherwise 1. Defaults to None.
+            follow (bool, optional): If should read the chunks as they are written by a running collection, waiting for
+                the collection to complete. The chunks are read in writing order, 'shuffle_chunks' is ignored. Defaults to False.
+            poll_interval (float, optional): Interval between checks for new chunks in follow mode, in seconds. Defaults to 0.1.
+            follow_timeout (Optional[float], optional): Maximum time without new chunks in follow mode, in seconds. If 'None',
+                waits indefinitely. Defaults to None.
+            normalize (bool, optional): If should standardize the intercepted outputs with the collection statistics, 
+                as in CollectedDataset. The statistics are only avaiable after the collection completes, so can't
+                be used in follow mode. Defaults to False.
+            drop_last (bool, optional): If should drop the last samples of the ranks with more samples, so all the ranks
+                read the same number of samples. If False, the ranks with fewer samples repeat samples from the first
+                chunks instead. The ranks are not balanced in follow mode, as the number of samples is unknown. 
+                Defaults to False.
+
+        Raises:
+            ValueError: If get_* is true, but * is not avaiable in the collected dataset, or if 'normalize' is true,
+                but the dataset doesn't have statistics.
+            TimeoutError: If the dataset info is not created before 'follow_timeout' in follow mode.
+        '''
+        super().__init__()
+
+        self._follow = follow
+        self._poll_interval = poll_interval
+        self._follow_timeout = follow_timeout
+
+        if follow:
+            self._wait_info(dataset_path)
+
+        self._dataset = CollectedDataset(dataset_path, get_target, get_prediction, get_input, normalize=normalize)
+
+        self._shuffle_buffer_size = shuffle_buffer_size
+        self._shuffle_chunks = shuffle_chunks
+        self._seed = seed
+        self._prefetch = prefetch
+        self._rank = rank
+        self._world_size = world_size
+        self._drop_last = drop_last
+
+        self._epoch = 0
+
+    @property
+    def name(self) -> str:
+        '''
+        Name of the saved dataset.
+        '''
+        return self._dataset.name
+
+    def __len__(self) -> int:
+        '''
+        Gets the dataset lenght, summing all the shards. In follow mode, is the number of samples written 
+        at the last check.
+
+        Returns:
+            int: Dataset Lenght
+        '''
+        return len(self._dataset)
+
+    def _wait_info(self, dataset_path:str) -> None:
+        '''
+        Waits the creation of the dataset info by the collection.
+
+        Args:
+            dataset_path (str): Path of the collected dataset.
+
+        Raises:
+            TimeoutError: If the info is not created before the follow timeout.
+        '''
+        info_path = os.path.join(dataset_path, "info.json")
+        start = time.monotonic()
+
+        while not os.path.exists(info_path):
+            if self._follow_timeout is not None and time.monotonic()-start > self._follow_timeout:
+                raise TimeoutError(f"Dataset info was not created in '{dataset_path}'.")
+            time.sleep(self._poll_interval)
+
+    def set_epoch(self, epoch:int) -> None:
+        '''
+        Sets the epoch, changing the shuffling order.
+
+        Args:
+            epoch (int): Epoch number.
+        '''
+        self._epoch = epoch
+
+    def _rank_and_worker(self) -> Tuple[int, int, int, int]:
+        '''
+        Gets the current rank and worker.
+
+        Returns:
+            Tuple[int, int, int, int]: Rank, world size, worker id and number of workers.
+        '''
+        rank = self._rank
+        world_size = self._world_size
+
+        distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+        if rank is None:
+            rank = torch.distributed.get_rank() if distributed else 0
+        if world_size is None:
+            world_size = torch.distributed.get_world_size() if distributed else 1
+
+        worker_info = get_worker_info()
+        if worker_info is None:
+            worker_id = 0
+            num_workers = 1
+        else:
+            worker_id = worker_info.id
+            num_workers = worker_info.num_workers
+
+        return rank, world_size, worker_id, num_workers
+
+    def _shard(self) -> Tuple[int, int]:
+        '''
+        Gets the shard of the current worker and rank.
+
+        Returns:
+            Tuple[int, int]: Shard index and number of shards.
+        '''
+        rank, world_size, worker_id, num_workers = self._rank_and_worker()
+
+        return rank*num_workers + worker_id, world_size*num_workers
+
+    def _chunk_reads(self) -> List[Tuple[int, int]]:
+        '''
+        Gets the chunks read by the current worker and rank.
+
+        The chunks are split between the ranks, and the chunks of each rank between its workers. All the ranks read
+        the number of samples of the smallest rank, if 'drop_last', reading only the first samples of their last
+        chunks, or of the largest rank, reading again the first chunks of the dataset.
+
+        Returns:
+            List[Tuple[int, int]]: Chunk indices, in reading order, and the number of samples read from the chunk start.
+        '''
+        chunk_indices = list(range(self._dataset.n_chunk))
+
+        if self._shuffle_chunks:
+            random.Random(self._seed + self._epoch).shuffle(chunk_indices)
+
+        rank, world_size, worker_id, num_workers = self._rank_and_worker()
+
+        rank_sizes = [sum(self._dataset._chunk_size(chunk_index) for chunk_index in chunk_indices[other_rank::world_size])
+                      for other_rank in range(world_size)]
+        n_rank_sample = min(rank_sizes) if self._drop_last else max(rank_sizes)
+
+        reads : List[Tuple[int, int]] = []
+        remaining = n_rank_sample
+        for chunk_index in chunk_indices[rank::world_size]:
+            if remaining == 0:
+                break
+            n_read = min(self._dataset._chunk_size(chunk_index), remaining)
+            reads.append((chunk_index, n_read))
+            remaining -= n_read
+
+        # Pads with the first chunks, as DistributedSampler pads with the first indices
+        while remaining > 0:
+            for chunk_index in chunk_indices:
+                if remaining == 0:
+                    break
+                n_read = min(self._dataset._chunk_size(chunk_index), remaining)
+                reads.append((chunk_index, n_read))
+                remaining -= n_read
+
+        return reads[worker_id::num_workers]
+
+    def _follow_chunk_indices(self) -> Iterator[int]:
+        '''
+        Iterates the chunks of the current worker and rank as they are written.
+
+        Raises:
+            RuntimeError: If the collection failed.
+            TimeoutError: If no chunk is written for longer than the follow timeout.
+
+        Yields:
+            int: Chunk indices, in writing order.
+        '''
+        shard_index, n_shard = self._shard()
+        next_index = shard_index
+        last_progress = time.monotonic()
+
+        while True:
+            self._dataset.refresh()
+
+            if self._dataset.error is not None:
+                raise RuntimeError(f"Collection failed: {self._dataset.error}")
+
+            if next_index < self._dataset.n_chunk:
+                last_progress = time.monotonic()
+
+            while next_index < self._dataset.n_chunk:
+                yield next_index
+                next_index += n_shard
+
+            if self._dataset.complete:
+                return
+            
+            if self._follow_timeout is not None and time.monotonic()-last_progress > self._follow_timeout:
+                raise TimeoutError("No chunks were written before the follow timeout.")
+            
+            time.sleep(self._poll_interval)
+
+    def _iter_chunks(self, chunk_reads:Iterable[Tuple[int, Optional[int]]]) -> Iterator[Tuple[Dict[str, Any], Optional[int]]]:
+        '''
+        Iterates the chunks, loading them in a background thread if prefetch is enabled.
+
+        Args:
+            chunk_reads (Iterable[Tuple[int, Optional[int]]]): Chunks to load, with the number of samples read from
+                each, or 'None' to read all the samples.
+
+        Yields:
+            Tuple[Dict[str, Any], Optional[int]]: Chunk data and number of samples read.
+        '''
+        if self._prefetch <= 0:
+            for chunk_index, n_read in chunk_reads:
+                yield self._dataset._load_chunk(chunk_index), n_read
+            return
+
+        chunk_queue : queue.Queue = queue.Queue(self._prefetch)
+        stop = threading.Event()
+
+        def put(item:Any) -> bool:
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def load() -> None:
+            try:
+                for chunk_index, n_read in chunk_reads:
+                    chunk = self._dataset._load_chunk(chunk_index)
+                    if not put((chunk, n_read)):
+                        return
+
+                put(_END)
+            except BaseException as exception:
+                put(exception)
+
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                item = chunk_queue.get()
+
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+
+                yield item
+        finally:
+            stop.set()
+
+    def __iter__(self) -> Iterator[Any]:
+        '''
+        Iterates the samples of the current shard.
+
+        Yields:
+            Tuple[torch.Tensor] | torch.Tensor: Item, in the same format of CollectedDataset.
+        '''
+        chunk_reads : Iterable[Tuple[int, Optional[int]]]
+        if self._follow:
+            chunk_reads = ((chunk_index, None) for chunk_index in self._follow_chunk_indices())
+        else:
+            chunk_reads = self._chunk_reads()
+        shard_index, _ = self._shard()
+        rng = random.Random(self._seed + self._epoch*1000003 + shard_index)
+
+        buffer : List[Any] = []
+
+        for chunk, n_read in self._iter_chunks(chunk_reads):
+            n_sample = _get_chunk_length(chunk) if n_read is None else n_read
+
+            for sample_index in range(n_sample):
+                sample = self._dataset._get_sample(chunk, sample_index)
+
+                if self._shuffle_buffer_size <= 1:
+                    yield sample
+                elif len(buffer) < self._shuffle_buffer_size:
+                    buffer.append(sample)
+                else:
+                    buffer_index = rng.randrange(len(buffer))
+                    yield buffer[buffer_index]
+                    buffer[buffer_index] = sample
+
+        rng.shuffle(buffer)
+        yield from buffer
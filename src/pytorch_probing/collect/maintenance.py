@@ -0,0 +1,419 @@
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+import concurrent.futures
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+
+from .collect import _write_info
+from .collected_dataset import CollectedDataset
+from .storage import STORAGES, create_storage, _concatenate
+from .statistics import RunningStatistics
+from .ragged import slice_sequences
+
+_worker_datasets : Dict[str, CollectedDataset] = {}
+
+# (input index, start sample, end sample)
+_Range = Tuple[int, int, int]
+
+def _get_dataset(dataset_path:str) -> CollectedDataset:
+    '''
+    Gets a dataset opened in the current process.
+    '''
+    if dataset_path not in _worker_datasets:
+        _worker_datasets[dataset_path] = CollectedDataset(dataset_path)
+    return _worker_datasets[dataset_path]
+
+def _read_range(dataset:CollectedDataset, start:int, end:int, keys:List[str]) -> List[Dict[str, Any]]:
+    '''
+    Reads a contiguous range of samples, by chunk.
+
+    If the "original_index" is requested but the dataset is not shuffled, uses the sample indices. If "ragged"
+    is requested, the packed outputs of the range are read from the loaded chunk.
+
+    Args:
+        dataset (CollectedDataset): Dataset to read.
+        start (int): First sample.
+        end (int): Sample after the last.
+        keys (List[str]): Chunk keys to read.
+
+    Returns:
+        List[Dict[str, Any]]: Samples of each read chunk.
+    '''
+    parts = []
+    index = start
+    while index < end:
+        chunk_index, sample_index = dataset._locate(index)
+        n_read = min(end-index, dataset._chunk_size(chunk_index)-sample_index)
+
+        sample_keys = [key for key in keys if key != "ragged"]
+        part = dataset.storage.read_batch(chunk_index, list(range(sample_index, sample_index+n_read)), sample_keys)
+        if "ragged" in keys:
+            part["ragged"] = {path:slice_sequences(packed, sample_index, sample_index+n_read)
+                              for path, packed in dataset._get_chunk(chunk_index)["ragged"].items()}
+        if "original_index" in keys and "original_index" not in part:
+            part["original_index"] = torch.arange(index, index+n_read)
+
+        parts.append(part)
+        index += n_read
+
+    return parts
+
+def _build_chunk(input_paths:List[str], ranges:List[_Range], keys:List[str],
+                 paths:Optional[List[str]], offsets:List[int]) -> Dict[str, Any]:
+    '''
+    Builds an output chunk from ranges of the input datasets.
+
+    Args:
+        input_paths (List[str]): Input datasets paths.
+        ranges (List[_Range]): Ranges of the samples of the chunk.
+        keys (List[str]): Chunk keys to copy.
+        paths (Optional[List[str]]): Intercepted paths to keep. If 'None', keeps all.
+        offsets (List[int]): Index of the first sample of each input in the concatenated inputs, added to
+            the original indices.
+
+    Returns:
+        Dict[str, Any]: Chunk data, without index.
+    '''
+    parts = []
+    for input_index, start, end in ranges:
+        dataset = _get_dataset(input_paths[input_index])
+        range_parts = _read_range(dataset, start, end, keys)
+
+        if "original_index" in keys:
+            for part in range_parts:
+                part["original_index"] = part["original_index"]+offsets[input_index]
+
+        parts += range_parts
+
+    if paths is not None:
+        for part in parts:
+            # Aliases are only in the chunks where not stored once
+            part["intercepted_outputs"] = {path:part["intercepted_outputs"][path] for path in paths
+                                           if path in part["intercepted_outputs"]}
+            if "ragged" in part:
+                part["ragged"] = {path:part["ragged"][path] for path in paths if path in part["ragged"]}
+
+    return _concatenate(parts)
+
+def _plan_chunks(sizes:List[int], chunk_size:Optional[int],
+                 input_chunk_sizes:List[List[int]]) -> List[List[_Range]]:
+    '''
+    Splits the concatenated input samples into output chunks.
+
+    Args:
+        sizes (List[int]): Number of samples of each input.
+        chunk_size (Optional[int]): Output chunk size. If 'None', keeps the input chunks.
+        input_chunk_sizes (List[List[int]]): Chunk sizes of each input.
+
+    Returns:
+        List[List[_Range]]: Ranges of each output chunk.
+    '''
+    if chunk_size is None:
+        chunks = []
+        for input_index, input_sizes in enumerate(input_chunk_sizes):
+            start = 0
+            for size in input_sizes:
+                chunks.append([(input_index, start, start+size)])
+                start += size
+        return chunks
+
+    chunks = []
+    current : List[_Range] = []
+    current_size = 0
+    for input_index, size in enumerate(sizes):
+        start = 0
+        while start < size:
+            n_take = min(chunk_size-current_size, size-start)
+            current.append((input_index, start, start+n_take))
+            current_size += n_take
+            start += n_take
+
+            if current_size == chunk_size:
+                chunks.append(current)
+                current = []
+                current_size = 0
+
+    if current_size != 0:
+        chunks.append(current)
+
+    return chunks
+
+def _ordered_results(executor:Optional[concurrent.futures.Executor], input_paths:List[str],
+                     plan:List[List[_Range]], keys:List[str], paths:Optional[List[str]],
+                     offsets:List[int], window:int,
+                     pending:List[concurrent.futures.Future]) -> Iterator[Dict[str, Any]]:
+    '''
+    Builds the output chunks in order, with a bounded number of chunks in flight.
+
+    The futures of the chunks in flight are kept in 'pending', so the caller can cancel them if stopped.
+    '''
+    if executor is None:
+        for ranges in plan:
+            yield _build_chunk(input_paths, ranges, keys, paths, offsets)
+        return
+
+    next_chunk = 0
+    while next_chunk < len(plan) or len(pending) != 0:
+        while next_chunk < len(plan) and len(pending) < window:
+            pending.append(executor.submit(_build_chunk, input_paths, plan[next_chunk], keys, paths, offsets))
+            next_chunk += 1
+
+        yield pending.pop(0).result()
+
+def transform_datasets(input_paths:Sequence[str], output_path:str, chunk_size:Optional[int]=None,
+                       storage:Optional[str]=None, keep_paths:Optional[List[str]]=None,
+                       drop_paths:Optional[List[str]]=None, num_workers:int=0,
+                       dataset_name:Optional[str]=None) -> str:
+    '''
+    Creates a collected dataset from existing ones, changing the chunk size, storage layout or saved paths.
+
+    The inputs are concatenated in order. Output chunks are built in parallel by a process pool and
+    written in order. If all the inputs have statistics, the output statistics are combined from them.
+    If some input was shuffled on write, the original indices are kept, relative to the concatenated inputs.
+
+    Args:
+        input_paths (Sequence[str]): Paths of the collected datasets. Must have the same saved data and paths.
+        output_path (str): Path of the created dataset. Must not exist.
+        chunk_size (Optional[int], optional): Number of samples of each output chunk. If 'None', keeps the
+            input chunks. Defaults to None.
+        storage (Optional[str], optional): Storage layout of the output, as in 'collect'. If 'None', uses the
+            layout of the first input. Defaults to None.
+        keep_paths (Optional[List[str]], optional): Intercepted paths to keep. If 'None', keeps all. Defaults to None.
+        drop_paths (Optional[List[str]], optional): Intercepted paths to remove. Defaults to None.
+        num_workers (int, optional): Number of worker processes. If 0, builds the chunks in the current process.
+            Defaults to 0.
+        dataset_name (Optional[str], optional): Name of the created dataset. If 'None', uses the output directory
+            name. Defaults to None.
+
+    Raises:
+        ValueError: If there are no inputs, the inputs are incompatible or incomplete, a path does not exist, the
+            chunk size is not positive, the storage is unknown or does not support the inputs, or the output exists.
+
+    Returns:
+        str: The created dataset path.
+    '''
+    input_paths = list(input_paths)
+    if len(input_paths) == 0:
+        raise ValueError("At least one input dataset is required.")
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("'chunk_size' must be positive.")
+    if os.path.exists(output_path):
+        raise ValueError(f"Output path '{output_path}' already exists.")
+
+    datasets = [CollectedDataset(path) for path in input_paths]
+    infos = [dataset._info for dataset in datasets]
+
+    flags = ["has_input", "has_target", "has_prediction"]
+    for dataset, dataset_info in zip(datasets, infos):
+        if not dataset.complete:
+            raise ValueError(f"Dataset '{dataset.name}' is not complete.")
+        if any(dataset_info[flag] != infos[0][flag] for flag in flags):
+            raise ValueError("Input datasets must have the same saved data.")
+
+    aliases = datasets[0].aliases
+    ragged_paths = datasets[0].ragged_paths
+    available_paths = datasets[0].paths
+    for dataset in datasets[1:]:
+        other_paths = dataset.paths
+        if set(other_paths) != set(available_paths):
+            raise ValueError("Input datasets must have the same intercepted paths.")
+        if dataset.aliases != aliases:
+            raise ValueError("Input datasets must have the same aliased paths.")
+        if dataset.ragged_paths != ragged_paths:
+            raise ValueError("Input datasets must have the same ragged paths.")
+        if dataset.sparse != datasets[0].sparse:
+            raise ValueError("Input datasets must have the same sparse encodings.")
+
+    paths = available_paths if keep_paths is None else list(keep_paths)
+    if drop_paths is not None:
+        paths = [path for path in paths if path not in drop_paths]
+    for path in paths:
+        if path not in available_paths:
+            raise ValueError(f"Path '{path}' is not in the input datasets.")
+        if path in aliases and aliases[path] not in paths:
+            raise ValueError(f"Path '{path}' is stored as an alias of '{aliases[path]}', that must also be kept.")
+    selected_paths = None if paths == available_paths else paths
+
+    if storage is None:
+        storage = infos[0].get("storage", "torch")
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown storage '{storage}'. Avaiable: {', '.join(STORAGES)}.")
+    if storage == "memmap" and datasets[0]._has_packed():
+        raise ValueError("The memmap storage does not support ragged outputs and the csr encoding.")
+
+    keys = ["intercepted_outputs"] + [name for name in ["input", "target", "prediction"] if infos[0]["has_"+name]]
+    shuffled = any(dataset.shuffled for dataset in datasets)
+    if shuffled:
+        keys.append("original_index")
+    if datasets[0]._has_packed():
+        keys.append("ragged")
+
+    offsets = [0]
+    for dataset in datasets[:-1]:
+        offsets.append(offsets[-1]+len(dataset))
+
+    plan = _plan_chunks([len(dataset) for dataset in datasets], chunk_size,
+                        [[dataset._chunk_size(i) for i in range(dataset.n_chunk)] for dataset in datasets])
+
+    if dataset_name is None:
+        dataset_name = os.path.basename(os.path.normpath(output_path))
+
+    os.makedirs(output_path)
+    output_storage = create_storage(storage, output_path)
+    chunk_sizes : List[int] = []
+
+    info : Dict[str, Any] = {"dataset_name":dataset_name,
+                             "n_chunk":0,
+                             "n_sample":0,
+                             "has_input":infos[0]["has_input"],
+                             "has_target":infos[0]["has_target"],
+                             "has_prediction":infos[0]["has_prediction"],
+                             "module_name":infos[0]["module_name"],
+                             "n_chunk_total":len(plan),
+                             "storage":output_storage.name,
+                             "storage_info":output_storage.metadata(),
+                             "chunk_sizes":chunk_sizes,
+                             "source_datasets":[dataset_info["dataset_name"] for dataset_info in infos],
+                             "has_statistics":False,
+                             "paths":paths,
+                             "aliases":{alias:path for alias, path in aliases.items() if alias in paths},
+                             "ragged_paths":[path for path in ragged_paths if path in paths],
+                             "sparse":{path:spec for path, spec in datasets[0].sparse.items() if path in paths},
+                             "shuffle_buffer":max(dataset_info.get("shuffle_buffer", 0) for dataset_info in infos),
+                             "complete":False}
+    _write_info(output_path, info)
+
+    executor : Optional[concurrent.futures.Executor] = None
+    pending : List[concurrent.futures.Future] = []
+    if num_workers > 0:
+        executor = concurrent.futures.ProcessPoolExecutor(num_workers)
+
+    try:
+        chunks = _ordered_results(executor, input_paths, plan, keys, selected_paths, offsets,
+                                  2*max(num_workers, 1), pending)
+        for chunk_index, chunk in enumerate(chunks):
+            chunk["index"] = chunk_index
+            output_storage.write_chunk(chunk_index, chunk)
+
+            n_chunk_sample = sum(end-start for _, start, end in plan[chunk_index])
+            chunk_sizes.append(n_chunk_sample)
+
+            info["n_chunk"] = chunk_index+1
+            info["n_sample"] += n_chunk_sample
+            info["storage_info"] = output_storage.metadata()
+            _write_info(output_path, info)
+    except BaseException as exception:
+        info["error"] = repr(exception)
+        _write_info(output_path, info)
+        raise
+    finally:
+        if executor is not None:
+            # 'cancel_futures' of 'shutdown' requires Python 3.9
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+        _worker_datasets.clear()
+
+    output_storage.finalize()
+
+    input_statistics = [dataset.statistics for dataset in datasets]
+    if all(dataset_statistics is not None for dataset_statistics in input_statistics):
+        statistics = RunningStatistics()
+        for dataset_statistics in input_statistics:
+            assert dataset_statistics is not None
+            statistics.merge(dataset_statistics)
+
+        statistics.save(output_path, paths)
+        info["has_statistics"] = True
+
+    info["storage_info"] = output_storage.metadata()
+    info["complete"] = True
+    _write_info(output_path, info)
+
+    return output_path
+
+def rechunk(input_path:str, output_path:str, chunk_size:int, num_workers:int=0) -> str:
+    '''
+    Creates a copy of a collected dataset with a different chunk size.
+
+    Args:
+        input_path (str): Path of the collected dataset.
+        output_path (str): Path of the created dataset.
+        chunk_size (int): Number of samples of each output chunk.
+        num_workers (int, optional): Number of worker processes. Defaults to 0.
+
+    Returns:
+        str: The created dataset path.
+    '''
+    return transform_datasets([input_path], output_path, chunk_size=chunk_size, num_workers=num_workers)
+
+def convert(input_path:str, output_path:str, storage:str, num_workers:int=0) -> str:
+    '''
+    Creates a copy of a collected dataset with a different storage layout.
+
+    Args:
+        input_path (str): Path of the collected dataset.
+        output_path (str): Path of the created dataset.
+        storage (str): Storage layout of the output, as in 'collect'.
+        num_workers (int, optional): Number of worker processes. Defaults to 0.
+
+    Returns:
+        str: The created dataset path.
+    '''
+    return transform_datasets([input_path], output_path, storage=storage, num_workers=num_workers)
+
+def merge(input_paths:Sequence[str], output_path:str, chunk_size:Optional[int]=None, num_workers:int=0) -> str:
+    '''
+    Concatenates collected datasets.
+
+    Args:
+        input_paths (Sequence[str]): Paths of the collected datasets.
+        output_path (str): Path of the created dataset.
+        chunk_size (Optional[int], optional): Number of samples of each output chunk. If 'None', keeps the
+            input chunks. Defaults to None.
+        num_workers (int, optional): Number of worker processes. Defaults to 0.
+
+    Returns:
+        str: The created dataset path.
+    '''
+    return transform_datasets(input_paths, output_path, chunk_size=chunk_size, num_workers=num_workers)
+
+def main(argv:Optional[List[str]]=None) -> int:
+    '''
+    Command line entry point of the dataset maintenance tool.
+
+    Args:
+        argv (Optional[List[str]], optional): Arguments. If 'None', uses the command line arguments. Defaults to None.
+
+    Returns:
+        int: Exit code.
+    '''
+    parser = argparse.ArgumentParser(prog="pytorch-probing-dataset",
+                                     description="Rechunks, converts, filters and merges collected datasets.")
+    parser.add_argument("inputs", nargs="+", help="Paths of the collected datasets, concatenated in order.")
+    parser.add_argument("-o", "--output", required=True, help="Path of the created dataset.")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Number of samples of each output chunk.")
+    parser.add_argument("--storage", choices=list(STORAGES), default=None, help="Storage layout of the output.")
+    parser.add_argument("--keep-path", action="append", default=None, help="Intercepted path to keep. Can be repeated.")
+    parser.add_argument("--drop-path", action="append", default=None, help="Intercepted path to remove. Can be repeated.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    parser.add_argument("--name", default=None, help="Name of the created dataset.")
+
+    args = parser.parse_args(argv)
+
+    try:
+        output_path = transform_datasets(args.inputs, args.output, args.chunk_size, args.storage, args.keep_path,
+                                         args.drop_path, args.workers, args.name)
+    except ValueError as exception:
+        print(f"error: {exception}", file=sys.stderr)
+        return 2
+
+    print(output_path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+
+def _sequence_mask(output:torch.Tensor, mask_or_lengths:torch.Tensor) -> torch.Tensor:
+    '''
+    Gets the mask of the valid positions of a batch of sequences.
+
+    Args:
+        output (torch.Tensor): Sequences, with shape (batch, sequence, ...).
+        mask_or_lengths (torch.Tensor): Boolean mask of the valid positions with shape (batch, sequence), or
+            number of valid positions of each sequence with shape (batch,), the first positions being valid.
+
+    Raises:
+        ValueError: If the output or mask shapes don't match.
+
+    Returns:
+        torch.Tensor: Boolean mask with shape (batch, sequence), in the output device.
+    '''
+    if output.dim() < 2:
+        raise ValueError(f"Ragged outputs must have a sequence dimension, got shape {tuple(output.shape)}.")
+
+    mask_or_lengths = mask_or_lengths.to(output.device)
+    if mask_or_lengths.dim() == 1:
+        positions = torch.arange(output.shape[1], device=output.device)
+        mask = positions.unsqueeze(0) < mask_or_lengths.unsqueeze(1)
+    else:
+        mask = mask_or_lengths.bool()
+
+    if tuple(mask.shape) != tuple(output.shape[:2]):
+        raise ValueError(f"Sequence mask with shape {tuple(mask.shape)} does not match output with shape {tuple(output.shape)}.")
+
+    return mask
+
+def pack_sequences(output:torch.Tensor, mask_or_lengths:torch.Tensor) -> Dict[str, torch.Tensor]:
+    '''
+    Packs a batch of padded sequences, keeping only the valid positions.
+
+    Args:
+        output (torch.Tensor): Padded sequences, with shape (batch, sequence, ...).
+        mask_or_lengths (torch.Tensor): Boolean mask of the valid positions with shape (batch, sequence), or
+            number of valid positions of each sequence with shape (batch,).
+
+    Raises:
+        ValueError: If the output or mask shapes don't match.
+
+    Returns:
+        Dict[str, torch.Tensor]: Packed sequences, with the "values" of the valid positions of all the sequences
+            concatenated and the "lengths" of each sequence.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pytorch_probing.collect.ragged import pack_sequences
+    >>> packed = pack_sequences(torch.tensor([[1, 2, 0], [3, 0, 0]]), torch.tensor([2, 1]))
+    >>> packed["values"], packed["lengths"]
+    (tensor([1, 2, 3]), tensor([2, 1]))
+    '''
+    mask = _sequence_mask(output, mask_or_lengths)
+
+    return {"values":output[mask], "lengths":mask.sum(dim=1)}
+
+def unpack_sequences(packed:Dict[str, torch.Tensor], indices:Sequence[int]) -> List[torch.Tensor]:
+    '''
+    Gets sequences from packed sequences, as views of the packed values.
+
+    Args:
+        packed (Dict[str, torch.Tensor]): Packed sequences, as returned by 'pack_sequences'.
+        indices (Sequence[int]): Indices of the sequences.
+
+    Returns:
+        List[torch.Tensor]: Sequences, with shape (lenght, ...).
+    '''
+    lengths = packed["lengths"]
+    ends = lengths.cumsum(dim=0).tolist()
+    lengths_list = lengths.tolist()
+
+    return [packed["values"][ends[index]-lengths_list[index]:ends[index]] for index in indices]
+
+def slice_sequences(packed:Dict[str, torch.Tensor], start:int, end:int) -> Dict[str, torch.Tensor]:
+    '''
+    Gets a contiguous range of packed sequences, still packed.
+
+    Args:
+        packed (Dict[str, torch.Tensor]): Packed sequences, as returned by 'pack_sequences'. Other tensors packed
+            with the values, as the indices of sparse encodings, are also sliced.
+        start (int): First sequence.
+        end (int): Sequence after the last.
+
+    Returns:
+        Dict[str, torch.Tensor]: Packed sequences of the range.
+    '''
+    lengths = packed["lengths"]
+    value_start = int(lengths[:start].sum())
+    value_end = value_start+int(lengths[start:end].sum())
+
+    result = {key:value[value_start:value_end] for key, value in packed.items() if key != "lengths"}
+    result["lengths"] = lengths[start:end]
+
+    return result
+
+def pad_sequences(sequences:List[torch.Tensor], padding_value:float=0.0) -> Tuple[torch.Tensor, torch.Tensor]:
+    '''
+    Pads sequences with different lenghts to a batch.
+
+    Args:
+        sequences (List[torch.Tensor]): Sequences, with shape (lenght, ...).
+        padding_value (float, optional): Value of the padded positions. Defaults to 0.0.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: Padded batch with shape (batch, max lenght, ...), and the lenght of each sequence.
+    '''
+    lengths = torch.tensor([len(sequence) for sequence in sequences], dtype=torch.long)
+    padded = torch.nn.utils.rnn.pad_sequence(sequences, batch_first=True, padding_value=padding_value)
+
+    return padded, lengths
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import os
+import glob
+import uuid
+import shutil
+import tempfile
+from typing import Callable, Dict, Any, Optional, List
+
+import torch
+
+from .collection_cache import _CacheLock
+
+def _default_directory() -> str:
+    '''
+    Gets the default directory of the shared cache, using shared memory if avaiable.
+
+    Returns:
+        str: "/dev/shm" if exists, otherwise the temporary directory.
+    '''
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+def _process_alive(pid:int) -> bool:
+    '''
+    Checks if a process is alive.
+
+    Args:
+        pid (int): Process id.
+
+    Returns:
+        bool: False if the process certainly does not exist.
+    '''
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class SharedChunkCache:
+    '''
+    Cache of decoded chunks shared across processes, such as DataLoader workers.
+
+    Chunks are saved in a shared memory directory (/dev/shm, if avaiable) and memory mapped by each process,
+    so all processes use the same physical pages. Each chunk is decoded once, with a lock preventing
+    concurrent decoding of the same chunk. Chunks being used are referenced and are not evicted when the
+    cache exceeds its size.
+
+    Must be created in the main process before creating the DataLoader, and passed to CollectedDataset.
+    '''
+
+    def __init__(self, max_bytes:int, directory:Optional[str]=None, namespace:Optional[str]=None) -> None:
+        '''
+        SharedChunkCache init.
+
+        Args:
+            max_bytes (int): Maximum size of the cached chunks, in bytes.
+            directory (Optional[str], optional): Directory to create the cache. If 'None', uses "/dev/shm" if
+                avaiable, otherwise the temporary directory. Defaults to None.
+            namespace (Optional[str], optional): Name of the cache. Processes using the same namespace share the
+                chunks. If 'None', creates a unique name. Defaults to None.
+        '''
+        if directory is None:
+            directory = _default_directory()
+        if namespace is None:
+            namespace = uuid.uuid4().hex
+
+        self._max_bytes = max_bytes
+        self._cache_dir = os.path.join(directory, "pytorch_probing-"+namespace)
+        self._owner_pid = os.getpid()
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        '''
+        Directory of the cache.
+        '''
+        return self._cache_dir
+
+    def get(self, key:str, loader:Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        '''
+        Gets a chunk, decoding it with the loader if it is not cached.
+
+        Args:
+            key (str): Chunk key.
+            loader (Callable[[], Dict[str, Any]]): Function that decodes the chunk.
+
+        Returns:
+            Dict[str, Any]: Chunk data, memory mapped from the shared cache.
+        '''
+        chunk_path = self._chunk_path(key)
+
+        chunk = self._try_load(chunk_path)
+        if chunk is not None:
+            return chunk
+
+        with _CacheLock(chunk_path+".lock"):
+            chunk = self._try_load(chunk_path)
+            if chunk is not None:
+                return chunk
+
+            decoded_chunk = loader()
+
+            temp_path = f"{chunk_path}.{os.getpid()}.tmp"
+            torch.save(decoded_chunk, temp_path)
+            os.replace(temp_path, chunk_path)
+
+        self.evict()
+
+        chunk = self._try_load(chunk_path)
+        if chunk is None:
+            return decoded_chunk
+        return chunk
+
+    def acquire(self, key:str) -> None:
+        '''
+        References a chunk, preventing it eviction.
+
+        Args:
+            key (str): Chunk key.
+        '''
+        with open(self._ref_path(key, os.getpid()), "a"):
+            pass
+
+    def release(self, key:str) -> None:
+        '''
+        Removes the reference of this process to a chunk.
+
+        Args:
+            key (str): Chunk key.
+        '''
+        try:
+            os.remove(self._ref_path(key, os.getpid()))
+        except FileNotFoundError:
+            pass
+
+    def n_reference(self, key:str) -> int:
+        '''
+        Gets the number of processes referencing a chunk.
+
+        Args:
+            key (str): Chunk key.
+
+        Returns:
+            int: Number of references.
+        '''
+        return len(self._live_references(key))
+
+    def size(self) -> int:
+        '''
+        Gets the total size of the cached chunks.
+
+        Returns:
+            int: Size in bytes.
+        '''
+        size = 0
+        for chunk_path in self._chunk_paths():
+            try:
+                size += os.path.getsize(chunk_path)
+            except FileNotFoundError:
+                pass
+
+        return size
+
+    def evict(self) -> None:
+        '''
+        Evicts least recently used chunks without references until the cache fits its maximum size.
+        '''
+        chunk_paths = self._chunk_paths()
+
+        sizes : Dict[str, int] = {}
+        access : Dict[str, float] = {}
+        for chunk_path in chunk_paths:
+            try:
+                sizes[chunk_path] = os.path.getsize(chunk_path)
+                access[chunk_path] = os.path.getmtime(chunk_path)
+            except FileNotFoundError:
+                continue
+
+        total = sum(sizes.values())
+
+        for chunk_path in sorted(sizes, key=lambda path: access[path]):
+            if total <= self._max_bytes:
+                break
+
+            key = os.path.basename(chunk_path)[:-len(".pt")]
+            if len(self._live_references(key)) != 0:
+                continue
+
+            try:
+                os.remove(chunk_path)
+            except (FileNotFoundError, PermissionError):
+                continue
+            total -= sizes[chunk_path]
+
+    def close(self) -> None:
+        '''
+        Removes the cache directory. Only has effect in the process that created the cache.
+        '''
+        if os.getpid() == self._owner_pid:
+            shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def _chunk_path(self, key:str) -> str:
+        return os.path.join(self._cache_dir, key+".pt")
+
+    def _ref_path(self, key:str, pid:int) -> str:
+        return os.path.join(self._cache_dir, f"{key}.ref.{pid}")
+
+    def _chunk_paths(self) -> List[str]:
+        return glob.glob(os.path.join(glob.escape(self._cache_dir), "*.pt"))
+
+    def _live_references(self, key:str) -> List[int]:
+        pattern = os.path.join(glob.escape(self._cache_dir), glob.escape(key)+".ref.*")
+
+        pids = []
+        for ref_path in glob.glob(pattern):
+            pid = int(ref_path.rsplit(".", 1)[-1])
+            if _process_alive(pid):
+                pids.append(pid)
+            else:
+                try:
+                    os.remove(ref_path)
+                except FileNotFoundError:
+                    pass
+
+        return pids
+
+    def _try_load(self, chunk_path:str) -> Optional[Dict[str, Any]]:
+        try:
+            chunk = torch.load(chunk_path, mmap=True, weights_only=True)
+        except FileNotFoundError:
+            return None
+
+        try:
+            os.utime(chunk_path)
+        except FileNotFoundError:
+            pass
+
+        return chunk
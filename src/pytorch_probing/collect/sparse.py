@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Sequence
+
+import torch
+
+SPARSE_FORMATS = ["dense", "sparse"]
+
+def _index_dtype(n_feature:int) -> torch.dtype:
+    '''
+    Gets the smallest dtype to store the feature indices.
+    '''
+    return torch.int32 if n_feature < 2**31 else torch.int64
+
+def encode_topk(output:torch.Tensor, k:int) -> Dict[str, torch.Tensor]:
+    '''
+    Encodes a batch of outputs with the k features of largest magnitude of each sample.
+
+    Args:
+        output (torch.Tensor): Outputs, with the samples in the first dimension.
+        k (int): Number of features kept of each sample.
+
+    Raises:
+        ValueError: If 'k' is greater than the number of features.
+
+    Returns:
+        Dict[str, torch.Tensor]: Encoded outputs, with the "values" and the flat feature "indices" of each sample,
+            with shape (batch, k).
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pytorch_probing.collect.sparse import encode_topk, decode_sparse
+    >>> encoded = encode_topk(torch.tensor([[0.0, -3.0, 1.0, 2.0]]), 2)
+    >>> encoded["values"], encoded["indices"]
+    (tensor([[-3.,  2.]]), tensor([[1, 3]], dtype=torch.int32))
+    >>> decode_sparse(encoded, [4])
+    tensor([[ 0., -3.,  0.,  2.]])
+    '''
+    flat = output.flatten(1)
+    if k > flat.shape[1]:
+        raise ValueError(f"'k' is {k}, but the outputs have only {flat.shape[1]} features.")
+
+    indices = flat.abs().topk(k, dim=1).indices
+    values = flat.gather(1, indices)
+
+    return {"values":values, "indices":indices.to(_index_dtype(flat.shape[1]))}
+
+def encode_csr(output:torch.Tensor) -> Dict[str, torch.Tensor]:
+    '''
+    Encodes a batch of outputs with only the non-zero features of each sample.
+
+    Args:
+        output (torch.Tensor): Outputs, with the samples in the first dimension.
+
+    Returns:
+        Dict[str, torch.Tensor]: Encoded outputs, packed as in 'pack_sequences': the "values" and flat feature
+            "indices" of the non-zero features of all the samples concatenated, and the "lengths" with the number
+            of non-zero features of each sample.
+    '''
+    flat = output.flatten(1)
+    mask = flat != 0
+
+    indices = torch.nonzero(mask)[:, 1]
+
+    return {"values":flat[mask], "indices":indices.to(_index_dtype(flat.shape[1])), "lengths":mask.sum(dim=1)}
+
+def _unravel(indices:torch.Tensor, shape:Sequence[int]) -> torch.Tensor:
+    '''
+    Converts flat feature indices to coordinates.
+
+    Returns:
+        torch.Tensor: Coordinates, with shape (len(shape), n).
+    '''
+    coordinates : List[torch.Tensor] = []
+    for size in reversed(shape):
+        coordinates.append(indices % size)
+        indices = torch.div(indices, size, rounding_mode="floor")
+
+    return torch.stack(coordinates[::-1])
+
+def decode_sparse(encoded:Dict[str, torch.Tensor], shape:Sequence[int], sparse_format:str="dense") -> torch.Tensor:
+    '''
+    Decodes sparse encoded outputs, of one sample or of a batch.
+
+    Args:
+        encoded (Dict[str, torch.Tensor]): Encoded outputs. The "values" and "indices" are of one sample if 1D,
+            of a batch of samples if 2D, or of a packed batch if the "lengths" of each sample are included.
+        shape (Sequence[int]): Shape of the outputs of a sample.
+        sparse_format (str, optional): "dense" returns a dense tensor, with zeros in the not stored features, and
+            "sparse" a sparse COO tensor. Defaults to "dense".
+
+    Raises:
+        ValueError: If the format is unknown.
+
+    Returns:
+        torch.Tensor: Decoded outputs, with shape 'shape' for one sample or (batch, *shape) for a batch.
+    '''
+    if sparse_format not in SPARSE_FORMATS:
+        raise ValueError(f"Unknown sparse format '{sparse_format}'. Avaiable: {', '.join(SPARSE_FORMATS)}.")
+
+    values = encoded["values"]
+    indices = encoded["indices"].long()
+    n_feature = math.prod(shape)
+
+    rows : torch.Tensor | None = None
+    n_row = 0
+    if "lengths" in encoded:
+        lengths = encoded["lengths"]
+        n_row = len(lengths)
+        rows = torch.repeat_interleave(torch.arange(n_row, device=values.device), lengths)
+    elif values.dim() == 2:
+        n_row = values.shape[0]
+        rows = torch.arange(n_row, device=values.device).repeat_interleave(values.shape[1])
+        values = values.flatten()
+        indices = indices.flatten()
+
+    if sparse_format == "sparse":
+        coordinates = _unravel(indices, shape)
+        size = list(shape)
+        if rows is not None:
+            coordinates = torch.cat([rows.unsqueeze(0), coordinates])
+            size = [n_row]+size
+        return torch.sparse_coo_tensor(coordinates, values, size, check_invariants=False).coalesce()
+
+    if rows is None:
+        dense = torch.zeros(n_feature, dtype=values.dtype, device=values.device)
+        dense[indices] = values
+        return dense.view(*shape)
+
+    dense = torch.zeros(n_row, n_feature, dtype=values.dtype, device=values.device)
+    dense[rows, indices] = values
+    return dense.view(n_row, *shape)
+
+def _sparse_spec(encoding:Any) -> Dict[str, Any]:
+    '''
+    Validates the sparse encoding of a path, as in 'collect'.
+
+    Args:
+        encoding (Any): "csr", or the number of features kept by the top-k encoding.
+
+    Raises:
+        ValueError: If the encoding is invalid.
+
+    Returns:
+        Dict[str, Any]: Encoding name and "k".
+    '''
+    if encoding == "csr":
+        return {"encoding":"csr", "k":None}
+    if isinstance(encoding, int) and not isinstance(encoding, bool) and encoding > 0:
+        return {"encoding":"topk", "k":encoding}
+
+    raise ValueError(f"Invalid sparse encoding '{encoding}'. Must be \"csr\" or a positive k of the top-k encoding.")
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional
+
+import torch
+
+STATISTICS_FILE = "statistics.pt"
+
+class RunningStatistics:
+    '''
+    Per-feature mean, standard deviation, minimum and maximum of the intercepted outputs, accumulated by batch.
+
+    The statistics are kept in the device of the outputs and combined with the parallel variance
+    algorithm, so each batch is read only once. Outputs that are not floating point tensors are ignored.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pytorch_probing.collect.statistics import RunningStatistics
+    >>> statistics = RunningStatistics()
+    >>> statistics.update({"0":torch.tensor([[1.0], [3.0]])})
+    >>> statistics.update({"0":torch.tensor([[5.0]])})
+    >>> print(statistics.mean("0"), statistics.std("0"))
+    tensor([3.], dtype=torch.float64) tensor([1.6330], dtype=torch.float64)
+    '''
+
+    def __init__(self) -> None:
+        '''
+        RunningStatistics init.
+        '''
+        self._count : Dict[str, int] = {}
+        self._mean : Dict[str, torch.Tensor] = {}
+        self._m2 : Dict[str, torch.Tensor] = {}
+        self._min : Dict[str, torch.Tensor] = {}
+        self._max : Dict[str, torch.Tensor] = {}
+
+    @property
+    def paths(self) -> List[str]:
+        '''
+        Paths with accumulated statistics.
+        '''
+        return list(self._count.keys())
+
+    def count(self, path:str) -> int:
+        '''
+        Gets the number of accumulated samples of a path.
+        '''
+        return self._count[path]
+
+    def mean(self, path:str) -> torch.Tensor:
+        '''
+        Gets the per-feature mean of a path.
+        '''
+        return self._mean[path]
+
+    def std(self, path:str) -> torch.Tensor:
+        '''
+        Gets the per-feature population standard deviation of a path.
+        '''
+        return torch.sqrt(self._m2[path]/self._count[path])
+
+    def min(self, path:str) -> torch.Tensor:
+        '''
+        Gets the per-feature minimum of a path.
+        '''
+        return self._min[path]
+
+    def max(self, path:str) -> torch.Tensor:
+        '''
+        Gets the per-feature maximum of a path.
+        '''
+        return self._max[path]
+
+    def update(self, outputs:Dict[str, Any]) -> None:
+        '''
+        Accumulates a batch of outputs.
+
+        Args:
+            outputs (Dict[str, Any]): Outputs indexed by path, with the samples in the first dimension.
+        '''
+        for path, value in outputs.items():
+            if not isinstance(value, torch.Tensor) or not value.is_floating_point() or value.dim() == 0:
+                continue
+            if value.shape[0] == 0:
+                continue
+
+            value = value.detach()
+            dtype = torch.float32 if value.device.type == "mps" else torch.float64
+
+            batch_count = value.shape[0]
+            batch_mean = value.mean(dim=0, dtype=dtype)
+            batch_m2 = (value.to(dtype)-batch_mean).square().sum(dim=0)
+
+            self._accumulate(path, batch_count, batch_mean, batch_m2,
+                             value.amin(dim=0).to(dtype), value.amax(dim=0).to(dtype))
+
+    def merge(self, other:RunningStatistics) -> None:
+        '''
+        Accumulates the statistics of other samples.
+
+        Args:
+            other (RunningStatistics): Statistics to add.
+        '''
+        for path in other.paths:
+            self._accumulate(path, other._count[path], other._mean[path], other._m2[path],
+                             other._min[path], other._max[path])
+
+    def _accumulate(self, path:str, count:int, mean:torch.Tensor, m2:torch.Tensor,
+                    minimum:torch.Tensor, maximum:torch.Tensor) -> None:
+        '''
+        Combines the statistics of a path with the statistics of other samples.
+        '''
+        if path not in self._count:
+            self._count[path] = count
+            self._mean[path] = mean.clone()
+            self._m2[path] = m2.clone()
+            self._min[path] = minimum.clone()
+            self._max[path] = maximum.clone()
+            return
+
+        current_mean = self._mean[path]
+        mean = mean.to(current_mean)
+
+        current_count = self._count[path]
+        total = current_count+count
+        delta = mean-current_mean
+
+        self._mean[path] = current_mean + delta*(count/total)
+        self._m2[path] = self._m2[path] + m2.to(current_mean) + delta.square()*(current_count*count/total)
+        self._min[path] = torch.minimum(self._min[path], minimum.to(current_mean))
+        self._max[path] = torch.maximum(self._max[path], maximum.to(current_mean))
+        self._count[path] = total
+
+    def state_dict(self, paths:Optional[List[str]]=None) -> Dict[str, Dict[str, Any]]:
+        '''
+        Gets the statistics in the CPU, as saved in the dataset.
+
+        Args:
+            paths (Optional[List[str]], optional): Paths to get. If 'None', gets all. Defaults to None.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Statistics of each path, with "count", "mean", "std", "min" and "max".
+        '''
+        if paths is None:
+            paths = self.paths
+
+        return {path:{"count":self._count[path],
+                      "mean":self._mean[path].cpu(),
+                      "std":self.std(path).cpu(),
+                      "min":self._min[path].cpu(),
+                      "max":self._max[path].cpu()} for path in paths if path in self._count}
+
+    def load_state_dict(self, state_dict:Dict[str, Dict[str, Any]]) -> None:
+        '''
+        Replaces the statistics by saved ones.
+
+        Args:
+            state_dict (Dict[str, Dict[str, Any]]): Statistics, as returned by 'state_dict'.
+        '''
+        self._count.clear()
+        for statistic in [self._mean, self._m2, self._min, self._max]:
+            statistic.clear()
+
+        for path, values in state_dict.items():
+            count = int(values["count"])
+            self._accumulate(path, count, values["mean"], values["std"].square()*count, values["min"], values["max"])
+
+    def save(self, dataset_path:str, paths:Optional[List[str]]=None) -> None:
+        '''
+        Saves the statistics in a dataset directory.
+
+        Args:
+            dataset_path (str): Dataset directory.
+            paths (Optional[List[str]], optional): Paths to save. If 'None', saves all. Defaults to None.
+        '''
+        torch.save(self.state_dict(paths), os.path.join(dataset_path, STATISTICS_FILE))
+
+    @staticmethod
+    def load(dataset_path:str) -> RunningStatistics:
+        '''
+        Loads the statistics saved in a dataset directory.
+
+        Args:
+            dataset_path (str): Dataset directory.
+
+        Returns:
+            RunningStatistics: Loaded statistics.
+        '''
+        statistics = RunningStatistics()
+        statistics.load_state_dict(torch.load(os.path.join(dataset_path, STATISTICS_FILE), weights_only=True))
+
+        return statistics
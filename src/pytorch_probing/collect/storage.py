@@ -0,0 +1,513 @@
+from __future__ import annotations
+
+import io
+import os
+import abc
+import typing
+import collections
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+
+import torch
+import numpy as np
+
+_SAMPLE_KEYS = ["intercepted_outputs", "target", "prediction", "input", "original_index"]
+
+@typing.no_type_check
+def _select(x:Any, index:int|torch.Tensor) -> Any:
+    '''
+    Selects samples from a complex data.
+
+    Args:
+        x (Any): Tensor, or list, tuple or dict of tensors. Other values, like None fields of structured outputs,
+            are kept.
+        index (int | torch.Tensor): Index or indices of the samples.
+
+    Returns:
+        Any: Selected data, with the same structure.
+    '''
+    if isinstance(x, torch.Tensor) or isinstance(x, np.ndarray):
+        return x[index]
+    if isinstance(x, list) or isinstance(x, tuple):
+        return [_select(element, index) for element in x]
+    if isinstance(x, dict):
+        return {key:_select(x[key], index) for key in x}
+    return x
+
+@typing.no_type_check
+def _concatenate(parts:List[Any]) -> Any:
+    '''
+    Concatenates complex datas in the first dimension.
+
+    Args:
+        parts (List[Any]): Datas with the same structure. Values that are not tensors, lists, tuples or dicts
+            are taken from the first data.
+
+    Returns:
+        Any: Concatenated data.
+    '''
+    first = parts[0]
+    if isinstance(first, torch.Tensor):
+        return torch.cat(parts)
+    if isinstance(first, list) or isinstance(first, tuple):
+        return [_concatenate([part[i] for part in parts]) for i in range(len(first))]
+    if isinstance(first, dict):
+        return {key:_concatenate([part[key] for part in parts]) for key in first}
+    return first
+
+def _filter_keys(chunk:Dict[str, Any], keys:Optional[Sequence[str]]) -> Dict[str, Any]:
+    '''
+    Gets the sample keys of a chunk.
+
+    Args:
+        chunk (Dict[str, Any]): Chunk data.
+        keys (Optional[Sequence[str]]): Keys to get. If 'None', gets all the sample keys.
+
+    Returns:
+        Dict[str, Any]: Chunk data with only the keys.
+    '''
+    if keys is None:
+        keys = _SAMPLE_KEYS
+    return {key:chunk[key] for key in keys if key in chunk}
+
+class Storage(abc.ABC):
+    '''
+    Storage backend of a collected dataset.
+
+    Writes and reads chunks: dicts with the "intercepted_outputs" and optionally the "input", "target",
+    "prediction" and "original_index" of a batch, each a tensor or a list, tuple or dict of tensors with
+    the samples in the first dimension. The backend metadata is saved in the dataset info, and must be updated after
+    each written chunk so the dataset can be read during the collection.
+    '''
+
+    name = ""
+    random_access = False
+
+    def __init__(self, dataset_path:str, metadata:Optional[Dict[str, Any]]=None) -> None:
+        '''
+        Storage init.
+
+        Args:
+            dataset_path (str): Dataset directory.
+            metadata (Optional[Dict[str, Any]], optional): Backend metadata saved in the dataset info. If 'None',
+                creates a new storage. Defaults to None.
+        '''
+        self._dataset_path = dataset_path
+
+    @abc.abstractmethod
+    def write_chunk(self, chunk_index:int, chunk:Dict[str, Any]) -> None:
+        '''
+        Writes a chunk. Chunks must be written in order.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+            chunk (Dict[str, Any]): Chunk data.
+        '''
+
+    def finalize(self) -> None:
+        '''
+        Ends the writing, flushing the written data.
+        '''
+
+    def metadata(self) -> Dict[str, Any]:
+        '''
+        Gets the backend metadata, to be saved in the dataset info.
+
+        Returns:
+            Dict[str, Any]: JSON serializable metadata.
+        '''
+        return {}
+
+    @abc.abstractmethod
+    def read_chunk(self, chunk_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        '''
+        Reads a chunk.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+            keys (Optional[Sequence[str]], optional): Sample keys to read, as "intercepted_outputs". If 'None', reads
+                all. Backends can return more keys. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Chunk data, with the "index" of the chunk.
+        '''
+
+    def read_sample(self, chunk_index:int, sample_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        '''
+        Reads a sample.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+            sample_index (int): Index of the sample in the chunk.
+            keys (Optional[Sequence[str]], optional): Sample keys to read. If 'None', reads all. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Sample data, indexed by key.
+        '''
+        chunk = _filter_keys(self.read_chunk(chunk_index, keys), keys)
+        return _select(chunk, sample_index)
+
+    def read_batch(self, chunk_index:int, sample_indices:Sequence[int], keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        '''
+        Reads samples of a chunk.
+
+        Args:
+            chunk_index (int): Index of the chunk.
+            sample_indices (Sequence[int]): Indices of the samples in the chunk.
+            keys (Optional[Sequence[str]], optional): Sample keys to read. If 'None', reads all. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Samples data indexed by key, with the samples in the first dimension.
+        '''
+        chunk = _filter_keys(self.read_chunk(chunk_index, keys), keys)
+        return _select(chunk, torch.tensor(sample_indices, dtype=torch.long))
+
+class TorchStorage(Storage):
+    '''
+    Stores each chunk in a "{chunk_index}.pt" file, saved with torch.save.
+
+    Chunks are loaded memory mapped, so reading a sample only pages in its bytes, and the last used
+    chunks are kept open. Chunks saved with the legacy serialization, that can't be memory mapped,
+    are fully loaded.
+    '''
+
+    name = "torch"
+    random_access = True
+    max_open_chunks = 8
+
+    def __init__(self, dataset_path:str, metadata:Optional[Dict[str, Any]]=None) -> None:
+        super().__init__(dataset_path, metadata)
+
+        self._open_chunks : collections.OrderedDict[int, Dict[str, Any]] = collections.OrderedDict()
+
+    def write_chunk(self, chunk_index:int, chunk:Dict[str, Any]) -> None:
+        chunk_path = self._chunk_path(chunk_index)
+
+        # Publishes the chunk only when completely written
+        temp_path = chunk_path+".tmp"
+        torch.save(chunk, temp_path)
+        os.replace(temp_path, chunk_path)
+
+    def read_chunk(self, chunk_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        return self._load(chunk_index)
+    
+    def read_sample(self, chunk_index:int, sample_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        return _select(_filter_keys(self._open(chunk_index), keys), sample_index)
+
+    def read_batch(self, chunk_index:int, sample_indices:Sequence[int], keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        return _select(_filter_keys(self._open(chunk_index), keys), torch.tensor(sample_indices, dtype=torch.long))
+
+    def _open(self, chunk_index:int) -> Dict[str, Any]:
+        '''
+        Gets a loaded chunk, keeping the last used chunks open.
+        '''
+        chunk = self._open_chunks.get(chunk_index)
+
+        if chunk is None:
+            chunk = self._load(chunk_index)
+
+            self._open_chunks[chunk_index] = chunk
+            if len(self._open_chunks) > self.max_open_chunks:
+                self._open_chunks.popitem(last=False)
+        else:
+            self._open_chunks.move_to_end(chunk_index)
+
+        return chunk
+
+    def _load(self, chunk_index:int) -> Dict[str, Any]:
+        '''
+        Loads a chunk, memory mapped if possible.
+        '''
+        chunk_path = self._chunk_path(chunk_index)
+
+        try:
+            return torch.load(chunk_path, mmap=True, weights_only=True)
+        except RuntimeError:
+            # Legacy serialization does not support mmap
+            return torch.load(chunk_path, weights_only=True)
+
+    def _chunk_path(self, chunk_index:int) -> str:
+        return os.path.join(self._dataset_path, str(chunk_index)+".pt")
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_open_chunks"] = collections.OrderedDict()
+
+        return state
+
+class AppendStorage(Storage):
+    '''
+    Stores all the chunks in a single "chunks.bin" file, appending each chunk saved with torch.save.
+
+    Avoids creating one file per chunk. The offset of each chunk is saved in the metadata.
+    '''
+
+    name = "append"
+    file_name = "chunks.bin"
+
+    def __init__(self, dataset_path:str, metadata:Optional[Dict[str, Any]]=None) -> None:
+        super().__init__(dataset_path, metadata)
+
+        self._offsets : List[List[int]] = []
+        if metadata is not None:
+            self._offsets = [list(offset) for offset in metadata["offsets"]]
+
+    def write_chunk(self, chunk_index:int, chunk:Dict[str, Any]) -> None:
+        if chunk_index != len(self._offsets):
+            raise ValueError("Chunks must be written in order.")
+
+        buffer = io.BytesIO()
+        torch.save(chunk, buffer)
+        data = buffer.getvalue()
+
+        file_path = os.path.join(self._dataset_path, self.file_name)
+        with open(file_path, "ab") as file:
+            offset = file.tell()
+            file.write(data)
+            file.flush()
+
+        self._offsets.append([offset, len(data)])
+
+    def metadata(self) -> Dict[str, Any]:
+        return {"offsets":self._offsets}
+
+    def read_chunk(self, chunk_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        offset, length = self._offsets[chunk_index]
+
+        file_path = os.path.join(self._dataset_path, self.file_name)
+        with open(file_path, "rb") as file:
+            file.seek(offset)
+            data = file.read(length)
+
+        return torch.load(io.BytesIO(data), weights_only=True)
+
+def _flatten(data:Any, leaves:List[torch.Tensor]) -> Dict[str, Any]:
+    '''
+    Flattens a complex data into its tensors.
+
+    Args:
+        data (Any): Tensor, or list, tuple or dict of tensors.
+        leaves (List[torch.Tensor]): List to append the tensors.
+
+    Raises:
+        ValueError: If the data contains values that are not tensors or None.
+
+    Returns:
+        Dict[str, Any]: Structure of the data, with the index of each tensor in leaves.
+    '''
+    if isinstance(data, torch.Tensor):
+        leaves.append(data)
+        return {"type":"tensor", "leaf":len(leaves)-1}
+    if isinstance(data, (list, tuple)):
+        return {"type":type(data).__name__, "items":[_flatten(element, leaves) for element in data]}
+    if isinstance(data, dict):
+        return {"type":"dict", "items":{key:_flatten(data[key], leaves) for key in data}}
+    if data is None:
+        return {"type":"none"}
+
+    raise ValueError(f"Memmap storage only supports tensors, got {type(data).__name__}.")
+
+def _unflatten(structure:Dict[str, Any], get_leaf:Callable[[int], torch.Tensor]) -> Any:
+    '''
+    Rebuilds a complex data from its structure.
+
+    Args:
+        structure (Dict[str, Any]): Structure created by '_flatten'.
+        get_leaf (Callable[[int], torch.Tensor]): Gets a tensor by its leaf index.
+
+    Returns:
+        Any: Data.
+    '''
+    if structure["type"] == "tensor":
+        return get_leaf(structure["leaf"])
+    if structure["type"] == "none":
+        return None
+    if structure["type"] == "dict":
+        return {key:_unflatten(item, get_leaf) for key, item in structure["items"].items()}
+
+    items = [_unflatten(item, get_leaf) for item in structure["items"]]
+    if structure["type"] == "tuple":
+        return tuple(items)
+    return items
+
+def _dtype_from_name(name:str) -> torch.dtype:
+    '''
+    Gets a torch dtype from its name, as "float32".
+    '''
+    dtype = getattr(torch, name)
+    assert isinstance(dtype, torch.dtype)
+    return dtype
+
+class MemmapStorage(Storage):
+    '''
+    Stores each tensor of the chunks in a raw binary file, with the samples of all the chunks contiguous.
+
+    Files are read with NumPy memory maps, so reading a sample only reads its bytes. Supports any tensor dtype,
+    but the chunks must have the same structure and sample shapes.
+    '''
+
+    name = "memmap"
+    random_access = True
+
+    def __init__(self, dataset_path:str, metadata:Optional[Dict[str, Any]]=None) -> None:
+        super().__init__(dataset_path, metadata)
+
+        self._structure : Optional[Dict[str, Any]] = None
+        self._leaves : List[Dict[str, Any]] = []
+        self._chunk_offsets : List[int] = [0]
+
+        if metadata is not None:
+            self._structure = metadata["structure"]
+            self._leaves = metadata["leaves"]
+            self._chunk_offsets = metadata["chunk_offsets"]
+
+        self._memmaps : Dict[int, np.memmap] = {}
+
+    def write_chunk(self, chunk_index:int, chunk:Dict[str, Any]) -> None:
+        if chunk_index != len(self._chunk_offsets)-1:
+            raise ValueError("Chunks must be written in order.")
+
+        leaves : List[torch.Tensor] = []
+        structure = _flatten(_filter_keys(chunk, None), leaves)
+
+        if self._structure is None:
+            self._structure = structure
+            self._leaves = [{"dtype":str(leaf.dtype).split(".")[-1],
+                             "shape":list(leaf.shape[1:]),
+                             "sample_bytes":int(np.prod(leaf.shape[1:]))*leaf.element_size()}
+                            for leaf in leaves]
+        elif structure != self._structure:
+            raise ValueError("Memmap storage chunks must have the same structure.")
+
+        n_sample = len(leaves[0]) if len(leaves) != 0 else 0
+
+        for leaf_index, leaf in enumerate(leaves):
+            leaf_info = self._leaves[leaf_index]
+            if list(leaf.shape[1:]) != leaf_info["shape"] or str(leaf.dtype).split(".")[-1] != leaf_info["dtype"]:
+                raise ValueError("Memmap storage chunks must have the same sample shapes and dtypes.")
+            if len(leaf) != n_sample:
+                raise ValueError("All the tensors of a chunk must have the same number of samples.")
+
+            data = leaf.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes()
+            with open(self._leaf_path(leaf_index), "ab") as file:
+                file.write(data)
+                file.flush()
+
+        self._chunk_offsets.append(self._chunk_offsets[-1]+n_sample)
+
+    def metadata(self) -> Dict[str, Any]:
+        return {"structure":self._structure, "leaves":self._leaves, "chunk_offsets":self._chunk_offsets}
+
+    def read_chunk(self, chunk_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        start = self._chunk_offsets[chunk_index]
+        end = self._chunk_offsets[chunk_index+1]
+
+        chunk = self._read(start, end, keys)
+        chunk["index"] = chunk_index
+
+        return chunk
+
+    def read_sample(self, chunk_index:int, sample_index:int, keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        start = self._chunk_offsets[chunk_index]+sample_index
+
+        return _select(self._read(start, start+1, keys), 0)
+
+    def read_batch(self, chunk_index:int, sample_indices:Sequence[int], keys:Optional[Sequence[str]]=None) -> Dict[str, Any]:
+        start = self._chunk_offsets[chunk_index]
+        indices = np.asarray(sample_indices, dtype=np.int64)+start
+
+        return self._read_indices(indices, keys)
+
+    def _read(self, start:int, end:int, keys:Optional[Sequence[str]]) -> Dict[str, Any]:
+        '''
+        Reads a contiguous range of samples.
+        '''
+        def get_leaf(leaf_index:int) -> torch.Tensor:
+            sample_bytes = self._leaves[leaf_index]["sample_bytes"]
+            data = np.array(self._memmap(leaf_index)[start*sample_bytes:end*sample_bytes])
+            return self._to_tensor(leaf_index, data, end-start)
+
+        return self._read_structure(get_leaf, keys)
+
+    def _read_indices(self, indices:np.ndarray, keys:Optional[Sequence[str]]) -> Dict[str, Any]:
+        '''
+        Reads samples by their global indices.
+        '''
+        def get_leaf(leaf_index:int) -> torch.Tensor:
+            sample_bytes = self._leaves[leaf_index]["sample_bytes"]
+            if sample_bytes == 0:
+                return self._to_tensor(leaf_index, np.empty(0, np.uint8), len(indices))
+            
+            samples = self._memmap(leaf_index).reshape(-1, sample_bytes)
+            return self._to_tensor(leaf_index, samples[indices].reshape(-1), len(indices))
+
+        return self._read_structure(get_leaf, keys)
+
+    def _read_structure(self, get_leaf:Callable[[int], torch.Tensor], keys:Optional[Sequence[str]]) -> Dict[str, Any]:
+        '''
+        Rebuilds the chunk keys from the leaves.
+        '''
+        assert self._structure is not None
+
+        if keys is None:
+            keys = _SAMPLE_KEYS
+
+        items = self._structure["items"]
+        return {key:_unflatten(items[key], get_leaf) for key in keys if key in items}
+
+    def _to_tensor(self, leaf_index:int, data:np.ndarray, n_sample:int) -> torch.Tensor:
+        '''
+        Converts the bytes of a leaf to a tensor.
+        '''
+        leaf_info = self._leaves[leaf_index]
+        dtype = _dtype_from_name(leaf_info["dtype"])
+
+        return torch.from_numpy(data).view(dtype).reshape([n_sample]+leaf_info["shape"])
+
+    def _memmap(self, leaf_index:int) -> np.memmap:
+        '''
+        Gets the memory map of a leaf, with the samples of all the written chunks.
+        '''
+        n_byte = self._chunk_offsets[-1]*self._leaves[leaf_index]["sample_bytes"]
+
+        memmap = self._memmaps.get(leaf_index)
+        if memmap is None or len(memmap) != n_byte:
+            if n_byte == 0:
+                return np.empty(0, np.uint8) # type: ignore
+            memmap = np.memmap(self._leaf_path(leaf_index), dtype=np.uint8, mode="r", shape=(n_byte,))
+            self._memmaps[leaf_index] = memmap
+
+        return memmap
+
+    def _leaf_path(self, leaf_index:int) -> str:
+        return os.path.join(self._dataset_path, f"leaf_{leaf_index}.bin")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_memmaps"] = {}
+
+        return state
+
+STORAGES : Dict[str, Type[Storage]] = {TorchStorage.name:TorchStorage,
+                                        AppendStorage.name:AppendStorage,
+                                        MemmapStorage.name:MemmapStorage}
+
+def create_storage(name:str, dataset_path:str, metadata:Optional[Dict[str, Any]]=None) -> Storage:
+    '''
+    Creates a storage backend by name.
+
+    Args:
+        name (str): Backend name: "torch", "append" or "memmap".
+        dataset_path (str): Dataset directory.
+        metadata (Optional[Dict[str, Any]], optional): Backend metadata saved in the dataset info. If 'None',
+            creates a new storage. Defaults to None.
+
+    Raises:
+        ValueError: If there is no backend with the name.
+
+    Returns:
+        Storage: Storage backend.
+    '''
+    if name not in STORAGES:
+        raise ValueError(f"Unknown storage '{name}'. Avaiable: {', '.join(STORAGES)}.")
+
+    return STORAGES[name](dataset_path, metadata)
@@ -1,2 +1,3 @@
 from .interceptor import Interceptor
-from .interceptor_layer import InterceptorLayer
\ No newline at end of file
+from .interceptor_layer import InterceptorLayer
+from .sampler import Sampler, EveryKSampler, BernoulliSampler, PredicateSampler
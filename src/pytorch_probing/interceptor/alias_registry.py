@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import weakref
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import torch
+
+from .sampler import SampleDecision
+
+class AliasRegistry:
+    '''
+    Registry of the tensors captured in a forward, to capture tensors produced by more than one path only once.
+
+    Tensors are identified by data pointer, shape, strides, dtype and sampling decision. A captured tensor is
+    only reused if the original tensor is still alive, so its memory was not reused by other tensor, and was
+    not modified in-place, checked by its version counter. Inference tensors have no version counter and are
+    never aliased.
+    '''
+
+    def __init__(self) -> None:
+        '''
+        AliasRegistry init.
+        '''
+        # key -> (original tensor reference, original version, captured tensor, path)
+        self._entries : Dict[Hashable, Tuple[weakref.ref, int, Any, str]] = {}
+
+    def clear(self) -> None:
+        '''
+        Removes all the registered tensors, as at the start of a forward.
+        '''
+        self._entries = {}
+
+    def _key(self, output:torch.Tensor, decision:SampleDecision) -> Optional[Tuple[Hashable, int]]:
+        '''
+        Computes the key and version of a tensor.
+
+        Returns:
+            Optional[Tuple[Hashable, int]]: Key and version, or None if the tensor can't be aliased.
+        '''
+        if output.is_inference():
+            return None
+
+        decision_key = id(decision) if isinstance(decision, torch.Tensor) else decision
+        key = (output.data_ptr(), tuple(output.shape), output.stride(), output.dtype, output.device, decision_key)
+
+        return key, output._version
+
+    def get(self, output:torch.Tensor, decision:SampleDecision) -> Optional[Tuple[Any, str]]:
+        '''
+        Gets the capture of a tensor already captured in the forward.
+
+        Args:
+            output (torch.Tensor): Tensor to capture.
+            decision (SampleDecision): Sampling decision of the capture.
+
+        Returns:
+            Optional[Tuple[Any, str]]: Captured tensor and the path that captured it, or None if not captured.
+        '''
+        key_version = self._key(output, decision)
+        if key_version is None:
+            return None
+        key, version = key_version
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        reference, original_version, captured, path = entry
+        if reference() is None or version != original_version:
+            return None
+
+        return captured, path
+
+    def put(self, output:torch.Tensor, decision:SampleDecision, captured:Any, path:str) -> None:
+        '''
+        Registers the capture of a tensor.
+
+        Args:
+            output (torch.Tensor): Captured tensor.
+            decision (SampleDecision): Sampling decision of the capture.
+            captured (Any): Capture of the tensor.
+            path (str): Path that captured the tensor.
+        '''
+        key_version = self._key(output, decision)
+        if key_version is None:
+            return
+        key, version = key_version
+
+        self._entries[key] = (weakref.ref(output), version, captured, path)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_entries"] = {}
+
+        return state
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 import torch
 
 from pytorch_probing.module_wrapper import ModuleWrapper
 from .interceptor_layer import InterceptorLayer
+from .path_pattern import resolve_paths, invalidate_path_cache
+from .sampler import Sampler, SampleDecision
+from .suffix import build_suffix
+from .output_selector import split_selector
+from .alias_registry import AliasRegistry
 
 class Interceptor(ModuleWrapper):
     '''
     ModuleWrapper that intercepts intermediary outputs.
 
-    Stores the intercepted outputs, avaiable in the "outputs" property.
+    Stores the intercepted outputs, avaiable in the "outputs" property. With 'detect_aliases', paths producing the
+    same tensor, as a container and its last child, share a single copy, reported in the "aliases" property.
 
     Examples
     --------
@@ -26,69 +32,197 @@ class Interceptor(ModuleWrapper):
     >>> print(interceptor.outputs)
     {'0.0': tensor([0.2689, 0.5000, 0.7311]), '0': tensor([0.2689, 0.5000, 0.7311])}
 
+    Paths can also be glob or regex patterns:
+
+    >>> module = Sequential(Sequential(Sigmoid(), ReLU()), Identity())
+    >>> interceptor = Interceptor(module, ["*.*"])
+    >>> interceptor.intercept_paths
+    ['0.0', '0.1']
+
+    A selector after ":" intercepts only a field of structured outputs, like a dict key, a position
+    or an attribute:
+
+    >>> from torch.nn import GRU
+    >>> module = Sequential(GRU(2, 3, batch_first=True))
+    >>> interceptor = Interceptor(module, ["0:1"]) # Final hidden state only
+    >>> _ = interceptor(torch.zeros(1, 4, 2))
+    >>> interceptor.outputs["0:1"].shape
+    torch.Size([1, 1, 3])
+
     '''
-    def __init__(self, module:torch.nn.Module, intercept_paths:List[str], detach:bool=True) -> None:
+    def __init__(self, module:torch.nn.Module, intercept_paths:List[str], detach:bool=True,
+                 cache_paths:bool=True, sampler:Optional[Sampler]=None, detect_aliases:bool=False) -> None:
         '''
-        _summary_
+        Interceptor init.
 
         Args:
             module (torch.nn.Module): Module to wrap.
-            intercept_paths (List[str]): Paths of the modules to intercept the outputs. Can be submodules as "my_module.submodule.subsubmodule".
+            intercept_paths (List[str]): Paths of the modules to intercept the outputs. Can be submodules as "my_module.submodule.subsubmodule",
+                glob patterns as "encoder.layers.*.mlp" ("*" matches one path part, "**" any number of parts) or regexes 
+                starting with "re:", as "re:encoder\\.layers\\.[0-9]+\\.mlp". A selector after ":" intercepts only a field
+                of the output, as "encoder.layers.3:hidden_states" or "lstm:0.1", with fields separated by ".".
             detach (bool, optional):  If should detach the intercepted outputs. Defaults to True.
+            cache_paths (bool, optional): If should cache the paths resolved from patterns by module instance.
+                Defaults to True.
+            sampler (Optional[Sampler], optional): Policy deciding which calls and samples are intercepted, once per forward 
+                for all the paths. Not sampled calls only execute the module. If 'None', intercepts all the calls. Defaults to None.
+            detect_aliases (bool, optional): If should copy only once the tensors produced by more than one path in a forward.
+                The outputs of the aliased paths are then the same object, and must not be modified in-place. Defaults to False.
 
         Raises:
-            ValueError: If there is no module with specified path.
+            ValueError: If there is no module with specified path or matching a pattern.
         '''
-        super().__init__(module, ["_intercept_paths", "_interceptor_layers"])
+        super().__init__(module, ["_intercept_paths", "_interceptor_layers", "_sampler", "_sample_decision",
+                                  "_suffixes", "_alias_registry"])
+
+        self._sampler = sampler
+        self._sample_decision : SampleDecision = True
+        self._suffixes : Dict[str, Callable[..., Any]] = {}
+        self._alias_registry = AliasRegistry() if detect_aliases else None
 
+        intercept_paths = resolve_paths(module, intercept_paths, cache_paths)
         self._intercept_paths = intercept_paths
 
         self._interceptor_layers : Dict[str, InterceptorLayer] = {}
         for path in intercept_paths:
+            module_path, selector = split_selector(path)
             try:
-                submodule = self.get_submodule(path)
-                parent = self.get_submodule_parent(path)
+                submodule = self.get_submodule(module_path)
+                parent = self.get_submodule_parent(module_path)
             except KeyError:
                 self.reduce()
-                raise ValueError(f"There is no module with path '{path}'.") from None
+                raise ValueError(f"There is no module with path '{module_path}'.") from None
             
-            name = path.split(".")[-1]
+            name = module_path.split(".")[-1]
 
-            interceptor_layer = InterceptorLayer(submodule, detach)
+            interceptor_layer = InterceptorLayer(submodule, detach, selector=selector, 
+                                                 alias_registry=self._alias_registry, path=path)
             self._interceptor_layers[path] = interceptor_layer
 
             parent._modules[name] = interceptor_layer
+            invalidate_path_cache()
 
     def forward(self, *args, **kwargs):
         '''
         Executes the module and intercepts its intermediary outputs.
         '''
         self._check_reduced()
+        self._update_sample_decision(args, kwargs)
+        if self._alias_registry is not None:
+            self._alias_registry.clear()
+
         return self._module(*args, **kwargs)
+    
+    def resume(self, path:str, activation:Any, *args):
+        '''
+        Executes only the part of the module after a path, using a stored output of the path.
+
+        The module is not executed until the path, and its output is replaced by the activation. If all
+        the path ancestors are Sequential, executes the following modules of each ancestor. Otherwise,
+        traces the module with torch.fx and executes only the nodes needed by the output. The stored outputs
+        are cleared first, so after resuming only the paths executed after the resumed path have outputs,
+        and the outputs of the resumed path, the paths before it and its ancestors are None.
+
+        Args:
+            path (str): Path of the module whose output is replaced. Does not need to be intercepted.
+            activation (Any): Output of the path.
+            *args: Original inputs of the module, only needed if used after the path, like in skip connections.
+
+        Raises:
+            ValueError: If the module is not traceable, the path is not called once, has a selector or the suffix needs 
+                an input that was not passed.
+
+        Returns:
+            Any: Module output.
+
+        Examples
+        --------
+        >>> import torch
+        >>> from torch.nn import Sequential, Linear, ReLU
+        >>> from pytorch_probing import Interceptor
+        >>> module = Sequential(Linear(2, 3), ReLU(), Linear(3, 1))
+        >>> interceptor = Interceptor(module, ["1"])
+        >>> inputs = torch.randn(4, 2)
+        >>> activation = module[0](inputs)
+        >>> torch.allclose(interceptor.resume("0", activation), interceptor(inputs))
+        True
+        '''
+        self._check_reduced()
+
+        if split_selector(path)[1] is not None:
+            raise ValueError("Resumed path must be a module path, without selector.")
+
+        if path not in self._suffixes:
+            self._suffixes[path] = build_suffix(self._module, path)
+        
+        self._update_sample_decision((activation,), {})
+        self.interceptor_clear()
+
+        return self._suffixes[path](activation, *args)
+
+    def _update_sample_decision(self, args, kwargs) -> None:
+        '''
+        Samples the call, propagating the decision to the InterceptorLayers.
+
+        Args:
+            args (Tuple[Any, ...]): Call positional arguments.
+            kwargs (Dict[str, Any]): Call keyword arguments.
+        '''
+        if self._sampler is not None:
+            self._sample_decision = self._sampler.sample(args, kwargs)
+            for layer in self._interceptor_layers.values():
+                layer.sample_decision = self._sample_decision
+    
+    @property
+    def sampler(self) -> Optional[Sampler]:
+        '''
+        Sampling policy, with the sampling counters.
+        '''
+        return self._sampler
+
+    @property
+    def sample_decision(self) -> SampleDecision:
+        '''
+        Sampling decision of the last forward. 
+        
+        None if the outputs were not intercepted, True if all the samples were intercepted
+        or a tensor with the indices of the intercepted samples.
+        '''
+        return self._sample_decision
         
     def reduce(self) -> torch.nn.Module:
         super().reduce()
+        self._suffixes = {}
 
-        for path in self._intercept_paths:
+        for path in reversed(self._intercept_paths):
             if path not in self._interceptor_layers:
                 continue
 
-            parent = self.get_submodule_parent(path)
-            name = path.split(".")[-1]
+            module_path, _ = split_selector(path)
+            parent = self.get_submodule_parent(module_path)
+            name = module_path.split(".")[-1]
             interceptor_layer = self._interceptor_layers[path]
 
             parent._modules[name] = interceptor_layer.reduce()
+            invalidate_path_cache()
 
         return self._module
     
     @property
-    def outputs(self) -> Dict[str, torch.Tensor | List[torch.Tensor]|None] | None:
+    def intercept_paths(self) -> List[str]:
+        '''
+        Intercepted paths, with the patterns resolved.
+        '''
+        return list(self._intercept_paths)
+
+    @property
+    def outputs(self) -> Dict[str, Any] | None:
         '''
         Gets the intercepted outputs.
 
         Returns:
-            Dict[str, torch.Tensor | List[torch.Tensor]]: Intercepted outputs, indexed by the module path. Is None if the output was 
-            cleared or no forwards were executed.
+            Dict[str, Any]: Intercepted outputs, indexed by the intercept path, as tensors or nested structures of tensors. 
+            Is None if the output was cleared or no forwards were executed.
         '''
         if self._reduced:
             return None
@@ -99,10 +233,27 @@ class Interceptor(ModuleWrapper):
 
         return outputs
     
+    @property
+    def aliases(self) -> Dict[str, str]:
+        '''
+        Paths whose output in the last forward is the same tensor captured by an earlier path, indexed by the
+        alias path with the path that captured the tensor as value. The outputs of both paths are the same object.
+        Always empty without 'detect_aliases'.
+        '''
+        aliases = {}
+        for path in self._intercept_paths:
+            alias_of = self._interceptor_layers[path].alias_of
+            if alias_of is not None:
+                aliases[path] = alias_of
+
+        return aliases
+
     def interceptor_clear(self):
         '''
         Clears the stored outputs.
         '''
+        if self._alias_registry is not None:
+            self._alias_registry.clear()
         for path in self._intercept_paths:
             self._interceptor_layers[path].interceptor_clear()
 
@@ -113,9 +264,15 @@ class Interceptor(ModuleWrapper):
 
         path_parts = path.split(".")
 
-        for part in path_parts:
+        for index, part in enumerate(path_parts):
             submodule = module._modules[part]
             assert isinstance(submodule, torch.nn.Module)
+
+            # Intermediary modules can already be intercepted
+            if index != len(path_parts)-1:
+                while isinstance(submodule, InterceptorLayer):
+                    submodule = submodule._module
+
             module = submodule
 
         return module
@@ -125,7 +282,11 @@ class Interceptor(ModuleWrapper):
         path_parts = path_parts[:-1]
         path = ".".join(path_parts)
 
-        return self.get_submodule(path)
+        parent = self.get_submodule(path)
+        while isinstance(parent, InterceptorLayer):
+            parent = parent._module
+
+        return parent
     
     def __enter__(self):
         return self
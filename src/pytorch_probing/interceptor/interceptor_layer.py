@@ -1,38 +1,113 @@
 from __future__ import annotations
 
-from typing import List, Tuple, Dict, Any
+from typing import Callable, Dict, Any, Optional, Tuple
 
 import torch
 
 from pytorch_probing.module_wrapper import ModuleWrapper
+from .sampler import Sampler, SampleDecision
+from .output_selector import select_output, map_tensors
+from .alias_registry import AliasRegistry
 
 class InterceptorLayer(ModuleWrapper):
     '''
     ModuleWrapper that intercepts a Module output.
 
-    Stores the intercepted output, avaiable in the "output" property.
+    Stores the intercepted output, avaiable in the "output" property. If a consumer is set, passes the 
+    output to it as soon as it is produced and stores only the consumer output, avaiable in "consumer_output".
+
+    Outputs can be tensors or nested tuples, lists, dicts, dataclasses and HuggingFace ModelOutputs of tensors, 
+    stored with tuples as lists and the other structures as dicts. A selector captures only a part of the output,
+    so the other tensors are never detached or copied.
     '''
 
-    def __init__(self, module:torch.nn.Module, detach=True) -> None:
+    def __init__(self, module:torch.nn.Module, detach=True, sampler:Optional[Sampler]=None,
+                 consumer:Optional[Callable[[Any], Any]]=None, selector:Optional[str]=None,
+                 alias_registry:Optional[AliasRegistry]=None, path:str="") -> None:
         '''
         InterceptorLayer init.
 
         Args:
             module (torch.nn.Module): Module to intercept the output.
             detach (bool, optional): If should detach the intercepted output. Defaults to True.
+            sampler (Optional[Sampler], optional): Policy deciding which calls and samples are intercepted. Not sampled
+                calls only execute the module. If 'None', intercepts all the calls, unless 'sample_decision' is set. 
+                Defaults to None.
+            consumer (Optional[Callable[[Any], Any]], optional): Function receiving the intercepted output inside the
+                forward, without copying it. The output is not stored, so the activation can be freed after the module 
+                execution. Should not be a torch.nn.Module, to not register it as a submodule. Defaults to None.
+            selector (Optional[str], optional): Fields of the output to intercept, separated by ".", as "hidden_states" 
+                or "0". Fields are dict keys, positions or attributes. If 'None', intercepts the entire output. 
+                Defaults to None.
+            alias_registry (Optional[AliasRegistry], optional): Registry shared by the layers of an Interceptor, to reuse
+                the capture of tensors already captured by other layer in the same forward. If 'None', always copies. 
+                Defaults to None.
+            path (str, optional): Path of the layer, registered with its captures. Defaults to "".
         '''
-        super().__init__(module, ["_intercepted_output", "_detach"])
-
-        self._intercepted_output : None | torch.Tensor | List[torch.Tensor] = None
+        super().__init__(module, ["_intercepted_output", "_detach", "_sampler", "_sample_decision", "sample_decision",
+                                  "_consumer", "_consumer_output", "consumer", "_selector", "_alias_registry",
+                                  "_path", "_alias_of", "alias_of"])
+
+        self._intercepted_output : Any = None
+        self._selector = selector
+        self._alias_registry = alias_registry
+        self._path = path
+        self._alias_of : Optional[str] = None
         self._detach = detach
+        self._sampler = sampler
+        self._sample_decision : SampleDecision = True
+        self._consumer = consumer
+        self._consumer_output : Any = None
+
+    @property
+    def sample_decision(self) -> SampleDecision:
+        '''
+        Sampling decision of the next call without sampler, or of the last call with sampler.
+
+        None if the call is not intercepted, True if all the samples are intercepted or
+        a tensor with the indices of the intercepted samples.
+        '''
+        return self._sample_decision
+    
+    @sample_decision.setter
+    def sample_decision(self, value:SampleDecision) -> None:
+        self._sample_decision = value
+
+    @property
+    def consumer(self) -> Optional[Callable[[Any], Any]]:
+        '''
+        Function receiving the intercepted output inside the forward.
+        '''
+        return self._consumer
+    
+    @consumer.setter
+    def consumer(self, value:Optional[Callable[[Any], Any]]) -> None:
+        self._consumer = value
+        self._consumer_output = None
+
+    @property
+    def consumer_output(self) -> Any:
+        '''
+        Output of the consumer in the last forward. Is None if the output was cleared, no forwards were
+        executed or the call was not sampled.
+        '''
+        return self._consumer_output
+
+    @property
+    def alias_of(self) -> Optional[str]:
+        '''
+        Path of the layer that captured the same tensor in the last forward, if the output is a tensor already 
+        captured by other layer. The output is then the same object as the other layer output.
+        '''
+        return self._alias_of
 
     @property
-    def output(self) -> None | torch.Tensor | List[torch.Tensor]:
+    def output(self) -> Any:
         '''
         Gets the output.
 
         Returns:
-            None | torch.Tensor | List[torch.Tensor]: Intercepted output. Is None if the output was 
+            Any: Intercepted output, a tensor or nested structure of tensors. Is None if the output was 
             cleared or no forwards were executed.
         '''
         return self._intercepted_output
@@ -43,28 +118,95 @@ class InterceptorLayer(ModuleWrapper):
         '''
         self._check_reduced()
 
+        if self._sampler is not None:
+            self._sample_decision = self._sampler.sample(args, kwargs)
+
+        decision = self._sample_decision
+        self._alias_of = None
+        if decision is None:
+            self._intercepted_output = None
+            self._consumer_output = None
+            return self._module(*args, **kwargs)
+
         outputs = self._module(*args, **kwargs)
-        
-        if isinstance(outputs, tuple):
-            self._intercepted_output = []
+        intercepted = select_output(outputs, self._selector)
 
-            for output in outputs:
-                if self._detach:
-                    output = output.detach()
+        if self._consumer is not None:
+            # Consumed before the next modules, no copy needed
+            selected = map_tensors(lambda output: self._select(output, decision), intercepted)
 
-                self._intercepted_output.append(output.clone())
-        else:  
-            if self._detach:
-                outputs = outputs.detach()
-            self._intercepted_output = outputs.clone()
+            self._consumer_output = self._consumer(selected)
+            self._intercepted_output = None
+
+            return outputs
+        
+        if isinstance(intercepted, torch.Tensor):
+            self._intercepted_output, self._alias_of = self._capture(intercepted, decision)
+        else:
+            self._intercepted_output = map_tensors(lambda output: self._capture(output, decision)[0], intercepted)
 
         return outputs
     
+    def _select(self, output:torch.Tensor, decision:SampleDecision) -> torch.Tensor:
+        '''
+        Selects the sampled samples of an output, detaching it if needed.
+
+        Args:
+            output (torch.Tensor): Output to select.
+            decision (SampleDecision): Sampling decision.
+
+        Raises:
+            ValueError: If the output first dimension can not be the batch dimension of a per-sample decision.
+
+        Returns:
+            torch.Tensor: Selected output. Is a view of the output if all the samples are selected.
+        '''
+        if self._detach:
+            output = output.detach()
+
+        if isinstance(decision, torch.Tensor):
+            if output.dim() == 0 or int(decision.max()) >= output.shape[0]:
+                raise ValueError(f"Per-sample sampling selects the first dimension as batch, but output of '{self._path}' "
+                                 f"has shape {tuple(output.shape)}.")
+            return output[decision.to(output.device)]
+
+        return output
+
+    def _capture(self, output:torch.Tensor, decision:SampleDecision) -> Tuple[torch.Tensor, Optional[str]]:
+        '''
+        Copies an output, selecting the sampled samples. If the output was already captured by other layer 
+        in the same forward, reuses the copy.
+
+        Args:
+            output (torch.Tensor): Output to copy.
+            decision (SampleDecision): Sampling decision.
+
+        Returns:
+            Tuple[torch.Tensor, Optional[str]]: Copied output, and the path of the layer that copied it if reused.
+        '''
+        if self._alias_registry is not None:
+            alias = self._alias_registry.get(output, decision)
+            if alias is not None:
+                return alias
+
+        selected = self._select(output, decision)
+
+        if not isinstance(decision, torch.Tensor):
+            # Indexing already copies
+            selected = selected.clone()
+
+        if self._alias_registry is not None:
+            self._alias_registry.put(output, decision, selected, self._path)
+
+        return selected, None
+    
     def interceptor_clear(self):
         '''
-        Clears the intercepted output.
+        Clears the intercepted output and the consumer output.
         '''
         self._intercepted_output = None
+        self._consumer_output = None
+        self._alias_of = None
 
     def reduce(self):
         super().reduce()
@@ -73,5 +215,6 @@ class InterceptorLayer(ModuleWrapper):
     def __getstate__(self) -> Dict[str, Any]:
         state = super().__getstate__()
         state["_intercepted_output"] = None
+        state["_consumer_output"] = None
 
         return state
\ No newline at end of file
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import re
+import dataclasses
+from collections.abc import Mapping
+from typing import Any, Callable, Optional, Tuple
+
+import torch
+
+_SELECTOR_SEPARATOR = ":"
+_REGEX_PREFIX = "re:"
+_FIELD_REGEX = re.compile(r"[\w.\-]+")
+
+def split_selector(path:str) -> Tuple[str, Optional[str]]:
+    '''
+    Splits an intercept path into the module path and the output selector.
+
+    The selector follows the last ":" of the path, as in "encoder.layers.3:hidden_states", and is a sequence of
+    fields separated by ".", as in "1.0". In regex paths, a ":" is only a separator if followed by a valid field,
+    so "(?:...)" groups are kept in the module path.
+
+    Args:
+        path (str): Intercept path, with or without selector.
+
+    Returns:
+        Tuple[str, Optional[str]]: Module path and selector. The selector is None if the path has no selector.
+
+    Examples
+    --------
+    >>> from pytorch_probing.interceptor.output_selector import split_selector
+    >>> split_selector("encoder.layers.3:hidden_states")
+    ('encoder.layers.3', 'hidden_states')
+    >>> split_selector("re:layers\\\\.(?:0|1)")
+    ('re:layers\\\\.(?:0|1)', None)
+    '''
+    start = len(_REGEX_PREFIX) if path.startswith(_REGEX_PREFIX) else 0
+
+    index = path.rfind(_SELECTOR_SEPARATOR, start)
+    if index == -1:
+        return path, None
+
+    selector = path[index+1:]
+    if _FIELD_REGEX.fullmatch(selector) is None:
+        return path, None
+
+    return path[:index], selector
+
+def join_selector(module_path:str, selector:Optional[str]) -> str:
+    '''
+    Joins a module path and an output selector into an intercept path.
+
+    Args:
+        module_path (str): Module path.
+        selector (Optional[str]): Output selector. If 'None', returns the module path.
+
+    Returns:
+        str: Intercept path.
+    '''
+    if selector is None:
+        return module_path
+    return module_path+_SELECTOR_SEPARATOR+selector
+
+def _get_field(output:Any, field:str) -> Any:
+    '''
+    Gets a field of a structured output.
+
+    Mappings (like dicts and HuggingFace ModelOutputs) are indexed by key, or by position of the values if the
+    field is an integer and not a key. Lists and tuples are indexed by position, and other objects (like
+    dataclasses and namedtuples) by attribute.
+
+    Raises:
+        ValueError: If the output has no field.
+    '''
+    is_index = field.lstrip("-").isdigit()
+
+    if isinstance(output, Mapping):
+        if field in output:
+            return output[field]
+        if is_index:
+            values = list(output.values())
+            if -len(values) <= int(field) < len(values):
+                return values[int(field)]
+    elif isinstance(output, (list, tuple)) and is_index:
+        if -len(output) <= int(field) < len(output):
+            return output[int(field)]
+    elif not is_index and hasattr(output, field):
+        return getattr(output, field)
+
+    raise ValueError(f"Output of type '{type(output).__name__}' has no field '{field}'.")
+
+def select_output(output:Any, selector:Optional[str]) -> Any:
+    '''
+    Selects a part of a module output.
+
+    Args:
+        output (Any): Module output.
+        selector (Optional[str]): Fields to select, separated by ".". If 'None', selects the entire output.
+
+    Raises:
+        ValueError: If the output has no selected field.
+
+    Returns:
+        Any: Selected output.
+    '''
+    if selector is None:
+        return output
+
+    for field in selector.split("."):
+        output = _get_field(output, field)
+
+    return output
+
+def map_tensors(function:Callable[[torch.Tensor], Any], output:Any) -> Any:
+    '''
+    Applies a function to the tensors of a nested output.
+
+    Tuples and lists are converted to lists, mappings (including ModelOutputs) and dataclasses to dicts. Other
+    values are kept.
+
+    Args:
+        function (Callable[[torch.Tensor], Any]): Function to apply.
+        output (Any): Tensor, or nested structure with tensors.
+
+    Returns:
+        Any: Output with the function applied to the tensors.
+    '''
+    if isinstance(output, torch.Tensor):
+        return function(output)
+    if isinstance(output, (list, tuple)):
+        return [map_tensors(function, element) for element in output]
+    if isinstance(output, Mapping):
+        return {key:map_tensors(function, value) for key, value in output.items()}
+    if dataclasses.is_dataclass(output) and not isinstance(output, type):
+        return {field.name:map_tensors(function, getattr(output, field.name)) for field in dataclasses.fields(output)}
+
+    return output
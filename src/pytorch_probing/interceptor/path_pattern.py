@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import re
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import torch
+
+from .output_selector import split_selector, join_selector
+
+_REGEX_PREFIX = "re:"
+_GLOB_CHARACTERS = "*?["
+
+_PATH_CACHE_SIZE = 32
+
+_path_cache : weakref.WeakKeyDictionary[torch.nn.Module, OrderedDict[Tuple[str, ...], Tuple[int, List[str]]]] = weakref.WeakKeyDictionary()
+_tree_generation = 0
+
+def invalidate_path_cache(*args) -> None:
+    '''
+    Invalidates all the cached resolved paths.
+
+    Called whenever a submodule is registered in any module. Code that changes the module
+    tree without registering modules, like writing "_modules" directly or deleting a
+    submodule, must call it.
+    '''
+    global _tree_generation
+    _tree_generation += 1
+
+torch.nn.modules.module.register_module_module_registration_hook(invalidate_path_cache)
+
+def is_pattern(path:str) -> bool:
+    '''
+    Checks if a path is a pattern.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is a regex (starts with "re:") or a glob (contains "*", "?" or "[").
+    '''
+    if path.startswith(_REGEX_PREFIX):
+        return True
+
+    return any(character in path for character in _GLOB_CHARACTERS)
+
+def _glob_to_regex(pattern:str) -> str:
+    '''
+    Translates a glob path pattern to a regex.
+
+    "*" matches one path part, "**" matches any number of parts, "?" matches one character
+    and "[...]" matches one character in the set. Each path part is matched with its trailing
+    dot, so the regex must be matched against the path followed by ".".
+
+    Args:
+        pattern (str): Glob pattern.
+
+    Returns:
+        str: Equivalent regex.
+    '''
+    result = ""
+    for part in pattern.split("."):
+        if part == "**":
+            result += r"(?:[^.]+\.)*"
+            continue
+
+        i = 0
+        while i < len(part):
+            character = part[i]
+            end = part.find("]", i+1) if character == "[" else -1
+
+            if character == "*":
+                result += r"[^.]*"
+            elif character == "?":
+                result += r"[^.]"
+            elif end != -1:
+                content = part[i+1:end]
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                result += "[" + content + "]"
+                i = end
+            else:
+                result += re.escape(character)
+            i += 1
+
+        result += r"\."
+
+    return result
+
+def compile_patterns(patterns:List[str]) -> re.Pattern:
+    '''
+    Compiles path patterns into a single regex.
+
+    The regex must be matched against the path followed by ".", as in 'match_path'.
+
+    Args:
+        patterns (List[str]): Regex (starting with "re:") or glob patterns.
+
+    Returns:
+        re.Pattern: Regex matching any of the patterns.
+    '''
+    regexes = []
+    for pattern in patterns:
+        if pattern.startswith(_REGEX_PREFIX):
+            regexes.append(f"(?:{pattern[len(_REGEX_PREFIX):]})\\.")
+        else:
+            regexes.append(_glob_to_regex(pattern))
+
+    return re.compile("|".join(f"(?:{regex})" for regex in regexes))
+
+def match_path(regex:re.Pattern, path:str) -> bool:
+    '''
+    Checks if a path matches a compiled pattern.
+
+    Args:
+        regex (re.Pattern): Pattern compiled with 'compile_patterns'.
+        path (str): Path to check.
+
+    Returns:
+        bool: True if matches.
+    '''
+    return regex.fullmatch(path+".") is not None
+
+def resolve_paths(module:torch.nn.Module, paths:List[str], cache:bool=True) -> List[str]:
+    '''
+    Resolves path patterns into the module paths.
+
+    Explicit paths are kept. All the patterns are matched in a single traversal of the module tree,
+    and the matched paths are inserted in the pattern position, in module tree order. Output selectors, 
+    as in "encoder.layers.*:hidden_states", are kept in the matched paths.
+
+    Args:
+        module (torch.nn.Module): Module to resolve the paths.
+        paths (List[str]): Explicit paths and patterns. Patterns can be globs, like "encoder.layers.*.mlp",
+            or regexes starting with "re:", like "re:encoder\\.layers\\.[0-9]+".
+        cache (bool, optional): If should cache the resolved paths by module instance, avoiding matching
+            the patterns again while the module tree is not changed. Defaults to True.
+
+    Raises:
+        ValueError: If a pattern does not match any path.
+
+    Returns:
+        List[str]: Resolved paths, without duplicates.
+    '''
+    split_paths = [split_selector(path) for path in paths]
+
+    patterns = list(dict.fromkeys(module_path for module_path, _ in split_paths if is_pattern(module_path)))
+    if len(patterns) == 0:
+        return list(paths)
+
+    key = tuple(paths)
+    module_cache = _path_cache.get(module) if cache else None
+    if module_cache is not None and key in module_cache:
+        generation, cached = module_cache[key]
+        if generation == _tree_generation:
+            module_cache.move_to_end(key)
+            return list(cached)
+
+    compiled = [compile_patterns([pattern]) for pattern in patterns]
+    combined = compile_patterns(patterns)
+
+    matches : Dict[str, List[str]] = {pattern:[] for pattern in patterns}
+    for name, _ in module.named_modules(remove_duplicate=False):
+        if name == "" or not match_path(combined, name):
+            continue
+
+        for pattern, regex in zip(patterns, compiled):
+            if match_path(regex, name):
+                matches[pattern].append(name)
+
+    resolved : List[str] = []
+    resolved_set = set()
+    for module_path, selector in split_paths:
+        if not is_pattern(module_path):
+            candidates = [module_path]
+        else:
+            candidates = matches[module_path]
+            if len(candidates) == 0:
+                raise ValueError(f"There is no module matching pattern '{module_path}'.")
+
+        for candidate in candidates:
+            candidate = join_selector(candidate, selector)
+            if candidate not in resolved_set:
+                resolved.append(candidate)
+                resolved_set.add(candidate)
+
+    if cache:
+        module_cache = _path_cache.setdefault(module, OrderedDict())
+        module_cache[key] = (_tree_generation, resolved)
+        module_cache.move_to_end(key)
+        if len(module_cache) > _PATH_CACHE_SIZE:
+            module_cache.popitem(last=False)
+
+    return list(resolved)
+
+def clear_path_cache() -> None:
+    '''
+    Clears the cache of resolved paths.
+    '''
+    _path_cache.clear()
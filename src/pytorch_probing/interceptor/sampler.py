@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import abc
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import torch
+
+SampleDecision = Union[None, bool, torch.Tensor]
+
+def _batch_size(args:Tuple[Any, ...], kwargs:Dict[str, Any]) -> int:
+    '''
+    Gets the batch size of a call, from the first tensor argument.
+
+    Args:
+        args (Tuple[Any, ...]): Call positional arguments.
+        kwargs (Dict[str, Any]): Call keyword arguments.
+
+    Returns:
+        int: Batch size. Is 1 if there is no tensor argument or it is a scalar.
+    '''
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, torch.Tensor):
+            if value.dim() == 0:
+                return 1
+            return value.shape[0]
+    return 1
+
+class Sampler(abc.ABC):
+    '''
+    Sampling policy, deciding which calls and samples are intercepted.
+
+    Counts the calls and samples seen and captured, to report the achieved sampling rate.
+
+    The batch size is the first dimension of the first tensor argument. Per-sample decisions select
+    along the first dimension of the intercepted outputs, so it must also be their batch dimension.
+    '''
+
+    def __init__(self) -> None:
+        '''
+        Sampler init.
+        '''
+        self.reset()
+
+    def reset(self) -> None:
+        '''
+        Resets the counters.
+        '''
+        self._n_call = 0
+        self._n_sampled_call = 0
+        self._n_sample = 0
+        self._n_sampled = 0
+
+    @abc.abstractmethod
+    def _decide(self, batch_size:int, args:Tuple[Any, ...], kwargs:Dict[str, Any]) -> SampleDecision:
+        '''
+        Decides if the call is sampled.
+
+        Args:
+            batch_size (int): Call batch size.
+            args (Tuple[Any, ...]): Call positional arguments.
+            kwargs (Dict[str, Any]): Call keyword arguments.
+
+        Returns:
+            SampleDecision: False or None to skip the call, True to capture the full batch or a boolean mask with the
+                samples to capture.
+        '''
+
+    def sample(self, args:Tuple[Any, ...], kwargs:Dict[str, Any]) -> SampleDecision:
+        '''
+        Decides which samples of a call are captured, updating the counters.
+
+        Args:
+            args (Tuple[Any, ...]): Call positional arguments.
+            kwargs (Dict[str, Any]): Call keyword arguments.
+
+        Returns:
+            SampleDecision: None if the call is not sampled, True if all the samples are captured or a tensor with
+                the indices of the captured samples.
+        '''
+        batch_size = _batch_size(args, kwargs)
+        decision = self._decide(batch_size, args, kwargs)
+
+        self._n_call += 1
+        self._n_sample += batch_size
+
+        if isinstance(decision, torch.Tensor):
+            indices = decision.reshape(-1).nonzero().reshape(-1)
+            n_captured = len(indices)
+
+            if n_captured == batch_size:
+                decision = True
+            elif n_captured == 0:
+                decision = None
+            else:
+                decision = indices
+        elif decision:
+            decision = True
+            n_captured = batch_size
+        else:
+            decision = None
+            n_captured = 0
+
+        if decision is not None:
+            self._n_sampled_call += 1
+            self._n_sampled += n_captured
+
+        return decision
+
+    @property
+    def n_call(self) -> int:
+        '''
+        Number of calls seen.
+        '''
+        return self._n_call
+
+    @property
+    def n_sampled_call(self) -> int:
+        '''
+        Number of calls with at least one captured sample.
+        '''
+        return self._n_sampled_call
+
+    @property
+    def call_rate(self) -> float:
+        '''
+        Achieved rate of sampled calls.
+        '''
+        return self._n_sampled_call / max(self._n_call, 1)
+
+    @property
+    def sample_rate(self) -> float:
+        '''
+        Achieved rate of captured samples.
+        '''
+        return self._n_sampled / max(self._n_sample, 1)
+
+class EveryKSampler(Sampler):
+    '''
+    Samples every k-th call.
+    '''
+
+    def __init__(self, k:int, offset:int=0) -> None:
+        '''
+        EveryKSampler init.
+
+        Args:
+            k (int): Sampling period.
+            offset (int, optional): Index of the first sampled call, in [0, k). Defaults to 0.
+
+        Raises:
+            ValueError: If k is not positive or offset is not in [0, k).
+        '''
+        if k <= 0:
+            raise ValueError("'k' must be positive.")
+        if offset < 0 or offset >= k:
+            raise ValueError("'offset' must be in [0, k).")
+
+        self._k = k
+        self._offset = offset
+
+        super().__init__()
+
+    def _decide(self, batch_size:int, args:Tuple[Any, ...], kwargs:Dict[str, Any]) -> SampleDecision:
+        return (self._n_call - self._offset) % self._k == 0
+
+class BernoulliSampler(Sampler):
+    '''
+    Samples each call, or each sample, with a fixed probability.
+    '''
+
+    def __init__(self, rate:float, per_sample:bool=False, seed:Optional[int]=None) -> None:
+        '''
+        BernoulliSampler init.
+
+        Args:
+            rate (float): Sampling probability.
+            per_sample (bool, optional): If should sample each sample of the batch independently. If False, samples
+                the full batch. Defaults to False.
+            seed (Optional[int], optional): Seed of the sampling. If 'None', uses a random seed. Defaults to None.
+
+        Raises:
+            ValueError: If rate is not in [0, 1].
+        '''
+        if rate < 0 or rate > 1:
+            raise ValueError("'rate' must be in [0, 1].")
+
+        self._rate = rate
+        self._per_sample = per_sample
+
+        self._generator = torch.Generator()
+        if seed is None:
+            self._generator.seed()
+        else:
+            self._generator.manual_seed(seed)
+
+        super().__init__()
+
+    def _decide(self, batch_size:int, args:Tuple[Any, ...], kwargs:Dict[str, Any]) -> SampleDecision:
+        if self._per_sample:
+            return torch.rand(batch_size, generator=self._generator) < self._rate
+
+        return bool(torch.rand(1, generator=self._generator).item() < self._rate)
+
+class PredicateSampler(Sampler):
+    '''
+    Samples with a user predicate over the call arguments.
+    '''
+
+    def __init__(self, predicate:Callable[..., Union[bool, torch.Tensor]]) -> None:
+        '''
+        PredicateSampler init.
+
+        Args:
+            predicate (Callable[..., Union[bool, torch.Tensor]]): Receives the call arguments and returns if the call
+                is sampled, or a boolean mask with the samples to capture.
+        '''
+        self._predicate = predicate
+
+        super().__init__()
+
+    def _decide(self, batch_size:int, args:Tuple[Any, ...], kwargs:Dict[str, Any]) -> SampleDecision:
+        return self._predicate(*args, **kwargs)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from typing import Any, Callable, List, Optional
+
+import torch
+import torch.fx
+
+from .interceptor_layer import InterceptorLayer
+
+_ACTIVATION_NAME = "resumed_activation"
+
+def _unwrap(module:torch.nn.Module) -> torch.nn.Module:
+    '''
+    Gets the module wrapped by InterceptorLayers.
+    '''
+    while isinstance(module, InterceptorLayer):
+        module = module._module
+    return module
+
+def _sequential_suffix(module:torch.nn.Module, path:str) -> Optional[List[torch.nn.Module]]:
+    '''
+    Gets the modules executed after a path, if all its ancestors are Sequential.
+
+    Args:
+        module (torch.nn.Module): Root module.
+        path (str): Path of the module whose output is resumed.
+
+    Returns:
+        Optional[List[torch.nn.Module]]: Modules to execute in order, or None if some ancestor is not Sequential.
+    '''
+    ancestors = []
+    current = module
+    for part in path.split("."):
+        current = _unwrap(current)
+        if not isinstance(current, torch.nn.Sequential):
+            return None
+        ancestors.append((current, part))
+        current = current._modules[part]
+
+    suffix : List[torch.nn.Module] = []
+    for container, part in reversed(ancestors):
+        names = list(container._modules.keys())
+        index = names.index(part)
+
+        for name in names[index+1:]:
+            submodule = container._modules[name]
+            assert submodule is not None
+            suffix.append(submodule)
+
+    return suffix
+
+def _qualified_name(module:torch.nn.Module, path:str) -> str:
+    '''
+    Gets the name of a module in the tree with the InterceptorLayers.
+
+    Args:
+        module (torch.nn.Module): Root module.
+        path (str): Module path, without the InterceptorLayers.
+
+    Returns:
+        str: Module qualified name.
+    '''
+    parts = []
+    for part in path.split("."):
+        while isinstance(module, InterceptorLayer):
+            parts.append("_module")
+            module = module._module
+        parts.append(part)
+        submodule = module._modules[part]
+        assert submodule is not None
+        module = submodule
+
+    return ".".join(parts)
+
+class _SuffixTracer(torch.fx.Tracer):
+    '''
+    Tracer keeping the resumed module and the InterceptorLayers as leaves.
+    '''
+
+    def __init__(self, leaf_name:str) -> None:
+        super().__init__()
+        self._leaf_name = leaf_name
+
+    def is_leaf_module(self, m:torch.nn.Module, module_qualified_name:str) -> bool:
+        if module_qualified_name == self._leaf_name:
+            return True
+        if isinstance(m, InterceptorLayer):
+            # Traces through the layers containing the resumed module
+            return not self._leaf_name.startswith(module_qualified_name+".")
+        return super().is_leaf_module(m, module_qualified_name)
+
+class _FXSuffix:
+    '''
+    Suffix of a traced graph, receiving the original inputs still needed by the suffix and the resumed activation.
+    '''
+
+    def __init__(self, graph_module:torch.fx.GraphModule, input_names:List[str], required:List[bool]) -> None:
+        self._graph_module = graph_module
+        self._input_names = input_names
+        self._required = required
+
+    def __call__(self, activation:Any, *args) -> Any:
+        if len(args) > len(self._input_names):
+            raise ValueError(f"Expected at most {len(self._input_names)} inputs, got {len(args)}.")
+
+        inputs = list(args) + [None]*(len(self._input_names)-len(args))
+        for name, value, required in zip(self._input_names, inputs, self._required):
+            if required and value is None:
+                raise ValueError(f"The suffix depends on the input '{name}', that must be passed.")
+
+        return self._graph_module(*inputs, activation)
+
+def build_suffix(module:torch.nn.Module, path:str) -> Callable[..., Any]:
+    '''
+    Builds a function executing only the part of a module after a path.
+
+    If all the ancestors of the path are Sequential, executes the following modules of each ancestor.
+    Otherwise, traces the module with torch.fx, replaces the path by an input and removes the nodes
+    not needed to compute the output.
+
+    Args:
+        module (torch.nn.Module): Module to execute, possibly with InterceptorLayers.
+        path (str): Path of the module whose output is replaced.
+
+    Raises:
+        ValueError: If the module is not traceable or the path is not called exactly once.
+
+    Returns:
+        Callable[..., Any]: Function receiving the activation of the path and the original inputs still
+            needed by the suffix, and returning the module output.
+    '''
+    suffix = _sequential_suffix(module, path)
+    if suffix is not None:
+        def run_sequential(activation:Any, *args) -> Any:
+            for submodule in suffix:
+                activation = submodule(activation)
+            return activation
+
+        return run_sequential
+
+    leaf_name = _qualified_name(module, path)
+    tracer = _SuffixTracer(leaf_name)
+    try:
+        graph = tracer.trace(module)
+    except Exception as exception:
+        raise ValueError(f"Module is not traceable with torch.fx: {exception}") from exception
+    finally:
+        # Layers traced through store proxies
+        for submodule in module.modules():
+            if isinstance(submodule, InterceptorLayer):
+                submodule.interceptor_clear()
+
+    nodes = [node for node in graph.nodes if node.op == "call_module" and node.target == leaf_name]
+    if len(nodes) != 1:
+        raise ValueError(f"Module with path '{path}' must be called exactly once, but is called {len(nodes)} times.")
+
+    placeholders = [node for node in graph.nodes if node.op == "placeholder"]
+    with graph.inserting_after(placeholders[-1] if len(placeholders) != 0 else None):
+        activation_node = graph.placeholder(_ACTIVATION_NAME)
+
+    nodes[0].replace_all_uses_with(activation_node)
+    graph.erase_node(nodes[0])
+
+    graph_module = torch.fx.GraphModule(module, graph)
+    graph_module.graph.eliminate_dead_code()
+    graph_module.delete_all_unused_submodules()
+    graph_module.recompile()
+
+    input_names = [str(node.target) for node in placeholders]
+    required = [len(node.users) != 0 for node in placeholders]
+
+    return _FXSuffix(graph_module, input_names, required)
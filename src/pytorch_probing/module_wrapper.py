@@ -1,9 +1,14 @@
 import abc
 import warnings
-from typing import List
+from typing import Any, Dict, List, Iterable, FrozenSet, Tuple
 
 import torch
 
+_BASE_MEMBER_NAMES : FrozenSet[str] = frozenset(["_member_names", "_module", "_reduced", "_delegates"])
+
+# Incremented when any wrapper changes its wrapped module or members, invalidating the cached delegates
+_delegation_generation = 0
+
 class ModuleWrapper(torch.nn.Module, abc.ABC):
     '''
     Wraps a PyTorch Module, enabling to add additional features and passing through original module members.
@@ -21,11 +26,21 @@ class ModuleWrapper(torch.nn.Module, abc.ABC):
         '''
         super().__init__()
 
+        self._member_names : FrozenSet[str] = _BASE_MEMBER_NAMES | frozenset(member_names)
+        self._delegates : Dict[Tuple[str, bool], Tuple[int, Any]] = {}
         self._module : torch.nn.Module = module
-        self._member_names = member_names
 
         self._reduced = False
 
+    def _add_member_names(self, member_names:Iterable[str]) -> None:
+        '''
+        Registers new members names of the Wrapper subclass.
+
+        Args:
+            member_names (Iterable[str]): names to register.
+        '''
+        self._member_names = self._member_names | frozenset(member_names)
+
     def forward(self, *args, **kwargs):
         self._check_reduced()
         return self._module(*args, **kwargs)
@@ -45,16 +60,73 @@ class ModuleWrapper(torch.nn.Module, abc.ABC):
         return self._module
 
     def __getattr__(self, name):
-        try:
-            return super().__getattr__(name)
-        except AttributeError:
-            return getattr(self._module, name)
+        # Only called when the normal lookup fails. Checks the wrapper registered 
+        # members directly and delegates, without raising and catching AttributeError.
+        members = self.__dict__
+
+        modules = members.get("_modules")
+        if modules is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        
+        if name in modules:
+            return modules[name]
+        parameters = members["_parameters"]
+        if name in parameters:
+            return parameters[name]
+        buffers = members["_buffers"]
+        if name in buffers:
+            return buffers[name]
+
+        if modules.get("_module") is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        return getattr(self._delegate(name, False), name)
 
     def __setattr__(self, name: str, value):
-        if name in ["_member_names", "_module"] or name in self._member_names:
+        if name in self.__dict__.get("_member_names", _BASE_MEMBER_NAMES):
+            if name in ["_module", "_member_names"]:
+                global _delegation_generation
+                _delegation_generation += 1
+
             super().__setattr__(name, value)
         else:
-            return setattr(self._module, name, value)
+            return setattr(self._delegate(name, True), name, value)
+
+    def _delegate(self, name:str, set_attribute:bool) -> Any:
+        '''
+        Gets the module that handles a member not owned by the wrapper.
+
+        Skips the nested wrappers that would only delegate the member, caching the
+        result until any wrapper changes its wrapped module or members.
+
+        Args:
+            name (str): Member name.
+            set_attribute (bool): If the member is being set. Wrappers set only their member names,
+                but also get their class attributes and registered modules, parameters and buffers.
+
+        Returns:
+            Any: Wrapped module, or nested wrapper, that handles the member.
+        '''
+        delegates = self.__dict__.setdefault("_delegates", {})
+        key = (name, set_attribute)
+        cached = delegates.get(key)
+        if cached is not None and cached[0] == _delegation_generation:
+            return cached[1]
+
+        module = self._module
+        while isinstance(module, ModuleWrapper):
+            members = module.__dict__
+            if name in members["_member_names"]:
+                break
+            if not set_attribute and (hasattr(type(module), name) or name in members 
+                                      or name in members["_modules"] or name in members["_parameters"]
+                                      or name in members["_buffers"]):
+                break
+            module = module._module
+
+        delegates[key] = (_delegation_generation, module)
+
+        return module
         
     def _check_reduced(self):
         '''
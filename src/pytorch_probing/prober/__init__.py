@@ -1 +1,6 @@
-from .prober import Prober
\ No newline at end of file
+from .prober import Prober
+from .linear_probe_fitter import LinearProbeFitter
+from .probe_bank import ProbeBank
+from .probe_executor import ProbeExecutor
+from .activation_cache import ActivationCache
+from .cached_prober import CachedProber
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import os
+import uuid
+import shutil
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import torch
+
+from pytorch_probing.interceptor.output_selector import map_tensors
+
+def _tensors(value:Any) -> List[torch.Tensor]:
+    '''
+    Gets the tensors of a tensor, or nested list, tuple or dict of tensors.
+    '''
+    tensors : List[torch.Tensor] = []
+    map_tensors(tensors.append, value)
+    return tensors
+
+def _nbytes(value:Any) -> int:
+    '''
+    Computes the size of a tensor, or nested list, tuple or dict of tensors.
+
+    Args:
+        value (Any): Tensor, or nested list, tuple or dict of tensors.
+
+    Returns:
+        int: Size in bytes.
+    '''
+    return sum(tensor.nelement()*tensor.element_size() for tensor in _tensors(value))
+
+def _select(value:Any, index:int|torch.Tensor) -> Any:
+    '''
+    Selects samples of a tensor, or nested list, tuple or dict of tensors.
+    '''
+    return map_tensors(lambda tensor: tensor[index], value)
+
+def _stack(values:List[Any]) -> Any:
+    '''
+    Stacks samples of tensors, or nested lists, tuples or dicts of tensors.
+    '''
+    first = values[0]
+    if isinstance(first, torch.Tensor):
+        return torch.stack(values)
+    if isinstance(first, (list, tuple)):
+        return [_stack([value[i] for value in values]) for i in range(len(first))]
+    if isinstance(first, dict):
+        return {key:_stack([value[key] for value in values]) for key in first}
+    return first
+
+def sample_ids_to_list(sample_ids:Sequence[Hashable]|torch.Tensor) -> List[Hashable]:
+    '''
+    Converts sample ids to a list of hashable values.
+
+    Args:
+        sample_ids (Sequence[Hashable] | torch.Tensor): Sample ids.
+
+    Returns:
+        List[Hashable]: Sample ids.
+    '''
+    if isinstance(sample_ids, torch.Tensor):
+        return sample_ids.reshape(-1).tolist()
+    return list(sample_ids)
+
+class ActivationCache:
+    '''
+    Store of backbone activations, indexed by sample id.
+
+    Activations are stored by batch, in memory or in memory mapped files. When the store reaches
+    its maximum size, new activations are not stored, keeping the first cached samples. With
+    the cyclic access of multi-epoch training, this keeps a fixed part of the dataset cached,
+    instead of evicting samples before they are reused.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pytorch_probing.prober import ActivationCache
+    >>> cache = ActivationCache(max_bytes=1024)
+    >>> cache.put([0, 1], {"0":torch.tensor([[1.0], [2.0]])})
+    True
+    >>> print(cache.get([1, 0]))
+    {'0': tensor([[2.],
+            [1.]])}
+    >>> print(cache.get([1, 2]))
+    None
+    '''
+
+    def __init__(self, max_bytes:Optional[int]=None, directory:Optional[str]=None) -> None:
+        '''
+        ActivationCache init.
+
+        Args:
+            max_bytes (Optional[int], optional): Maximum size of the stored activations, in bytes. If 'None', has no
+                limit. Defaults to None.
+            directory (Optional[str], optional): Directory to store the activations as memory mapped files. The
+                activations are saved in a new subdirectory, removed in 'close'. If 'None', stores in memory.
+                Defaults to None.
+        '''
+        self._max_bytes = max_bytes
+
+        self._cache_dir : Optional[str] = None
+        if directory is not None:
+            self._cache_dir = os.path.join(directory, "activation_cache-"+uuid.uuid4().hex)
+            os.makedirs(self._cache_dir)
+
+        self._entries : List[Dict[str, Any]] = []
+        self._index : Dict[Hashable, Tuple[int, int]] = {}
+        self._size = 0
+        self._full = False
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, sample_id:Hashable) -> bool:
+        return sample_id in self._index
+
+    @property
+    def size(self) -> int:
+        '''
+        Size of the stored activations, in bytes.
+        '''
+        return self._size
+
+    @property
+    def full(self) -> bool:
+        '''
+        If some activations were not stored because the store reached its maximum size.
+        '''
+        return self._full
+
+    def contains(self, sample_ids:Sequence[Hashable]|torch.Tensor) -> bool:
+        '''
+        Checks if all the samples are stored.
+
+        Args:
+            sample_ids (Sequence[Hashable] | torch.Tensor): Sample ids.
+
+        Returns:
+            bool: True if all the samples are stored.
+        '''
+        return all(sample_id in self._index for sample_id in sample_ids_to_list(sample_ids))
+
+    def put(self, sample_ids:Sequence[Hashable]|torch.Tensor, activations:Dict[str, Any]) -> bool:
+        '''
+        Stores the activations of a batch.
+
+        Args:
+            sample_ids (Sequence[Hashable] | torch.Tensor): Ids of the batch samples.
+            activations (Dict[str, Any]): Activations, indexed by path. Each activation is a tensor, or nested list,
+                tuple or dict of tensors, with the samples in the first dimension.
+
+        Raises:
+            ValueError: If the number of ids is different from the number of samples.
+
+        Returns:
+            bool: True if the activations were stored, False if exceeds the maximum size. Already stored samples are
+                not replaced.
+        '''
+        sample_ids = sample_ids_to_list(sample_ids)
+
+        new_rows = [row for row, sample_id in enumerate(sample_ids) if sample_id not in self._index]
+        if len(new_rows) == 0:
+            return True
+
+        for value in activations.values():
+            if any(tensor.shape[0] != len(sample_ids) for tensor in _tensors(value)):
+                raise ValueError("The number of sample ids must be equal to the number of samples.")
+
+        if len(new_rows) != len(sample_ids):
+            row_index = torch.tensor(new_rows)
+            activations = {path:_select(value, row_index) for path, value in activations.items()}
+
+        entry = {path:self._detach(value) for path, value in activations.items()}
+        entry_size = sum(_nbytes(value) for value in entry.values())
+
+        if self._max_bytes is not None and self._size + entry_size > self._max_bytes:
+            self._full = True
+            return False
+
+        if self._cache_dir is not None:
+            entry_path = os.path.join(self._cache_dir, f"{len(self._entries)}.pt")
+            torch.save({path:self._to_cpu(value) for path, value in entry.items()}, entry_path)
+            entry = torch.load(entry_path, mmap=True, weights_only=True)
+
+        entry_index = len(self._entries)
+        self._entries.append(entry)
+        self._size += entry_size
+
+        for row, original_row in enumerate(new_rows):
+            self._index[sample_ids[original_row]] = (entry_index, row)
+
+        return True
+
+    def get(self, sample_ids:Sequence[Hashable]|torch.Tensor) -> Optional[Dict[str, Any]]:
+        '''
+        Gets the activations of a batch.
+
+        Args:
+            sample_ids (Sequence[Hashable] | torch.Tensor): Ids of the batch samples.
+
+        Returns:
+            Optional[Dict[str, Any]]: Activations indexed by path, with the samples in the ids order. Is None if some
+                sample is not stored.
+        '''
+        sample_ids = sample_ids_to_list(sample_ids)
+
+        locations = []
+        for sample_id in sample_ids:
+            if sample_id not in self._index:
+                return None
+            locations.append(self._index[sample_id])
+
+        if len(locations) == 0:
+            return None
+
+        paths = self._entries[locations[0][0]].keys()
+
+        return {path:_stack([_select(self._entries[entry_index][path], row) for entry_index, row in locations])
+                for path in paths}
+
+    def clear(self) -> None:
+        '''
+        Removes all the stored activations.
+        '''
+        self._entries = []
+        self._index = {}
+        self._size = 0
+        self._full = False
+
+        if self._cache_dir is not None:
+            shutil.rmtree(self._cache_dir, ignore_errors=True)
+            os.makedirs(self._cache_dir)
+
+    def close(self) -> None:
+        '''
+        Removes all the stored activations and the store directory.
+        '''
+        self.clear()
+
+        if self._cache_dir is not None:
+            shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def _detach(self, value:Any) -> Any:
+        '''
+        Detaches a tensor, or nested list, tuple or dict of tensors, making them contiguous.
+        '''
+        return map_tensors(lambda tensor: tensor.detach().contiguous(), value)
+
+    def _to_cpu(self, value:Any) -> Any:
+        '''
+        Moves a tensor, or nested list, tuple or dict of tensors to the CPU, to be memory mapped.
+        '''
+        return map_tensors(lambda tensor: tensor.cpu(), value)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+import torch
+
+from pytorch_probing.interceptor.output_selector import map_tensors
+from .prober import Prober
+from .activation_cache import ActivationCache, sample_ids_to_list
+
+class CachedProber:
+    '''
+    Executes a Prober with a frozen backbone, caching the probes inputs by sample id.
+
+    Batches with all the samples cached are probed from the cache, without executing the backbone.
+    Other batches execute the backbone and cache the probes inputs, so multi-epoch probe training 
+    executes the backbone approximately once for the cached samples.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from torch.nn import Sequential, Linear, ReLU
+    >>> from pytorch_probing import Prober
+    >>> from pytorch_probing.prober import ActivationCache, CachedProber
+    >>> module = Sequential(Linear(2, 3), ReLU(), Linear(3, 1))
+    >>> prober = Prober(module, {"1":Linear(3, 1)})
+    >>> cached_prober = CachedProber(prober, ActivationCache())
+    >>> inputs = torch.randn(4, 2)
+    >>> first = cached_prober([0, 1, 2, 3], inputs)
+    >>> second = cached_prober([0, 1, 2, 3], inputs)
+    >>> print(cached_prober.n_backbone_call, cached_prober.n_cache_hit)
+    1 1
+    '''
+
+    def __init__(self, prober:Prober, cache:ActivationCache, device:Optional[torch.device|str]=None) -> None:
+        '''
+        CachedProber init.
+
+        Args:
+            prober (Prober): Prober to execute. Can't be eager, and the backbone must be frozen, as cached
+                activations are not recomputed.
+            cache (ActivationCache): Store of the probes inputs.
+            device (Optional[torch.device | str], optional): Device to move the cached activations. If 'None', uses the
+                device where the activations are stored. Defaults to None.
+        '''
+        self._prober = prober
+        self._cache = cache
+        self._device = device
+
+        self._n_backbone_call = 0
+        self._n_cache_hit = 0
+
+    @property
+    def cache(self) -> ActivationCache:
+        '''
+        Store of the probes inputs.
+        '''
+        return self._cache
+
+    @property
+    def n_backbone_call(self) -> int:
+        '''
+        Number of calls that executed the backbone.
+        '''
+        return self._n_backbone_call
+
+    @property
+    def n_cache_hit(self) -> int:
+        '''
+        Number of calls probed from the cache.
+        '''
+        return self._n_cache_hit
+
+    def __call__(self, sample_ids:Sequence[Hashable]|torch.Tensor, *args, **kwargs) -> Dict[str, Any]:
+        '''
+        Executes the probes, executing the backbone only if some sample is not cached.
+
+        Args:
+            sample_ids (Sequence[Hashable] | torch.Tensor): Ids of the batch samples.
+            *args, **kwargs: Backbone inputs.
+
+        Returns:
+            Dict[str, Any]: Probes outputs, indexed by path.
+        '''
+        probe_inputs = self._cache.get(sample_ids)
+
+        if probe_inputs is not None:
+            self._n_cache_hit += 1
+
+            if self._device is not None:
+                probe_inputs = {path:self._to_device(value) for path, value in probe_inputs.items()}
+        else:
+            self._n_backbone_call += 1
+
+            _, probe_inputs = self._prober.intercept(*args, **kwargs)
+
+            decision = self._prober.sample_decision
+            if decision is not None and len(probe_inputs) != 0:
+                ids = sample_ids_to_list(sample_ids)
+                if isinstance(decision, torch.Tensor):
+                    ids = [ids[index] for index in decision.tolist()]
+
+                self._cache.put(ids, probe_inputs)
+
+        return self._prober.run_probes(probe_inputs)
+
+    def _to_device(self, value:Any) -> Any:
+        '''
+        Moves a tensor, or nested list, tuple or dict of tensors to the device.
+        '''
+        return map_tensors(lambda tensor: tensor.to(self._device), value)
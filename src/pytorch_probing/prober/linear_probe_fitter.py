@@ -0,0 +1,463 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Iterable, Any, Tuple
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from pytorch_probing.interceptor import Interceptor
+
+def _inverse_eigenvalues(eigenvalues:torch.Tensor, alpha:float) -> torch.Tensor:
+    '''
+    Inverts the regularized eigenvalues of a covariance.
+
+    With alpha 0, computes the pseudo-inverse, discarding the eigenvalues below a cutoff relative
+    to the largest one, as in torch.linalg.pinv, instead of amplifying the noise in their directions.
+
+    Args:
+        eigenvalues (torch.Tensor): Non negative eigenvalues.
+        alpha (float): Regularization strength, added to the eigenvalues.
+
+    Returns:
+        torch.Tensor: Inverted eigenvalues.
+    '''
+    if alpha > 0:
+        return 1 / (eigenvalues + alpha)
+
+    cutoff = eigenvalues.max().clamp(min=0) * len(eigenvalues) * torch.finfo(eigenvalues.dtype).eps
+    inverse = torch.zeros_like(eigenvalues)
+    kept = eigenvalues > cutoff
+    inverse[kept] = 1 / eigenvalues[kept]
+
+    return inverse
+
+def _check_alphas(alphas:List[float]) -> None:
+    '''
+    Checks the regularization strengths.
+
+    Args:
+        alphas (List[float]): Regularization strengths.
+
+    Raises:
+        ValueError: If some strength is negative.
+    '''
+    if any(alpha < 0 for alpha in alphas):
+        raise ValueError("Regularization strengths must be non negative.")
+
+class _Statistics:
+    '''
+    Sufficient statistics of a path, accumulated in float64.
+    '''
+
+    def __init__(self, n_feature:int, n_output:int, n_class:int, device:torch.device) -> None:
+        '''
+        _Statistics init.
+
+        Args:
+            n_feature (int): Number of features.
+            n_output (int): Number of ridge outputs.
+            n_class (int): Number of LDA classes, 0 if not using LDA.
+            device (torch.device): Device to accumulate.
+        '''
+        options : Dict[str, Any] = {"dtype":torch.float64, "device":device}
+
+        self.n_feature = n_feature
+        self.n = 0
+        self.sum_x = torch.zeros(n_feature, **options)
+        self.xtx = torch.zeros(n_feature, n_feature, **options)
+
+        self.sum_y = torch.zeros(n_output, **options)
+        self.xty = torch.zeros(n_feature, n_output, **options)
+        self.yty = torch.zeros(n_output, **options)
+
+        self.class_count = torch.zeros(n_class, **options)
+        self.class_sum = torch.zeros(n_class, n_feature, **options)
+
+class LinearProbeFitter:
+    '''
+    Fits linear probes in closed form, with a single pass over the data.
+
+    Accumulates XᵀX and XᵀY (or per class sums, for LDA) of each path in float64, and solves
+    ridge regression or regularized linear discriminant analysis for any regularization strength
+    without revisiting the data. The fitted probes are torch.nn.Linear modules, that can be used
+    with Prober.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pytorch_probing.prober import LinearProbeFitter
+    >>> x = torch.randn(100, 3)
+    >>> y = x @ torch.tensor([[1.0], [2.0], [3.0]]) + 1
+    >>> fitter = LinearProbeFitter()
+    >>> fitter.update({"layer":x}, y)
+    >>> probes = fitter.fit(alpha=0.0)
+    >>> print(probes["layer"].weight.detach().round(decimals=3), probes["layer"].bias.detach().round(decimals=3))
+    tensor([[1., 2., 3.]]) tensor([1.])
+    '''
+
+    def __init__(self, method:str="ridge", n_class:Optional[int]=None,
+                 paths:Optional[List[str]]=None) -> None:
+        '''
+        LinearProbeFitter init.
+
+        Args:
+            method (str, optional): Fitting method, "ridge" for ridge regression or "lda" for linear discriminant analysis.
+                Defaults to "ridge".
+            n_class (Optional[int], optional): Number of classes. Required for "lda". With "ridge", integer targets are
+                one-hot encoded if set. Defaults to None.
+            paths (Optional[List[str]], optional): Paths to fit probes. If 'None', fits all the given paths. Defaults to None.
+
+        Raises:
+            ValueError: If method is unknown or "lda" is used without n_class.
+        '''
+        if method not in ["ridge", "lda"]:
+            raise ValueError(f"Unknown method '{method}'. Must be 'ridge' or 'lda'.")
+        if method == "lda" and n_class is None:
+            raise ValueError("'n_class' is required for 'lda' method.")
+
+        self._method = method
+        self._n_class = n_class
+        self._paths = paths
+
+        self._statistics : Dict[str, _Statistics] = {}
+        self._feature_shapes : Dict[str, torch.Size] = {}
+        self._selected_alphas : Dict[str, float] = {}
+
+    @property
+    def n_sample(self) -> int:
+        '''
+        Number of accumulated samples.
+        '''
+        for statistics in self._statistics.values():
+            return statistics.n
+        return 0
+
+    def _prepare_targets(self, targets:torch.Tensor) -> torch.Tensor:
+        '''
+        Converts the targets to a float64 matrix.
+
+        Args:
+            targets (torch.Tensor): Batch targets.
+
+        Returns:
+            torch.Tensor: Targets with shape [batch, n_output].
+        '''
+        if self._n_class is not None and not torch.is_floating_point(targets):
+            targets = targets.reshape(-1).long()
+            return torch.nn.functional.one_hot(targets, self._n_class).to(torch.float64)
+
+        targets = targets.to(torch.float64)
+        return targets.reshape(targets.shape[0], -1)
+
+    def update(self, activations:Dict[str, Any], targets:torch.Tensor) -> None:
+        '''
+        Accumulates a batch.
+
+        Args:
+            activations (Dict[str, Any]): Activations of each path, with shape [batch, ...].
+            targets (torch.Tensor): Batch targets. Class indices for "lda", values or class indices for "ridge".
+
+        Raises:
+            ValueError: If a path activation is not a tensor.
+        '''
+        y = self._prepare_targets(targets)
+
+        for path in activations:
+            if self._paths is not None and path not in self._paths:
+                continue
+
+            activation = activations[path]
+            if not isinstance(activation, torch.Tensor):
+                raise ValueError(f"Activation of path '{path}' is not a tensor.")
+
+            x = activation.detach().reshape(activation.shape[0], -1).to(torch.float64)
+            y_path = y.to(x.device)
+
+            if path not in self._statistics:
+                n_class = self._n_class if self._method == "lda" and self._n_class is not None else 0
+                self._statistics[path] = _Statistics(x.shape[1], y_path.shape[1], n_class, x.device)
+                self._feature_shapes[path] = activation.shape[1:]
+
+            statistics = self._statistics[path]
+
+            statistics.n += x.shape[0]
+            statistics.sum_x += x.sum(0)
+            statistics.xtx += x.T @ x
+
+            if self._method == "ridge":
+                statistics.sum_y += y_path.sum(0)
+                statistics.xty += x.T @ y_path
+                statistics.yty += (y_path*y_path).sum(0)
+            else:
+                labels = targets.reshape(-1).long().to(x.device)
+                statistics.class_count += torch.bincount(labels, minlength=statistics.class_count.shape[0])
+                statistics.class_sum.index_add_(0, labels, x)
+
+    def update_from_dataset(self, dataset:Dataset, batch_size:int=256, num_workers:int=0) -> None:
+        '''
+        Accumulates all the samples of a collected dataset.
+
+        Args:
+            dataset (Dataset): CollectedDataset or IterableCollectedDataset, created with 'get_target=True'.
+            batch_size (int, optional): Batch size used to read the dataset. Defaults to 256.
+            num_workers (int, optional): Number of DataLoader workers. Defaults to 0.
+
+        Raises:
+            ValueError: If the dataset does not return the targets.
+        '''
+        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+
+        for batch in dataloader:
+            if not isinstance(batch, (list, tuple)):
+                raise ValueError("Dataset must return the targets. Use 'get_target=True'.")
+
+            self.update(batch[0], batch[1])
+
+    def update_from_interceptor(self, interceptor:Interceptor, dataloader:Iterable,
+                                device:Optional[torch.device]=None) -> None:
+        '''
+        Accumulates the intercepted outputs while executing the module over a dataloader.
+
+        Args:
+            interceptor (Interceptor): Interceptor of the paths to fit.
+            dataloader (Iterable): Dataloader returning (input, target) batches.
+            device (Optional[torch.device], optional): Device to send the inputs. If 'None', does not move the inputs. Defaults to None.
+        '''
+        with torch.no_grad():
+            for x, y in dataloader:
+                if device is not None:
+                    x = x.to(device)
+
+                interceptor(x)
+                outputs = interceptor.outputs
+                assert outputs is not None
+
+                self.update(outputs, y)
+                interceptor.interceptor_clear()
+
+    def fit(self, alpha:float=1.0) -> Dict[str, torch.nn.Module]:
+        '''
+        Fits the probes with a regularization strength.
+
+        Args:
+            alpha (float, optional): Regularization strength. With 0, uses the pseudo-inverse of the covariance. Defaults to 1.0.
+
+        Raises:
+            ValueError: If alpha is negative.
+
+        Returns:
+            Dict[str, torch.nn.Module]: Probes, indexed by path.
+        '''
+        return self.fit_grid([alpha])[alpha]
+
+    def fit_grid(self, alphas:List[float]) -> Dict[float, Dict[str, torch.nn.Module]]:
+        '''
+        Fits the probes for a grid of regularization strengths.
+
+        Decomposes the covariance of each path once, and reuses it for all the strengths.
+
+        Args:
+            alphas (List[float]): Regularization strengths.
+
+        Raises:
+            ValueError: If some strength is negative.
+
+        Returns:
+            Dict[float, Dict[str, torch.nn.Module]]: Probes, indexed by regularization strength and path.
+        '''
+        _check_alphas(alphas)
+
+        probes : Dict[float, Dict[str, torch.nn.Module]] = {alpha:{} for alpha in alphas}
+
+        for path in self._statistics:
+            if self._method == "ridge":
+                solutions = self._solve_ridge(path, alphas)
+            else:
+                solutions = self._solve_lda(path, alphas)
+
+            for alpha, (weight, bias) in zip(alphas, solutions):
+                probes[alpha][path] = self._make_probe(path, weight, bias)
+
+        return probes
+
+    def select(self, alphas:List[float]) -> Dict[str, torch.nn.Module]:
+        '''
+        Fits the probes, selecting the regularization strength of each path by generalized cross-validation.
+
+        Only avaiable for "ridge".
+
+        Args:
+            alphas (List[float]): Regularization strengths to choose from.
+
+        Raises:
+            ValueError: If method is not "ridge" or some strength is negative.
+
+        Returns:
+            Dict[str, torch.nn.Module]: Probes, indexed by path.
+        '''
+        if self._method != "ridge":
+            raise ValueError("Generalized cross-validation is only avaiable for 'ridge' method.")
+        _check_alphas(alphas)
+
+        probes : Dict[str, torch.nn.Module] = {}
+        self._selected_alphas = {}
+
+        for path in self._statistics:
+            solutions = self._solve_ridge(path, alphas)
+            scores = self._gcv(path, alphas, solutions)
+
+            best = min(range(len(alphas)), key=lambda i: scores[i])
+            weight, bias = solutions[best]
+
+            probes[path] = self._make_probe(path, weight, bias)
+            self._selected_alphas[path] = alphas[best]
+
+        return probes
+
+    @property
+    def selected_alphas(self) -> Dict[str, float]:
+        '''
+        Regularization strengths chosen in the last 'select' call, indexed by path.
+        '''
+        return self._selected_alphas
+
+    def _ridge_terms(self, path:str) -> Tuple[torch.Tensor, ...]:
+        '''
+        Computes the centered ridge terms of a path.
+
+        Args:
+            path (str): Path to compute.
+
+        Returns:
+            Tuple[torch.Tensor, ...]: Means of X and Y, covariance of X, cross-covariance of X and Y and 
+                variance of each Y output, not normalized by the number of samples.
+        '''
+        statistics = self._statistics[path]
+        n = statistics.n
+
+        mean_x = (statistics.sum_x / n).cpu()
+        mean_y = (statistics.sum_y / n).cpu()
+
+        cov = statistics.xtx.cpu() - n*torch.outer(mean_x, mean_x)
+        cov_xy = statistics.xty.cpu() - n*torch.outer(mean_x, mean_y)
+        var_y = statistics.yty.cpu() - n*mean_y*mean_y
+
+        return mean_x, mean_y, cov, cov_xy, var_y
+
+    def _solve_ridge(self, path:str, alphas:List[float]) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        '''
+        Solves the ridge regression of a path.
+
+        Args:
+            path (str): Path to solve.
+            alphas (List[float]): Regularization strengths.
+
+        Returns:
+            List[Tuple[torch.Tensor, torch.Tensor]]: Weight [n_feature, n_output] and bias of each strength.
+        '''
+        mean_x, mean_y, cov, cov_xy, _ = self._ridge_terms(path)
+
+        eigenvalues, eigenvectors = torch.linalg.eigh(cov)
+        eigenvalues = eigenvalues.clamp(min=0)
+        projected = eigenvectors.T @ cov_xy
+
+        solutions = []
+        for alpha in alphas:
+            weight = eigenvectors @ (projected * _inverse_eigenvalues(eigenvalues, alpha)[:, None])
+            bias = mean_y - mean_x @ weight
+
+            solutions.append((weight, bias))
+
+        return solutions
+
+    def _gcv(self, path:str, alphas:List[float], 
+             solutions:List[Tuple[torch.Tensor, torch.Tensor]]) -> List[float]:
+        '''
+        Computes the generalized cross-validation score of the ridge solutions of a path.
+
+        Args:
+            path (str): Path of the solutions.
+            alphas (List[float]): Regularization strengths.
+            solutions (List[Tuple[torch.Tensor, torch.Tensor]]): Solutions of each strength.
+
+        Returns:
+            List[float]: Scores, lower is better.
+        '''
+        n = self._statistics[path].n
+        _, _, cov, cov_xy, var_y = self._ridge_terms(path)
+
+        eigenvalues = torch.linalg.eigvalsh(cov).clamp(min=0)
+
+        scores = []
+        for alpha, (weight, _) in zip(alphas, solutions):
+            rss = var_y.sum() - 2*(weight*cov_xy).sum() + (weight*(cov @ weight)).sum()
+            degrees = (eigenvalues * _inverse_eigenvalues(eigenvalues, alpha)).sum() + 1
+
+            denominator = (1 - degrees/n)**2
+            if denominator <= 0:
+                scores.append(math.inf)
+            else:
+                scores.append(float(rss / n / denominator))
+
+        return scores
+
+    def _solve_lda(self, path:str, alphas:List[float]) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        '''
+        Solves the regularized linear discriminant analysis of a path.
+
+        Args:
+            path (str): Path to solve.
+            alphas (List[float]): Regularization strengths, added to the within class covariance diagonal.
+
+        Returns:
+            List[Tuple[torch.Tensor, torch.Tensor]]: Weight [n_feature, n_class] and bias of each strength.
+        '''
+        statistics = self._statistics[path]
+        n = statistics.n
+
+        class_count = statistics.class_count.cpu()
+        class_mean = statistics.class_sum.cpu() / class_count.clamp(min=1)[:, None]
+
+        n_class = int((class_count > 0).sum())
+        scatter = statistics.xtx.cpu() - (class_mean.T * class_count) @ class_mean
+        within_cov = scatter / max(n - n_class, 1)
+
+        eigenvalues, eigenvectors = torch.linalg.eigh(within_cov)
+        eigenvalues = eigenvalues.clamp(min=0)
+        projected = eigenvectors.T @ class_mean.T
+
+        log_prior = torch.log(class_count.clamp(min=1e-12) / n)
+
+        solutions = []
+        for alpha in alphas:
+            weight = eigenvectors @ (projected * _inverse_eigenvalues(eigenvalues, alpha)[:, None])
+            bias = -0.5*(class_mean * weight.T).sum(1) + log_prior
+
+            solutions.append((weight, bias))
+
+        return solutions
+
+    def _make_probe(self, path:str, weight:torch.Tensor, bias:torch.Tensor) -> torch.nn.Module:
+        '''
+        Creates a probe module from a solution.
+
+        Args:
+            path (str): Path of the probe.
+            weight (torch.Tensor): Solution weight, with shape [n_feature, n_output].
+            bias (torch.Tensor): Solution bias.
+
+        Returns:
+            torch.nn.Module: Linear probe, with a Flatten before it if the path features are not a vector.
+        '''
+        n_feature, n_output = weight.shape
+
+        linear = torch.nn.Linear(n_feature, n_output)
+        with torch.no_grad():
+            linear.weight.copy_(weight.T)
+            linear.bias.copy_(bias)
+
+        if len(self._feature_shapes[path]) <= 1:
+            return linear
+
+        return torch.nn.Sequential(torch.nn.Flatten(), linear)
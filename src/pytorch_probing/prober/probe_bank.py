@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import copy
+from typing import Callable, Dict, Iterable, List, Optional, Any, Tuple, Union
+
+import torch
+
+from .prober import Prober
+
+LossFunction = Callable[[Any, Any], torch.Tensor]
+MetricFunction = Callable[[Any, Any], Union[float, torch.Tensor]]
+
+class ProbeBank:
+    '''
+    Trains the probes of all the paths of a Prober concurrently.
+
+    Each training step executes the backbone once, without gradients, and updates all the probes that are still training.
+    Each probe has its own early stopping, based on the validation loss computed in 'evaluate'.
+    Call 'close', or use as a context manager, to restore the backbone gradients if 'freeze_backbone' is set.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from torch.nn import Sequential, Linear, ReLU
+    >>> from pytorch_probing import Prober
+    >>> from pytorch_probing.prober import ProbeBank
+    >>> module = Sequential(Linear(2, 3), ReLU(), Linear(3, 1))
+    >>> prober = Prober(module, {"0":Linear(3, 1), "1":Linear(3, 1)})
+    >>> bank = ProbeBank(prober, lambda params: torch.optim.SGD(params, lr=0.1), torch.nn.MSELoss())
+    >>> losses = bank.step(torch.randn(8, 2), torch.randn(8, 1))
+    >>> print(sorted(losses.keys()))
+    ['0', '1']
+    '''
+
+    def __init__(self, prober:Prober,
+                 optimizer_factory:Callable[[Any], torch.optim.Optimizer],
+                 loss_function:LossFunction|Dict[str, LossFunction],
+                 single_optimizer:bool=False, patience:Optional[int]=None, min_delta:float=0.0,
+                 metrics:Optional[Dict[str, MetricFunction]]=None, freeze_backbone:bool=False) -> None:
+        '''
+        ProbeBank init.
+
+        Args:
+            prober (Prober): Prober with the probes to train.
+            optimizer_factory (Callable[[Any], torch.optim.Optimizer]): Creates an optimizer from parameters or parameter groups,
+                like "lambda params: torch.optim.Adam(params, lr=1e-3)".
+            loss_function (LossFunction | Dict[str, LossFunction]): Loss of the probes, receiving (probe_output, target). Can be
+                a dict indexed by path to use different losses.
+            single_optimizer (bool, optional): If should use one optimizer for all the probes, with a parameter group per path. With
+                optimizers that support 'foreach=True', updates all the probes with vectorized operations. If False, creates one
+                optimizer per probe. Defaults to False.
+            patience (Optional[int], optional): Number of evaluations without improvement before stopping a probe. If 'None',
+                never stops. Defaults to None.
+            min_delta (float, optional): Minimum decrease of the validation loss to be considered an improvement. Defaults to 0.0.
+            metrics (Optional[Dict[str, MetricFunction]], optional): Additional metrics computed in 'evaluate', receiving
+                (probe_output, target). Defaults to None.
+            freeze_backbone (bool, optional): If should disable the gradients of the backbone parameters. The original
+                flags are restored in 'close'. Defaults to False.
+
+        Raises:
+            ValueError: If the prober runs the probes with an executor or is eager.
+        '''
+        if prober._executor is not None:
+            raise ValueError("ProbeBank can't train a prober with an executor, the probes must run synchronously.")
+        if prober._eager:
+            raise ValueError("ProbeBank can't train an eager prober, the probes must run after the backbone.")
+
+        self._prober = prober
+        self._loss_function = loss_function
+        self._patience = patience
+        self._min_delta = min_delta
+        self._metrics = metrics if metrics is not None else {}
+
+        self._paths : List[str] = prober.probe_paths
+
+        self._frozen_parameters : List[Tuple[torch.nn.Parameter, bool]] = []
+        if freeze_backbone:
+            for parameter in prober._module.parameters():
+                self._frozen_parameters.append((parameter, parameter.requires_grad))
+                parameter.requires_grad_(False)
+
+        self._optimizers : Dict[str, torch.optim.Optimizer] = {}
+        self._optimizer : Optional[torch.optim.Optimizer] = None
+        if single_optimizer:
+            groups = [{"params":list(prober.get_probe(path).parameters())} for path in self._paths]
+            groups = [group for group in groups if len(group["params"]) != 0]
+            if len(groups) != 0:
+                self._optimizer = optimizer_factory(groups)
+        else:
+            for path in self._paths:
+                parameters = list(prober.get_probe(path).parameters())
+                if len(parameters) != 0:
+                    self._optimizers[path] = optimizer_factory(parameters)
+
+        self._active = {path:True for path in self._paths}
+        self._best_loss = {path:float("inf") for path in self._paths}
+        self._best_state : Dict[str, Dict[str, Any]] = {}
+        self._n_bad_evaluation = {path:0 for path in self._paths}
+        self._history : Dict[str, List[Dict[str, float]]] = {path:[] for path in self._paths}
+
+    @property
+    def active_paths(self) -> List[str]:
+        '''
+        Paths of the probes still training.
+        '''
+        return [path for path in self._paths if self._active[path]]
+
+    @property
+    def stopped_paths(self) -> List[str]:
+        '''
+        Paths of the probes stopped by early stopping.
+        '''
+        return [path for path in self._paths if not self._active[path]]
+
+    @property
+    def history(self) -> Dict[str, List[Dict[str, float]]]:
+        '''
+        Validation loss and metrics of each evaluation, indexed by path.
+        '''
+        return self._history
+
+    @property
+    def best_losses(self) -> Dict[str, float]:
+        '''
+        Best validation loss of each probe.
+        '''
+        return self._best_loss
+
+    def close(self) -> None:
+        '''
+        Restores the gradients of the backbone parameters disabled by 'freeze_backbone'.
+        '''
+        for parameter, requires_grad in self._frozen_parameters:
+            parameter.requires_grad_(requires_grad)
+        self._frozen_parameters = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def _loss(self, path:str, output:Any, target:Any) -> torch.Tensor:
+        '''
+        Computes the loss of a probe.
+
+        Args:
+            path (str): Probe path.
+            output (Any): Probe output.
+            target (Any): Target.
+
+        Returns:
+            torch.Tensor: Loss.
+        '''
+        if isinstance(self._loss_function, dict):
+            return self._loss_function[path](output, target)
+        return self._loss_function(output, target)
+
+    def _forward(self, paths:List[str], *args, **kwargs) -> Dict[str, Any]:
+        '''
+        Executes the backbone without gradients, and then only the probes of the given paths.
+
+        Args:
+            paths (List[str]): Paths of the probes to execute.
+
+        Returns:
+            Dict[str, Any]: Probes outputs, indexed by path. Not sampled paths are not included.
+        '''
+        with torch.no_grad():
+            _, probe_inputs = self._prober.intercept(*args, **kwargs)
+
+        probe_inputs = {path:probe_inputs[path] for path in paths if path in probe_inputs}
+
+        return self._prober.run_probes(probe_inputs)
+
+    def step(self, inputs:Any, target:Any) -> Dict[str, float]:
+        '''
+        Executes a training step of all the active probes, with a single backbone forward.
+
+        Args:
+            inputs (Any): Backbone input.
+            target (Any): Probes target.
+
+        Returns:
+            Dict[str, float]: Training loss of each active probe.
+        '''
+        active_paths = self.active_paths
+        if len(active_paths) == 0:
+            return {}
+
+        for path in active_paths:
+            self._prober.get_probe(path).train()
+
+        with torch.enable_grad():
+            outputs = self._forward(active_paths, inputs)
+            if len(outputs) == 0:
+                return {}
+
+            losses = {path:self._loss(path, output, target) for path, output in outputs.items()}
+
+            self._zero_grad()
+            total_loss = torch.stack(list(losses.values())).sum()
+            if total_loss.requires_grad:
+                total_loss.backward()
+
+        if self._optimizer is not None:
+            self._optimizer.step()
+        for path in losses:
+            if path in self._optimizers:
+                self._optimizers[path].step()
+
+        return {path:float(loss.detach()) for path, loss in losses.items()}
+
+    def _zero_grad(self) -> None:
+        '''
+        Clears the gradients of all the probes.
+        '''
+        if self._optimizer is not None:
+            self._optimizer.zero_grad(set_to_none=True)
+        for optimizer in self._optimizers.values():
+            optimizer.zero_grad(set_to_none=True)
+
+    def evaluate(self, dataloader:Iterable) -> Dict[str, Dict[str, float]]:
+        '''
+        Computes the validation loss and metrics of all the probes, and updates the early stopping.
+
+        Args:
+            dataloader (Iterable): Validation dataloader returning (input, target) batches.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Loss and metrics of each probe, indexed by path and metric name.
+        '''
+        for path in self._paths:
+            self._prober.get_probe(path).eval()
+
+        sums : Dict[str, Dict[str, float]] = {path:{} for path in self._paths}
+        n_sample = 0
+
+        with torch.no_grad():
+            for inputs, target in dataloader:
+                outputs = self._forward(self._paths, inputs)
+                batch_size = len(target)
+                n_sample += batch_size
+
+                for path in outputs:
+                    values : Dict[str, Any] = {"loss":self._loss(path, outputs[path], target)}
+                    for name, metric in self._metrics.items():
+                        values[name] = metric(outputs[path], target)
+
+                    for name, value in values.items():
+                        sums[path][name] = sums[path].get(name, 0.0) + float(value)*batch_size
+
+        results = {path:{name:value/max(n_sample, 1) for name, value in sums[path].items()} for path in self._paths}
+
+        for path in self._paths:
+            self._history[path].append(results[path])
+
+            if not self._active[path] or "loss" not in results[path]:
+                continue
+
+            loss = results[path]["loss"]
+            if loss < self._best_loss[path] - self._min_delta:
+                self._best_loss[path] = loss
+                self._best_state[path] = copy.deepcopy(self._prober.get_probe(path).state_dict())
+                self._n_bad_evaluation[path] = 0
+            else:
+                self._n_bad_evaluation[path] += 1
+
+                if self._patience is not None and self._n_bad_evaluation[path] >= self._patience:
+                    self._stop(path)
+
+        return results
+
+    def _stop(self, path:str) -> None:
+        '''
+        Stops the training of a probe.
+
+        Args:
+            path (str): Probe path.
+        '''
+        self._active[path] = False
+
+        for parameter in self._prober.get_probe(path).parameters():
+            parameter.requires_grad_(False)
+            parameter.grad = None
+
+    def restore_best(self) -> None:
+        '''
+        Loads the parameters of each probe with the best validation loss.
+        '''
+        for path, state in self._best_state.items():
+            self._prober.get_probe(path).load_state_dict(state)
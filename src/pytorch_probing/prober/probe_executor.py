@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import warnings
+import threading
+import collections
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Optional, Tuple
+
+import torch
+
+class ProbeExecutor:
+    '''
+    Background executor of probes, outside the critical path of the main prediction.
+
+    Tasks are executed in order by a single worker thread. The queue is bounded: when full, the
+    oldest pending task is dropped and its future is cancelled, so the producer never blocks.
+
+    Examples
+    --------
+    >>> from pytorch_probing.prober import ProbeExecutor
+    >>> with ProbeExecutor(max_pending=4) as executor:
+    ...     future = executor.submit(lambda: 1+1)
+    ...     print(future.result())
+    2
+    '''
+
+    def __init__(self, max_pending:int=16, callback:Optional[Callable[[Any], None]]=None) -> None:
+        '''
+        ProbeExecutor init.
+
+        Args:
+            max_pending (int, optional): Maximum number of tasks waiting execution. Defaults to 16.
+            callback (Optional[Callable[[Any], None]], optional): Function called in the worker thread with the
+                result of each completed task. Defaults to None.
+
+        Raises:
+            ValueError: If max_pending is not positive.
+        '''
+        if max_pending <= 0:
+            raise ValueError("'max_pending' must be positive.")
+
+        self._max_pending = max_pending
+        self._callback = callback
+
+        self._queue : Deque[Tuple[Future, Callable[[], Any], bool]] = collections.deque()
+        self._condition = threading.Condition()
+        self._n_running = 0
+        self._n_dropped = 0
+        self._n_completed = 0
+        self._shutdown = False
+
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    @property
+    def n_pending(self) -> int:
+        '''
+        Number of tasks waiting execution.
+        '''
+        with self._condition:
+            return len(self._queue)
+
+    @property
+    def n_dropped(self) -> int:
+        '''
+        Number of tasks dropped because the queue was full.
+        '''
+        return self._n_dropped
+
+    @property
+    def n_completed(self) -> int:
+        '''
+        Number of executed tasks.
+        '''
+        return self._n_completed
+
+    def submit(self, function:Callable[[], Any]) -> Future:
+        '''
+        Submits a task, dropping the oldest pending task if the queue is full.
+
+        The task is executed with the gradient mode of the calling thread.
+
+        Args:
+            function (Callable[[], Any]): Task to execute.
+
+        Raises:
+            RuntimeError: If the executor was shut down.
+
+        Returns:
+            Future: Future of the task result. Is cancelled if the task is dropped.
+        '''
+        future : Future = Future()
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit tasks after shutdown.")
+
+            while len(self._queue) >= self._max_pending:
+                dropped_future, _, _ = self._queue.popleft()
+                dropped_future.cancel()
+                self._n_dropped += 1
+
+            self._queue.append((future, function, torch.is_grad_enabled()))
+            self._condition.notify_all()
+
+        return future
+
+    def wait(self) -> None:
+        '''
+        Waits until all the submitted tasks are executed or dropped.
+        '''
+        with self._condition:
+            while len(self._queue) != 0 or self._n_running != 0:
+                self._condition.wait()
+
+    def shutdown(self, wait:bool=True) -> None:
+        '''
+        Stops the worker thread.
+
+        Args:
+            wait (bool, optional): If should execute the pending tasks before stopping. If False, cancels them.
+                Defaults to True.
+        '''
+        with self._condition:
+            if not wait:
+                while len(self._queue) != 0:
+                    future, _, _ = self._queue.popleft()
+                    future.cancel()
+            self._shutdown = True
+            self._condition.notify_all()
+
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.shutdown()
+
+    def _notify(self, result:Any) -> None:
+        '''
+        Calls the callback with a task result, warning on errors to keep the worker alive.
+        '''
+        if self._callback is None:
+            return
+        
+        try:
+            self._callback(result)
+        except Exception as exception:
+            warnings.warn(f"Probe callback raised an exception: {exception!r}")
+
+    def _worker(self) -> None:
+        '''
+        Executes the queued tasks until shutdown.
+        '''
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and not self._shutdown:
+                    self._condition.wait()
+
+                if len(self._queue) == 0:
+                    return
+
+                future, function, grad_enabled = self._queue.popleft()
+                self._n_running += 1
+
+            executed = False
+            try:
+                if future.set_running_or_notify_cancel():
+                    executed = True
+                    try:
+                        with torch.set_grad_enabled(grad_enabled):
+                            result = function()
+                    except BaseException as exception:
+                        future.set_exception(exception)
+                    else:
+                        future.set_result(result)
+                        self._notify(result)
+            finally:
+                with self._condition:
+                    self._n_running -= 1
+                    self._n_completed += executed
+                    self._condition.notify_all()
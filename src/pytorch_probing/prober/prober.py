@@ -1,10 +1,39 @@
 from __future__ import annotations
 
-from typing import Dict, Any, cast, MutableMapping 
+import copy
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple, cast, MutableMapping 
 
 import torch
 
 from pytorch_probing.interceptor import Interceptor
+from pytorch_probing.interceptor.path_pattern import is_pattern, resolve_paths
+from pytorch_probing.interceptor.sampler import Sampler
+from .probe_executor import ProbeExecutor
+
+def _probe_key(path:str) -> str:
+    '''
+    Gets the key of a probe in the probes ModuleDict, that can't contain ".".
+
+    Args:
+        path (str): Probed path.
+
+    Returns:
+        str: Probe key.
+    '''
+    return path.replace(".", "/")
+
+class _ProbeConsumer:
+    '''
+    Consumer executing a probe of a Prober, without registering the probe as a InterceptorLayer submodule.
+    '''
+
+    def __init__(self, prober:Prober, path:str) -> None:
+        self._prober = prober
+        self._path = path
+
+    def __call__(self, probe_input:Any) -> Any:
+        return self._prober.get_probe(self._path)(probe_input)
 
 class Prober(Interceptor):
     '''
@@ -30,7 +59,9 @@ class Prober(Interceptor):
     '''
     def __init__(self, module: torch.nn.Module, 
                  probes:MutableMapping [str, torch.nn.Module|None],
-                 return_in_forward:bool=True) -> None:
+                 return_in_forward:bool=True, cache_paths:bool=True, 
+                 sampler:Optional[Sampler]=None, executor:Optional[ProbeExecutor]=None,
+                 eager:bool=False) -> None:
         '''
         Prober init.
 
@@ -38,11 +69,41 @@ class Prober(Interceptor):
             module (torch.nn.Module): Module to wrap.
             probes (Dict[str, torch.nn.Module | None]): Probes to inject. Must be indexed by the path to inject and 
                 can be submodules as "my_module.submodule.subsubmodule". If probe is 'None', creates a 'Identity' module.
+                Paths can be patterns as in Interceptor, creating a copy of the probe for each matched path.
             return_in_forward (bool, optional): If should return the probes outputs in the forward. Defaults to True.
+            cache_paths (bool, optional): If should cache the paths resolved from patterns by module instance. Defaults to True.
+            sampler (Optional[Sampler], optional): Policy deciding which calls and samples are probed. Not sampled calls
+                only execute the module, without the probes. Probes of partially sampled calls receive only the sampled samples,
+                avaiable in 'sample_decision'. If 'None', probes all the calls. Defaults to None.
+            executor (Optional[ProbeExecutor], optional): Executor to run the probes asynchronously. If set, the forward returns
+                after the main prediction and the probes outputs are delivered by a future, avaiable in 'future' and returned in
+                the forward instead of the outputs, or by the executor callback. If 'None', runs the probes synchronously. 
+                Defaults to None.
+            eager (bool, optional): If should execute each probe as soon as its input is produced, inside the forward, 
+                without storing or copying the intercepted output. Only the probes outputs are kept, reducing the peak memory
+                when probing many layers. Can't be used with 'executor'. Defaults to False.
+
+        Raises:
+            ValueError: If 'eager' and 'executor' are both set.
         '''
-        super().__init__(module, list(probes.keys()))
+        if eager and executor is not None:
+            raise ValueError("'eager' can't be used with 'executor'.")
+
+        if any(is_pattern(path) for path in probes):
+            expanded_probes : Dict[str, torch.nn.Module|None] = {}
+            for path in probes:
+                if not is_pattern(path):
+                    expanded_probes[path] = probes[path]
+                    continue
+                
+                for resolved_path in resolve_paths(module, [path], cache_paths):
+                    expanded_probes[resolved_path] = copy.deepcopy(probes[path])
+            probes = expanded_probes
+
+        super().__init__(module, list(probes.keys()), cache_paths=cache_paths, sampler=sampler)
 
-        self._member_names += ["_probes", "_return_in_forward", "_probe_outputs"]
+        self._add_member_names(["_probes", "_probe_paths", "_return_in_forward", "_probe_outputs",
+                                "_executor", "_probe_future", "_eager"])
     
         for path in probes:
             if probes[path] is None:
@@ -50,12 +111,40 @@ class Prober(Interceptor):
 
         probes_ = cast(MutableMapping [str, torch.nn.Module], probes)
 
-        self._probes = torch.nn.ModuleDict(probes_)
+        self._probe_paths : List[str] = list(probes_.keys())
+        self._probes = torch.nn.ModuleDict({_probe_key(path):probes_[path] for path in self._probe_paths})
 
         self._probe_outputs : Dict[str, Any] | None = None
 
         self._return_in_forward = return_in_forward
 
+        self._executor = executor
+        self._probe_future : Optional[Future] = None
+
+        self._eager = eager
+        if eager:
+            for path in self._probe_paths:
+                self._interceptor_layers[path].consumer = _ProbeConsumer(self, path)
+
+
+    @property
+    def probe_paths(self) -> List[str]:
+        '''
+        Probed paths.
+        '''
+        return list(self._probe_paths)
+
+    def get_probe(self, path:str) -> torch.nn.Module:
+        '''
+        Gets the probe of a path.
+
+        Args:
+            path (str): Probed path.
+
+        Returns:
+            torch.nn.Module: Probe.
+        '''
+        return self._probes[_probe_key(path)]
 
     @property
     def outputs(self) -> Dict[str, Any] | None:
@@ -64,9 +153,16 @@ class Prober(Interceptor):
 
         Returns:
             Dict[str, Any] | None: Probes outputs, indexed by the probed path. Is None if the output was 
-            cleared or no forwards were executed.
+            cleared, no forwards were executed or the probes are executed asynchronously.
         '''
         return self._probe_outputs
+    
+    @property
+    def future(self) -> Optional[Future]:
+        '''
+        Future of the probes outputs of the last forward, if executing asynchronously.
+        '''
+        return self._probe_future
 
     def forward(self, *args, **kwargs):
         '''
@@ -74,31 +170,128 @@ class Prober(Interceptor):
         '''
         main_predictions = super().forward(*args, **kwargs)
 
-        probe_predictions = {}
+        return self._probe(main_predictions)
+    
+    def resume(self, path:str, activation:Any, *args):
+        '''
+        Executes only the part of the module after a path, using a stored output of the path, and the probes 
+        of the paths executed after it.
 
-        for path in self._probes:
-            probe_input = self._interceptor_layers[path].output
-            probe_output = self._probes[path](probe_input)
+        Args:
+            path (str): Path of the module whose output is replaced.
+            activation (Any): Output of the path.
+            *args: Original inputs of the module, only needed if used after the path.
 
-            probe_predictions[path] = probe_output
-        
-        self.interceptor_clear()
-        self._probe_outputs = probe_predictions
+        Returns:
+            Any: Module output and probes outputs, as in forward.
+        '''
+        main_predictions = super().resume(path, activation, *args)
+
+        return self._probe(main_predictions)
+
+    def _probe(self, main_predictions:Any):
+        '''
+        Executes the probes after the wrapped module execution.
+
+        Args:
+            main_predictions (Any): Wrapped module output.
+        '''
+        if self._eager:
+            eager_predictions : Dict[str, Any] = {}
+            for path in self._probe_paths:
+                probe_output = self._interceptor_layers[path].consumer_output
+                if probe_output is not None:
+                    eager_predictions[path] = probe_output
+
+            self.interceptor_clear()
+            self._probe_outputs = eager_predictions
+
+            if self._return_in_forward:
+                return main_predictions, eager_predictions
+            return main_predictions
+
+        probe_inputs = self._take_probe_inputs()
+
+        probe_predictions : Dict[str, Any] | Future
+        if self._executor is None:
+            probe_predictions = self.run_probes(probe_inputs)
+            self._probe_outputs = probe_predictions
+        else:
+            if len(probe_inputs) == 0:
+                probe_predictions = Future()
+                probe_predictions.set_result({})
+            else:
+                probe_predictions = self._executor.submit(lambda: self.run_probes(probe_inputs))
+            self._probe_future = probe_predictions
+            self._probe_outputs = None
 
         if self._return_in_forward:
             return main_predictions, probe_predictions
         else:
             return main_predictions
+    
+    def intercept(self, *args, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+        '''
+        Executes the wrapped module without the probes.
+
+        Raises:
+            ValueError: If the prober is eager, as the probes inputs are not stored.
+
+        Returns:
+            Tuple[Any, Dict[str, Any]]: Main prediction and probes inputs, indexed by path. Not sampled paths are not 
+                included.
+        '''
+        if self._eager:
+            raise ValueError("Eager prober does not store the probes inputs.")
+
+        main_predictions = super().forward(*args, **kwargs)
+
+        return main_predictions, self._take_probe_inputs()
+
+    def _take_probe_inputs(self) -> Dict[str, Any]:
+        '''
+        Gets the intercepted outputs and clears them.
+
+        Returns:
+            Dict[str, Any]: Probes inputs, indexed by path.
+        '''
+        probe_inputs : Dict[str, Any] = {}
+        for path in self._probe_paths:
+            probe_input = self._interceptor_layers[path].output
+            if probe_input is None:
+                # Not sampled call
+                continue
+
+            probe_inputs[path] = probe_input
+        
+        self.interceptor_clear()
+
+        return probe_inputs
+
+    def run_probes(self, probe_inputs:Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Executes the probes.
+
+        Args:
+            probe_inputs (Dict[str, Any]): Intercepted outputs, indexed by path.
+
+        Returns:
+            Dict[str, Any]: Probes outputs, indexed by path.
+        '''
+        return {path:self.get_probe(path)(probe_input) for path, probe_input in probe_inputs.items()}
         
     def probes_clear(self):
         '''
         Clears the stored outputs.
         '''
         self._probe_outputs = None
+        self._probe_future = None
 
     def __getstate__(self) -> Dict[str, Any]:
         state = super().__getstate__()
         state["_probe_outputs"] = None
+        state["_executor"] = None
+        state["_probe_future"] = None
 
         return state
         
@@ -0,0 +1,113 @@
+import unittest
+import tempfile
+import shutil
+
+import torch
+
+from pytorch_probing import Prober
+from pytorch_probing.prober import ActivationCache, CachedProber
+
+from .utils import TestModel, assert_tensor_almost_equal
+
+
+class TestActivationCache(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        super().tearDown()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_cache(self) -> None:
+        for directory in [None, self.directory]:
+            activations = {"a":torch.randn(4, 3), "b":[torch.randn(4, 2), torch.randn(4)],
+                           "c":{"hidden_states":torch.randn(4, 2), "attentions":None}}
+
+            with ActivationCache(directory=directory) as cache:
+                assert cache.put(torch.arange(4), activations)
+                assert len(cache) == 4
+                assert cache.contains([3, 0])
+                assert not cache.contains([3, 4])
+                assert cache.get([3, 4]) is None
+
+                result = cache.get([3, 0])
+                assert result is not None
+                assert_tensor_almost_equal(result["a"], activations["a"][[3, 0]])
+                assert_tensor_almost_equal(result["b"][0], activations["b"][0][[3, 0]])
+                assert_tensor_almost_equal(result["b"][1], activations["b"][1][[3, 0]])
+                assert_tensor_almost_equal(result["c"]["hidden_states"], activations["c"]["hidden_states"][[3, 0]])
+                assert result["c"]["attentions"] is None
+
+                with self.assertRaises(ValueError):
+                    cache.put([10, 11], activations)
+
+    def test_budget(self) -> None:
+        row_size = 3*4
+        cache = ActivationCache(max_bytes=5*row_size)
+
+        assert cache.put([0, 1, 2], {"a":torch.randn(3, 3)})
+        assert not cache.put([3, 4, 5], {"a":torch.randn(3, 3)})
+        assert cache.full
+        assert len(cache) == 3
+
+        # Only new samples are stored
+        assert cache.put([1, 2, 3, 4], {"a":torch.randn(4, 3)})
+        assert len(cache) == 5
+        assert cache.size == 5*row_size
+
+        cache.clear()
+        assert len(cache) == 0 and cache.size == 0
+
+    def test_cached_prober(self) -> None:
+        test_model = TestModel(2, 3, 1).eval()
+        probe = torch.nn.Linear(3, 1)
+        prober = Prober(test_model, {"relu":probe})
+
+        cached_prober = CachedProber(prober, ActivationCache())
+
+        inputs = torch.randn(8, 2)
+        expected = prober(inputs)[1]["relu"]
+
+        for _ in range(3):
+            for batch in range(2):
+                sample_ids = torch.arange(4)+batch*4
+                outputs = cached_prober(sample_ids, inputs[sample_ids])
+                assert_tensor_almost_equal(outputs["relu"], expected[sample_ids])
+
+        assert cached_prober.n_backbone_call == 2
+        assert cached_prober.n_cache_hit == 4
+        assert len(cached_prober.cache) == 8
+
+    def test_cached_prober_device(self) -> None:
+        class StructuredLayer(torch.nn.Module):
+            def __init__(self) -> None:
+                super().__init__()
+                self.linear = torch.nn.Linear(2, 3)
+
+            def forward(self, x):
+                return {"hidden_states":self.linear(x), "attentions":None}
+
+        class StructuredProbe(torch.nn.Module):
+            def __init__(self) -> None:
+                super().__init__()
+                self.linear = torch.nn.Linear(3, 1)
+
+            def forward(self, x):
+                assert x["attentions"] is None
+                return self.linear(x["hidden_states"])
+
+        model = torch.nn.Sequential(StructuredLayer()).eval()
+        prober = Prober(model, {"0":StructuredProbe()})
+        cached_prober = CachedProber(prober, ActivationCache(), device="cpu")
+
+        inputs = torch.randn(4, 2)
+        expected = prober(inputs)[1]["0"]
+
+        for _ in range(2):
+            outputs = cached_prober(torch.arange(4), inputs)
+            assert_tensor_almost_equal(outputs["0"], expected)
+
+        assert cached_prober.n_cache_hit == 1
@@ -0,0 +1,107 @@
+import unittest
+import math
+import shutil
+
+import torch
+from torch.utils.data import DataLoader
+
+from pytorch_probing import Interceptor, collect, CollectedDataset
+from pytorch_probing.analysis import LinearCKA
+
+from .utils import TestModel, TestDataset
+
+
+def gram_hsic(x:torch.Tensor, y:torch.Tensor, unbiased:bool) -> float:
+    k = x.double() @ x.double().T
+    l = y.double() @ y.double().T
+    n = k.shape[0]
+
+    if not unbiased:
+        h = torch.eye(n, dtype=torch.float64) - 1/n
+        return float(torch.trace(k @ h @ l @ h))/(n-1)**2
+
+    k.fill_diagonal_(0)
+    l.fill_diagonal_(0)
+    ones = torch.ones(n, dtype=torch.float64)
+    hsic = torch.trace(k @ l) + (ones @ k @ ones)*(ones @ l @ ones)/((n-1)*(n-2)) - 2*(ones @ k @ l @ ones)/(n-2)
+    return float(hsic)/(n*(n-3))
+
+def gram_cka(x:torch.Tensor, y:torch.Tensor, unbiased:bool) -> float:
+    return gram_hsic(x, y, unbiased)/math.sqrt(gram_hsic(x, x, unbiased)*gram_hsic(y, y, unbiased))
+
+class TestLinearCKA(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        torch.manual_seed(0)
+
+        self.x = torch.randn(60, 6)
+        self.activations = {"a":self.x,
+                            "b":torch.relu(self.x @ torch.randn(6, 4)),
+                            "c":torch.randn(60, 2, 3)}
+
+    def tearDown(self) -> None:
+        super().tearDown()
+
+        shutil.rmtree("dataset_cka", ignore_errors=True)
+
+    def test_streaming(self) -> None:
+        for unbiased in [True, False]:
+            cka = LinearCKA(unbiased=unbiased)
+            for batch in range(3):
+                cka.update({path:value[batch*20:(batch+1)*20] for path, value in self.activations.items()})
+
+            assert cka.n_sample == 60
+            assert cka.paths == ["a", "b", "c"]
+
+            matrix = cka.matrix()
+            for i, path_a in enumerate(cka.paths):
+                for j, path_b in enumerate(cka.paths):
+                    x = self.activations[path_a].reshape(60, -1)
+                    y = self.activations[path_b].reshape(60, -1)
+                    assert abs(cka.hsic(path_a, path_b)-gram_hsic(x, y, unbiased)) < 1e-8
+                    assert abs(matrix[i, j].item()-gram_cka(x, y, unbiased)) < 1e-8
+
+    def test_invariance(self) -> None:
+        rotation, _ = torch.linalg.qr(torch.randn(6, 6))
+
+        cka = LinearCKA(paths=["a", "rotated"])
+        cka.update({"a":self.x, "rotated":3*self.x @ rotation + 1, "ignored":self.x})
+
+        assert abs(cka.cka("a", "rotated")-1) < 1e-8
+        with self.assertRaises(ValueError):
+            cka.hsic("a", "ignored")
+        with self.assertRaises(ValueError):
+            cka.update({"a":self.x})
+
+    def test_random_features(self) -> None:
+        # Activations are approximately low rank
+        latent = torch.randn(500, 8)
+        x = latent @ torch.randn(8, 256)
+        y = torch.relu(latent @ torch.randn(8, 128))
+
+        exact = LinearCKA()
+        exact.update({"x":x, "y":y})
+        approximate = LinearCKA(n_random_feature=64)
+        approximate.update({"x":x, "y":y})
+
+        assert approximate._pairs[("x", "y")].xty.shape == (64, 64)
+        assert abs(approximate.cka("x", "y")-exact.cka("x", "y")) < 0.1
+
+        with self.assertRaises(ValueError):
+            LinearCKA(n_random_feature=0)
+
+    def test_sources(self) -> None:
+        model = TestModel(2, 3, 1, n_hidden=1).eval()
+        paths = ["linear1", "relu", "hidden_layers.0"]
+        dataloader = DataLoader(TestDataset(2, 1, 20), batch_size=6)
+
+        live = LinearCKA()
+        live.update_from_interceptor(Interceptor(model, paths), dataloader)
+
+        dataset = CollectedDataset(collect(model, paths, dataloader, "dataset_cka"))
+        collected = LinearCKA()
+        collected.update_from_dataset(dataset, batch_size=7)
+
+        assert live.n_sample == collected.n_sample == 20
+        assert torch.allclose(live.matrix(), collected.matrix())
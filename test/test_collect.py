@@ -3,6 +3,8 @@ import os
 import shutil
 import json
 import math
+import pickle
+import threading
 
 import torch
 from torch.utils.data import DataLoader
@@ -10,10 +12,26 @@ import numpy as np
 from numpy.testing import assert_array_almost_equal
 
 from pytorch_probing import collect, Interceptor, CollectedDataset
+from pytorch_probing.collect import CollectionCache, IterableCollectedDataset, SharedChunkCache, collect_in_background
+from pytorch_probing.collect import estimate_collection
 
 from .utils import TestModel, assert_tensor_almost_equal, TestDataset
 
 
+class GatedDataset(TestDataset):
+    __test__ = False
+
+    def __init__(self, x_size, y_size, len, gate_index, event) -> None:
+        super().__init__(x_size, y_size, len)
+
+        self._gate_index = gate_index
+        self._event = event
+
+    def __getitem__(self, idx:int):
+        if idx >= self._gate_index:
+            self._event.wait()
+        return super().__getitem__(idx)
+
 class TestCollect(unittest.TestCase):
     def setUp(self) -> None:
         super().setUp()
@@ -137,4 +155,498 @@ class TestCollect(unittest.TestCase):
             assert isinstance(dataset[0][i], torch.Tensor)
 
         dataset = CollectedDataset(dataset_path)
-        assert isinstance(dataset[0], dict)
\ No newline at end of file
+        assert isinstance(dataset[0], dict)
+
+    def test_collect_cache(self) -> None:
+        paths = ["linear1"]
+        cache_dir = os.path.join(self.save_path, "cache")
+
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               cache_dir=cache_dir)
+        assert os.path.dirname(dataset_path) == cache_dir
+
+        chunk_path = os.path.join(dataset_path, "0.pt")
+        modified_time = os.path.getmtime(chunk_path)
+
+        dataset_path2 = collect(self.test_model, paths, self.test_dataloader, 
+                               cache_dir=cache_dir)
+        assert dataset_path2 == dataset_path
+        assert os.path.getmtime(chunk_path) == modified_time
+
+        dataset_path3 = collect(self.test_model, paths, self.test_dataloader, 
+                               cache_dir=cache_dir, save_target=True)
+        assert dataset_path3 != dataset_path
+
+        with torch.no_grad():
+            self.test_model.linear1.weight.add_(1)
+        dataset_path4 = collect(self.test_model, paths, self.test_dataloader, 
+                               cache_dir=cache_dir)
+        assert dataset_path4 != dataset_path
+
+        dataset = CollectedDataset(dataset_path4)
+        assert len(dataset) == self.n_sample
+
+    def test_collect_cache_eviction(self) -> None:
+        paths = ["linear1"]
+        cache_dir = os.path.join(self.save_path, "cache_eviction")
+
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               cache_dir=cache_dir, data_fingerprint="a")
+        dataset_path2 = collect(self.test_model, paths, self.test_dataloader, 
+                                cache_dir=cache_dir, data_fingerprint="b")
+        assert os.path.exists(dataset_path)
+
+        cache = CollectionCache(cache_dir)
+        entry_size = cache.size() // 2
+
+        dataset_path3 = collect(self.test_model, paths, self.test_dataloader, 
+                                cache_dir=cache_dir, data_fingerprint="c",
+                                cache_max_bytes=2*entry_size)
+        
+        assert not os.path.exists(dataset_path)
+        assert os.path.exists(dataset_path2)
+        assert os.path.exists(dataset_path3)
+        assert len(cache.keys()) == 2
+
+    def test_iterable_dataset(self) -> None:
+        paths = ["linear1"]
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               self.save_path, "test_iterable_dataset", save_input=True)
+
+        dataset = CollectedDataset(dataset_path, get_input=True)
+        expected_inputs = [dataset[i][1][0].item() for i in range(len(dataset))]
+
+        unpickled_dataset = pickle.loads(pickle.dumps(dataset))
+        unpickled_dataset.refresh()
+        assert [unpickled_dataset[i][1][0].item() for i in range(len(dataset))] == expected_inputs
+
+        iterable_dataset = IterableCollectedDataset(dataset_path, get_input=True)
+        inputs = [sample[1][0].item() for sample in iterable_dataset]
+        assert inputs == expected_inputs
+
+        for sample, index in zip(iterable_dataset, range(len(dataset))):
+            assert_array_almost_equal(sample[0]["linear1"], dataset[index][0]["linear1"])
+
+        iterable_dataset = IterableCollectedDataset(dataset_path, get_input=True, 
+                                                    shuffle_buffer_size=8, shuffle_chunks=True)
+        inputs = [sample[1][0].item() for sample in iterable_dataset]
+        assert inputs != expected_inputs
+        assert sorted(inputs) == expected_inputs
+
+        iterable_dataset.set_epoch(1)
+        inputs2 = [sample[1][0].item() for sample in iterable_dataset]
+        assert inputs2 != inputs
+        assert sorted(inputs2) == expected_inputs
+
+    def test_iterable_dataset_sharding(self) -> None:
+        paths = ["linear1"]
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               self.save_path, "test_iterable_dataset_sharding", save_input=True)
+
+        expected_inputs = list(range(self.n_sample))
+
+        # Ranks read 12, 11 and 8 samples of the 4-sample chunks, balanced to the same count
+        for drop_last, rank_size in [(False, 12), (True, 8)]:
+            inputs = []
+            for rank in range(3):
+                iterable_dataset = IterableCollectedDataset(dataset_path, get_input=True, prefetch=0,
+                                                            rank=rank, world_size=3, drop_last=drop_last)
+                rank_inputs = [sample[1][0].item() for sample in iterable_dataset]
+                assert len(rank_inputs) == rank_size
+                inputs += rank_inputs
+
+            if drop_last:
+                assert len(set(inputs)) == len(inputs)
+            else:
+                assert sorted(set(inputs)) == expected_inputs
+
+        iterable_dataset = IterableCollectedDataset(dataset_path, get_input=True, shuffle_buffer_size=4)
+        dataloader = DataLoader(iterable_dataset, batch_size=None, num_workers=2)
+        inputs = [sample[1][0].item() for sample in dataloader]
+        assert sorted(inputs) == expected_inputs
+
+    def test_shared_chunk_cache(self) -> None:
+        paths = ["linear1"]
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               self.save_path, "test_shared_chunk_cache", save_input=True)
+
+        expected_dataset = CollectedDataset(dataset_path, get_input=True)
+
+        with SharedChunkCache(2**30) as chunk_cache:
+            dataset = CollectedDataset(dataset_path, get_input=True, chunk_cache=chunk_cache)
+
+            dataloader = DataLoader(dataset, batch_size=None, num_workers=2)
+            for index, sample in enumerate(dataloader):
+                assert_array_almost_equal(sample[0]["linear1"], expected_dataset[index][0]["linear1"])
+                assert_array_almost_equal(sample[1], expected_dataset[index][1])
+
+            assert len(os.listdir(chunk_cache.cache_dir)) >= self.n_batch
+
+            _ = dataset[0]
+            assert chunk_cache.n_reference(dataset._chunk_key(0)) == 1
+            _ = dataset[self.batch_size]
+            assert chunk_cache.n_reference(dataset._chunk_key(0)) == 0
+            assert chunk_cache.n_reference(dataset._chunk_key(1)) == 1
+
+            cache_dir = chunk_cache.cache_dir
+
+        assert not os.path.exists(cache_dir)
+
+    def test_shared_chunk_cache_eviction(self) -> None:
+        paths = ["linear1"]
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               self.save_path, "test_shared_chunk_cache_eviction")
+
+        with SharedChunkCache(1) as chunk_cache:
+            dataset = CollectedDataset(dataset_path, chunk_cache=chunk_cache)
+            
+            for index in range(len(dataset)):
+                _ = dataset[index]
+
+            chunk_files = [name for name in os.listdir(chunk_cache.cache_dir) if name.endswith(".pt")]
+            assert chunk_files == [dataset._chunk_key(self.n_batch-1)+".pt"]
+
+    def test_collect_in_background(self) -> None:
+        paths = ["linear1"]
+        event = threading.Event()
+        gated_dataset = GatedDataset(self.input_size, self.output_size, self.n_sample, 2*self.batch_size, event)
+        dataloader = DataLoader(gated_dataset, self.batch_size, shuffle=False)
+
+        job = collect_in_background(self.test_model, paths, dataloader, self.save_path, 
+                                    "test_background_dataset", save_input=True)
+        
+        try:
+            iterable_dataset = IterableCollectedDataset(job.dataset_path, get_input=True, follow=True,
+                                                        poll_interval=0.01, follow_timeout=10)
+            iterator = iter(iterable_dataset)
+
+            # Reads the first chunks while the collection is blocked
+            inputs = [next(iterator)[1][0].item() for _ in range(2*self.batch_size)]
+            assert not job.done
+            assert not CollectedDataset(job.dataset_path).complete
+        finally:
+            event.set()
+
+        inputs += [sample[1][0].item() for sample in iterator]
+        assert inputs == list(range(self.n_sample))
+
+        assert job.join(timeout=10) == job.dataset_path
+        assert CollectedDataset(job.dataset_path).complete
+
+        with self.assertRaises(ValueError):
+            collect_in_background(self.test_model, paths, self.test_dataloader, self.save_path, storage="unknown")
+        with self.assertRaises(ValueError):
+            collect_in_background(self.test_model, paths, self.test_dataloader, cache_dir=self.save_path)
+
+    def test_statistics(self) -> None:
+        paths = ["linear1", "relu"]
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               self.save_path, "test_statistics_dataset", compute_statistics=True)
+
+        dataset = CollectedDataset(dataset_path)
+        statistics = dataset.statistics
+        assert statistics is not None
+
+        for path in paths:
+            outputs = torch.stack([dataset[i][path] for i in range(len(dataset))]).double()
+
+            assert statistics.count(path) == self.n_sample
+            assert_tensor_almost_equal(statistics.mean(path), outputs.mean(0))
+            assert_tensor_almost_equal(statistics.std(path), outputs.std(0, unbiased=False))
+            assert_tensor_almost_equal(statistics.min(path), outputs.amin(0))
+            assert_tensor_almost_equal(statistics.max(path), outputs.amax(0))
+
+        normalized_dataset = CollectedDataset(dataset_path, normalize=True)
+        outputs = torch.stack([normalized_dataset[i]["linear1"] for i in range(len(dataset))])
+        assert_tensor_almost_equal(outputs.mean(0), torch.zeros(self.hidden_size))
+        assert_tensor_almost_equal(outputs.std(0, unbiased=False), torch.ones(self.hidden_size))
+
+        batch = normalized_dataset.get_batch([0, 5])
+        assert_tensor_almost_equal(batch["linear1"], outputs[[0, 5]])
+
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, 
+                               self.save_path, "test_no_statistics_dataset")
+        assert CollectedDataset(dataset_path).statistics is None
+        with self.assertRaises(ValueError):
+            CollectedDataset(dataset_path, normalize=True)
+
+    def test_shuffle_on_write(self) -> None:
+        paths = ["linear1"]
+        shuffle_buffer = 3
+
+        for storage in ["torch", "memmap"]:
+            dataset_path = collect(self.test_model, paths, self.test_dataloader, self.save_path, 
+                                   f"test_shuffled_{storage}_dataset", save_input=True, storage=storage,
+                                   shuffle_buffer=shuffle_buffer, shuffle_seed=1)
+            dataset = CollectedDataset(dataset_path, get_input=True)
+
+            assert dataset.shuffled
+            assert dataset.n_chunk == self.n_batch
+            assert dataset._info["chunk_sizes"] == [len(batch[0]) for batch in self.test_dataloader]
+
+            original_indices = dataset.original_indices()
+            assert sorted(original_indices.tolist()) == list(range(self.n_sample))
+            assert original_indices.tolist() != list(range(self.n_sample))
+
+            buffer_size = shuffle_buffer*self.batch_size
+            for index in range(self.n_sample):
+                assert dataset[index][1][0].item() == original_indices[index].item()
+                assert index // buffer_size == original_indices[index].item() // buffer_size
+
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, self.save_path, 
+                               "test_shuffled_same_seed_dataset", shuffle_buffer=shuffle_buffer, shuffle_seed=1)
+        assert CollectedDataset(dataset_path).original_indices().tolist() == original_indices.tolist()
+
+        dataset = CollectedDataset(collect(self.test_model, paths, self.test_dataloader, 
+                                           self.save_path, "test_not_shuffled_dataset"))
+        assert not dataset.shuffled
+        assert dataset.original_indices().tolist() == list(range(self.n_sample))
+
+        with self.assertRaises(ValueError):
+            collect(self.test_model, paths, self.test_dataloader, self.save_path, shuffle_buffer=-1)
+
+    def test_estimate_collection(self) -> None:
+        paths = ["linear1", "relu"]
+        estimate = estimate_collection(self.test_model, paths, self.test_dataloader, save_input=True, 
+                                       storage="memmap", n_batch=2)
+
+        assert estimate.path_shapes == {"linear1":(self.hidden_size,), "relu":(self.hidden_size,)}
+        assert estimate.path_dtypes == {"linear1":"float32", "relu":"float32"}
+        assert estimate.path_bytes == {"linear1":4*self.hidden_size, "relu":4*self.hidden_size}
+        assert estimate.n_sample == self.n_sample
+        assert estimate.n_chunk == self.n_batch
+        assert estimate.sample_bytes == 4*(2*self.hidden_size+self.input_size)
+        assert estimate.total_seconds is not None and estimate.total_seconds > 0
+        assert "linear1" in str(estimate)
+
+        dataset_path = collect(self.test_model, paths, self.test_dataloader, self.save_path, 
+                               "test_estimated_dataset", save_input=True, storage="memmap")
+        data_bytes = sum(os.path.getsize(os.path.join(dataset_path, name)) for name in os.listdir(dataset_path)
+                         if name.endswith(".bin"))
+        assert data_bytes == estimate.sample_bytes*self.n_sample
+
+        estimate = estimate_collection(self.test_model, paths, self.test_dataloader, storage="torch")
+        assert estimate.sample_bytes > 4*2*self.hidden_size
+
+        with self.assertRaises(ValueError):
+            estimate_collection(self.test_model, paths, self.test_dataloader, storage="unknown")
+
+    def test_execution_options(self) -> None:
+        paths = ["linear1"]
+        num_threads = torch.get_num_threads()
+
+        reference = CollectedDataset(collect(self.test_model, paths, self.test_dataloader, 
+                                             self.save_path, "test_full_precision_dataset"))
+
+        for storage in ["torch", "memmap"]:
+            dataset_path = collect(self.test_model, paths, self.test_dataloader, self.save_path, 
+                                   f"test_fast_{storage}_dataset", storage=storage, inference_mode=True, 
+                                   autocast_dtype=torch.bfloat16, num_threads=1)
+            dataset = CollectedDataset(dataset_path)
+
+            assert torch.get_num_threads() == num_threads
+            assert dataset._info["execution"]["inference_mode"]
+            assert dataset._info["execution"]["autocast_dtype"] == "bfloat16"
+            assert dataset._info["execution"]["num_threads"] == 1
+
+            for index in range(len(dataset)):
+                assert dataset[index]["linear1"].dtype == torch.bfloat16
+                assert_tensor_almost_equal(dataset[index]["linear1"].float(), reference[index]["linear1"], 1)
+
+        conv_model = torch.nn.Sequential(torch.nn.Conv2d(1, 2, 3), torch.nn.ReLU()).eval()
+        dataloader = DataLoader(TestDataset((1, 5, 5), 1, 6), 3)
+        dataset_path = collect(conv_model, ["0"], dataloader, self.save_path, 
+                               "test_channels_last_dataset", channels_last=True)
+        dataset = CollectedDataset(dataset_path)
+
+        assert dataset._info["execution"]["channels_last"]
+        assert conv_model[0].weight.is_contiguous()
+        with torch.no_grad():
+            assert_tensor_almost_equal(dataset[4]["0"], conv_model[0](torch.full((1, 1, 5, 5), 4.0))[0, ...].detach())
+
+        with self.assertRaises(ValueError):
+            collect(self.test_model, paths, self.test_dataloader, self.save_path, autocast_dtype="float64")
+        with self.assertRaises(ValueError):
+            collect(self.test_model, paths, self.test_dataloader, self.save_path, num_threads=0)
+
+    def test_aliases(self) -> None:
+        model = torch.nn.Sequential(torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.ReLU()), torch.nn.Identity())
+        paths = ["0.1", "0", "1", "0.0"]
+
+        dataset_path = collect(model, paths, self.test_dataloader, self.save_path, 
+                               "test_aliases_dataset", storage="memmap", detect_aliases=True)
+        dataset = CollectedDataset(dataset_path)
+
+        assert dataset.aliases == {"0":"0.1", "1":"0.1"}
+        assert len(dataset._info["storage_info"]["leaves"]) == 2
+
+        reference = CollectedDataset(collect(model, ["0.1", "0.0"], self.test_dataloader, 
+                                             self.save_path, "test_no_aliases_dataset"))
+        for index in range(len(dataset)):
+            item = dataset[index]
+            assert list(item.keys()) == paths
+            for path in paths:
+                assert_tensor_almost_equal(item[path], reference[index][dataset.aliases.get(path, path)])
+
+        batch = dataset.get_batch([1, 2])
+        assert_tensor_almost_equal(batch["1"], batch["0.1"])
+
+        # Without 'detect_aliases', all the paths are stored
+        dataset_path = collect(model, paths, self.test_dataloader, self.save_path, 
+                               "test_aliases_disabled_dataset", storage="memmap")
+        assert CollectedDataset(dataset_path).aliases == {}
+
+        class LastBatchCopy(torch.nn.Module):
+            def forward(self, x):
+                return x.clone() if len(x) != 4 else x
+
+        # The last batch has 3 samples, breaking the alias of the first batches
+        model = torch.nn.Sequential(torch.nn.Linear(2, 3), LastBatchCopy())
+        for shuffle_buffer in [0, 2]:
+            with self.assertRaises(ValueError):
+                collect(model, ["0", "1"], self.test_dataloader, self.save_path, detect_aliases=True,
+                        shuffle_buffer=shuffle_buffer)
+
+    def test_ragged(self) -> None:
+        lengths = torch.tensor([3, 1, 4, 2, 4, 1, 2])
+        x = torch.randn(len(lengths), 4, self.input_size)
+        x[torch.arange(4).unsqueeze(0) >= lengths.unsqueeze(1)] = 0
+        dataloader = DataLoader(torch.utils.data.TensorDataset(x, torch.zeros(len(lengths))), 3)
+
+        model = torch.nn.Sequential(torch.nn.Linear(self.input_size, self.hidden_size), torch.nn.ReLU())
+        def sequence_mask(batch:torch.Tensor) -> torch.Tensor:
+            return batch.abs().sum(dim=-1) != 0
+
+        dataset_path = collect(model, ["0", "1"], dataloader, self.save_path, "test_ragged_dataset",
+                               sequence_mask=sequence_mask, ragged_paths=["0"], compute_statistics=True)
+        dataset = CollectedDataset(dataset_path)
+
+        assert dataset.ragged_paths == ["0"]
+        assert dataset.statistics is not None
+        assert dataset.statistics.count("0") == int(lengths.sum())
+
+        for index in range(len(dataset)):
+            item = dataset[index]
+            assert list(item.keys()) == ["0", "1"]
+            assert_tensor_almost_equal(item["0"], model[0](x[index, :lengths[index]]))
+            assert_tensor_almost_equal(item["1"], model(x[index]))
+
+        batch = dataset.get_batch([4, 1, 3])
+        assert batch["0"].shape == (3, 4, self.hidden_size)
+        for position, index in enumerate([4, 1, 3]):
+            assert_tensor_almost_equal(batch["0"][position, :lengths[index]], model[0](x[index, :lengths[index]]))
+            assert (batch["0"][position, lengths[index]:] == 0).all()
+        assert (dataset.get_lengths([4, 1, 3])["0"] == lengths[[4, 1, 3]]).all()
+
+        sequences = dataset.get_batch([4, 1], pad_ragged=False)["0"]
+        assert [len(sequence) for sequence in sequences] == [4, 1]
+
+        normalized = CollectedDataset(dataset_path, normalize=True).get_batch([0, 1])
+        assert (normalized["0"][1, 1:] == 0).all()
+
+        iterated = list(IterableCollectedDataset(dataset_path))
+        assert len(iterated) == len(lengths)
+        assert_tensor_almost_equal(iterated[2]["0"], dataset[2]["0"])
+
+        with self.assertRaises(ValueError):
+            collect(model, ["0"], dataloader, self.save_path, storage="memmap", sequence_mask=sequence_mask)
+        with self.assertRaises(ValueError):
+            collect(model, ["0"], dataloader, self.save_path, shuffle_buffer=2, sequence_mask=sequence_mask)
+        with self.assertRaises(ValueError):
+            collect(model, ["0"], dataloader, self.save_path, ragged_paths=["0"])
+
+    def test_sparse(self) -> None:
+        model = torch.nn.Sequential(torch.nn.Linear(self.input_size, 8), torch.nn.ReLU(), torch.nn.Linear(8, 8))
+        paths = ["1", "2"]
+
+        dataset_path = collect(model, paths, self.test_dataloader, self.save_path, "test_sparse_dataset",
+                               sparse={"1":"csr", "2":3}, compute_statistics=True)
+        dataset = CollectedDataset(dataset_path)
+        reference = CollectedDataset(collect(model, paths, self.test_dataloader, self.save_path, 
+                                             "test_sparse_reference_dataset", compute_statistics=True))
+
+        assert dataset.sparse["1"] == {"encoding":"csr", "k":None, "shape":[8]}
+        assert dataset.statistics is not None and reference.statistics is not None
+        assert_tensor_almost_equal(dataset.statistics.mean("2"), reference.statistics.mean("2"))
+
+        for index in range(len(dataset)):
+            item = dataset[index]
+            expected = reference[index]
+            assert list(item.keys()) == paths
+            assert_tensor_almost_equal(item["1"], expected["1"])
+
+            topk = expected["2"].abs().topk(3).indices
+            assert_tensor_almost_equal(item["2"][topk], expected["2"][topk])
+            assert (item["2"] != 0).sum() <= 3
+
+        batch = dataset.get_batch([5, 0, 9])
+        assert_tensor_almost_equal(batch["1"], reference.get_batch([5, 0, 9])["1"])
+        assert batch["2"].shape == (3, 8)
+
+        sparse_dataset = CollectedDataset(dataset_path, sparse_format="sparse")
+        assert sparse_dataset[3]["1"].is_sparse
+        assert_tensor_almost_equal(sparse_dataset.get_batch([5, 0, 9])["2"].to_dense(), batch["2"])
+
+        memmap_path = collect(model, paths, self.test_dataloader, self.save_path, "test_sparse_memmap_dataset",
+                              storage="memmap", sparse={"2":3})
+        assert_tensor_almost_equal(CollectedDataset(memmap_path)[4]["2"], dataset[4]["2"])
+
+        with self.assertRaises(ValueError):
+            collect(model, paths, self.test_dataloader, self.save_path, storage="memmap", sparse={"1":"csr"})
+        with self.assertRaises(ValueError):
+            collect(model, paths, self.test_dataloader, self.save_path, sparse={"1":"coo"})
+        with self.assertRaises(ValueError):
+            CollectedDataset(dataset_path, normalize=True, sparse_format="sparse")
+
+    def test_none_fields(self) -> None:
+        class StructuredLayer(torch.nn.Module):
+            def __init__(self, input_size:int) -> None:
+                super().__init__()
+                self.linear = torch.nn.Linear(input_size, 3)
+
+            def forward(self, x):
+                return {"hidden_states":self.linear(x), "attentions":None}
+
+        model = torch.nn.Sequential(StructuredLayer(self.input_size))
+        expected = model[0].linear(torch.stack([self.test_dataset[index][0] for index in [7, 2]])).detach()
+
+        for storage in ["torch", "append", "memmap"]:
+            dataset_path = collect(model, ["0"], self.test_dataloader, self.save_path, 
+                                   f"test_none_{storage}_dataset", storage=storage)
+            dataset = CollectedDataset(dataset_path)
+
+            assert len(dataset) == self.n_sample
+            item = dataset[7]["0"]
+            assert item["attentions"] is None
+            assert_tensor_almost_equal(item["hidden_states"], expected[0])
+
+            batch = dataset.get_batch([7, 2])["0"]
+            assert batch["attentions"] is None
+            assert_tensor_almost_equal(batch["hidden_states"], expected)
+
+    def test_collect_cache_sequence_mask(self) -> None:
+        x = torch.randn(6, 4, self.input_size)
+        dataloader = DataLoader(torch.utils.data.TensorDataset(x, torch.zeros(6)), 3)
+        model = torch.nn.Sequential(torch.nn.Linear(self.input_size, self.hidden_size))
+        cache_dir = os.path.join(self.save_path, "cache_sequence_mask")
+
+        def make_mask(length:int):
+            return lambda batch: torch.full((len(batch),), length)
+
+        dataset_path = collect(model, ["0"], dataloader, cache_dir=cache_dir, data_fingerprint="a",
+                               sequence_mask=make_mask(2))
+        assert collect(model, ["0"], dataloader, cache_dir=cache_dir, data_fingerprint="a",
+                       sequence_mask=make_mask(2)) == dataset_path
+
+        # Masks with the same name, but different constants or captured values
+        other_paths = [collect(model, ["0"], dataloader, cache_dir=cache_dir, data_fingerprint="a",
+                               sequence_mask=mask) for mask in [make_mask(3), lambda batch: torch.full((len(batch),), 1)]]
+        assert len({dataset_path, *other_paths}) == 3
+        assert CollectedDataset(other_paths[0])[0]["0"].shape == (3, self.hidden_size)
+
+        class Mask:
+            def __call__(self, batch):
+                return torch.full((len(batch),), 2)
+
+        with self.assertRaises(ValueError):
+            collect(model, ["0"], dataloader, cache_dir=cache_dir, data_fingerprint="a", sequence_mask=Mask())
@@ -1,11 +1,17 @@
 import unittest
 import pprint
 import os
+import collections
+import dataclasses
+from typing import Optional
 
 
 import torch
 
 from pytorch_probing import Interceptor
+from pytorch_probing.interceptor import EveryKSampler, BernoulliSampler, PredicateSampler
+from pytorch_probing.interceptor import path_pattern
+from pytorch_probing.interceptor.path_pattern import resolve_paths
 
 from .utils import TestModel, assert_tensor_almost_equal
 
@@ -134,4 +140,252 @@ class TestInterceptor(unittest.TestCase):
         intercepted_model2.eval()
 
         assert intercepted_model2.outputs["linear1"] is None
-        assert intercepted_model2.outputs["hidden_layers.1"] is None
\ No newline at end of file
+        assert intercepted_model2.outputs["hidden_layers.1"] is None
+
+    def test_patterns(self) -> None:
+        inputs = torch.randn([10, self.input_size])
+
+        paths = ["linear1", "hidden_layers.*"]
+        with Interceptor(self.test_model, paths) as intercepted_model:
+            assert intercepted_model.intercept_paths == ["linear1", "hidden_layers.0", "hidden_layers.1",
+                                                          "hidden_layers.2", "hidden_layers.3"]
+            intercepted_model(inputs)
+            assert_tensor_almost_equal(intercepted_model.outputs["hidden_layers.3"], 
+                                       intercepted_model.outputs["hidden_layers.2"].relu())
+
+        paths = ["re:linear[0-9]", "**.1"]
+        with Interceptor(self.test_model, paths) as intercepted_model:
+            assert intercepted_model.intercept_paths == ["linear1", "linear2", "hidden_layers.1"]
+
+        with self.assertRaises(ValueError):
+            Interceptor(self.test_model, ["*.10"])
+
+        model_string = pprint.pformat(self.test_model)
+        assert "Interceptor" not in model_string
+
+    def test_pattern_cache(self) -> None:
+        other_model = TestModel(self.input_size, self.hidden_size, self.output_size, n_hidden=1)
+
+        deeper_model = TestModel(self.input_size, self.hidden_size, self.output_size, n_hidden=3)
+
+        with Interceptor(self.test_model, ["hidden_layers.*"]) as intercepted_model:
+            assert len(intercepted_model.intercept_paths) == 4
+        with Interceptor(other_model, ["hidden_layers.*"]) as intercepted_model:
+            assert len(intercepted_model.intercept_paths) == 2
+        with Interceptor(deeper_model, ["hidden_layers.*"]) as intercepted_model:
+            assert len(intercepted_model.intercept_paths) == 6
+
+        paths = resolve_paths(other_model, ["hidden_layers.*"])
+        assert resolve_paths(other_model, ["hidden_layers.*"]) == paths
+        other_model.hidden_layers.append(torch.nn.Linear(self.hidden_size, self.hidden_size))
+        assert resolve_paths(other_model, ["hidden_layers.*"]) == paths + ["hidden_layers.2"]
+
+        for i in range(2*path_pattern._PATH_CACHE_SIZE):
+            resolve_paths(other_model, ["hidden_layers.*", f"linear{i}"])
+        assert len(path_pattern._path_cache[other_model]) == path_pattern._PATH_CACHE_SIZE
+
+    def test_nested_paths(self) -> None:
+        inputs = torch.randn([10, self.input_size])
+        expected = self.test_model.hidden_layers(self.test_model.relu(self.test_model.linear1(inputs)))
+
+        for paths in [["hidden_layers", "hidden_layers.3"], ["hidden_layers.3", "hidden_layers"]]:
+            with Interceptor(self.test_model, paths) as intercepted_model:
+                intercepted_model(inputs)
+                assert_tensor_almost_equal(intercepted_model.outputs["hidden_layers"], expected)
+                assert_tensor_almost_equal(intercepted_model.outputs["hidden_layers.3"], expected)
+
+            model_string = pprint.pformat(self.test_model)
+            assert "Interceptor" not in model_string
+
+    def test_sampler(self) -> None:
+        inputs = torch.randn([10, self.input_size])
+        expected = self.test_model.linear1(inputs)
+
+        sampler = EveryKSampler(2)
+        with Interceptor(self.test_model, ["linear1", "linear2"], sampler=sampler) as intercepted_model:
+            for i in range(4):
+                outputs = intercepted_model(inputs)
+                assert_tensor_almost_equal(outputs, self.test_model(inputs))
+
+                if i % 2 == 0:
+                    assert_tensor_almost_equal(intercepted_model.outputs["linear1"], expected)
+                    assert intercepted_model.outputs["linear2"] is not None
+                else:
+                    assert intercepted_model.sample_decision is None
+                    assert intercepted_model.outputs["linear1"] is None
+                    assert intercepted_model.outputs["linear2"] is None
+
+        assert sampler.n_call == 4
+        assert sampler.call_rate == 0.5
+
+        # Alternating signs in the first feature, so the predicate selects the even samples
+        predicate_inputs = inputs.clone()
+        predicate_inputs[:, 0] = torch.tensor([1.0, -1.0]).repeat(5)
+        predicate_expected = self.test_model.linear1(predicate_inputs)
+
+        sampler = PredicateSampler(lambda x: x[:, 0] > 0)
+        with Interceptor(self.test_model, ["linear1"], sampler=sampler) as intercepted_model:
+            intercepted_model(predicate_inputs)
+            assert_tensor_almost_equal(intercepted_model.outputs["linear1"], predicate_expected[0::2])
+            assert sampler.sample_rate == 0.5
+
+        sampler = BernoulliSampler(0.5, per_sample=True, seed=0)
+        with Interceptor(self.test_model, ["linear1"], sampler=sampler) as intercepted_model:
+            for _ in range(50):
+                intercepted_model(inputs)
+        assert 0.3 < sampler.sample_rate < 0.7
+
+        with self.assertRaises(ValueError):
+            EveryKSampler(0)
+        with self.assertRaises(ValueError):
+            EveryKSampler(2, offset=2)
+        with self.assertRaises(ValueError):
+            EveryKSampler(2, offset=-1)
+
+        class Transpose(torch.nn.Module):
+            def forward(self, x:torch.Tensor) -> torch.Tensor:
+                return x.T
+
+        # Batch first input, but batch last output
+        transposed_model = torch.nn.Sequential(torch.nn.Linear(self.input_size, 2), Transpose())
+        sampler = PredicateSampler(lambda x: torch.arange(len(x)) >= 5)
+        with Interceptor(transposed_model, ["1"], sampler=sampler) as intercepted_model:
+            with self.assertRaises(ValueError):
+                intercepted_model(inputs)
+
+    def test_resume(self) -> None:
+        inputs = torch.randn([10, self.input_size])
+        expected = self.test_model(inputs)
+
+        hidden = self.test_model.relu(self.test_model.linear1(inputs))
+        hidden_2 = self.test_model.hidden_layers[:3](hidden)
+
+        with Interceptor(self.test_model, ["hidden_layers.3", "linear2"]) as intercepted_model:
+            # torch.fx path
+            assert_tensor_almost_equal(intercepted_model.resume("relu", hidden), expected)
+            assert_tensor_almost_equal(intercepted_model.outputs["linear2"], expected)
+            assert_tensor_almost_equal(intercepted_model.resume("hidden_layers.2", hidden_2), expected)
+
+            with self.assertRaises(ValueError):
+                intercepted_model.resume("relu", hidden, inputs, inputs)
+
+        sequential = torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.Sequential(torch.nn.ReLU(), torch.nn.Linear(3, 3)),
+                                         torch.nn.Linear(3, 1))
+        expected = sequential(inputs)
+        activation = sequential[1][0](sequential[0](inputs))
+        expected_1 = sequential[1][1](activation)
+
+        with Interceptor(sequential, ["1", "1.1"]) as intercepted_model:
+            assert_tensor_almost_equal(intercepted_model.resume("1.0", activation), expected)
+            assert_tensor_almost_equal(intercepted_model.outputs["1.1"], expected_1)
+
+        with Interceptor(sequential, ["0", "1.1"]) as intercepted_model:
+            intercepted_model(inputs)
+            assert intercepted_model.outputs["0"] is not None
+
+            intercepted_model.resume("1.0", activation)
+            assert intercepted_model.outputs["0"] is None
+            assert_tensor_almost_equal(intercepted_model.outputs["1.1"], expected_1)
+
+    def test_resume_skip(self) -> None:
+        class SkipModel(torch.nn.Module):
+            def __init__(self) -> None:
+                super().__init__()
+                self.linear1 = torch.nn.Linear(2, 2)
+                self.linear2 = torch.nn.Linear(2, 2)
+
+            def forward(self, x):
+                return self.linear2(self.linear1(x)) + x
+
+        model = SkipModel()
+        inputs = torch.randn([10, 2])
+        expected = model(inputs)
+        activation = model.linear1(inputs)
+
+        with Interceptor(model, ["linear2"]) as intercepted_model:
+            with self.assertRaises(ValueError):
+                intercepted_model.resume("linear1", activation)
+
+            assert_tensor_almost_equal(intercepted_model.resume("linear1", activation, inputs), expected)
+
+    def test_selector(self) -> None:
+        class Output(collections.OrderedDict):
+            pass
+
+        @dataclasses.dataclass
+        class Attention:
+            weights: torch.Tensor
+            mask: Optional[torch.Tensor] = None
+
+        class StructuredLayer(torch.nn.Module):
+            def __init__(self) -> None:
+                super().__init__()
+                self.linear = torch.nn.Linear(2, 2)
+
+            def forward(self, x):
+                if isinstance(x, Output):
+                    x = x["hidden_states"]
+                hidden_states = self.linear(x)
+                return Output(hidden_states=hidden_states, attentions=(Attention(hidden_states.sigmoid()), x))
+
+        model = torch.nn.Sequential(StructuredLayer(), StructuredLayer())
+        inputs = torch.randn([10, 2])
+        hidden_states = model[0].linear(inputs)
+
+        paths = ["*:hidden_states", "0:attentions.0.weights", "0:1.1", "1"]
+        with Interceptor(model, paths) as intercepted_model:
+            assert intercepted_model.intercept_paths == ["0:hidden_states", "1:hidden_states", "0:attentions.0.weights",
+                                                          "0:1.1", "1"]
+            intercepted_model(inputs)
+            outputs = intercepted_model.outputs
+
+            assert_tensor_almost_equal(outputs["0:hidden_states"], hidden_states)
+            assert_tensor_almost_equal(outputs["0:attentions.0.weights"], hidden_states.sigmoid())
+            assert_tensor_almost_equal(outputs["0:1.1"], inputs)
+            assert_tensor_almost_equal(outputs["1"]["hidden_states"], outputs["1:hidden_states"])
+            assert_tensor_almost_equal(outputs["1"]["attentions"][0]["weights"], outputs["1:hidden_states"].sigmoid())
+            assert outputs["1"]["attentions"][0]["mask"] is None
+
+            with self.assertRaises(ValueError):
+                intercepted_model.resume("0:hidden_states", hidden_states)
+
+        assert isinstance(model[0], StructuredLayer)
+
+        with Interceptor(model, ["0:missing"]) as intercepted_model:
+            with self.assertRaises(ValueError):
+                intercepted_model(inputs)
+
+    def test_aliases(self) -> None:
+        model = torch.nn.Sequential(torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.ReLU()), torch.nn.Identity())
+        inputs = torch.randn([10, 2])
+
+        with Interceptor(model, ["0.1", "0", "1", "0.0"]) as intercepted_model:
+            intercepted_model(inputs)
+            outputs = intercepted_model.outputs
+
+            assert intercepted_model.aliases == {}
+            assert outputs["0"] is not outputs["0.1"]
+
+        with Interceptor(model, ["0.1", "0", "1", "0.0"], detect_aliases=True) as intercepted_model:
+            intercepted_model(inputs)
+            outputs = intercepted_model.outputs
+
+            assert intercepted_model.aliases == {"0":"0.1", "1":"0.1"}
+            assert outputs["0"] is outputs["0.1"] and outputs["1"] is outputs["0.1"]
+            assert_tensor_almost_equal(outputs["0.1"], outputs["0.0"].relu())
+
+        inplace_model = torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.ReLU(inplace=True))
+        with Interceptor(inplace_model, ["0", "1"], detect_aliases=True) as intercepted_model:
+            intercepted_model(inputs)
+            outputs = intercepted_model.outputs
+
+            assert intercepted_model.aliases == {}
+            assert_tensor_almost_equal(outputs["0"], inplace_model[0](inputs))
+            assert_tensor_almost_equal(outputs["1"], outputs["0"].relu())
+
+        with Interceptor(model, ["0.1", "0"], detect_aliases=True) as intercepted_model:
+            with torch.inference_mode():
+                intercepted_model(inputs)
+
+            assert intercepted_model.aliases == {}
+            assert intercepted_model.outputs["0"] is not intercepted_model.outputs["0.1"]
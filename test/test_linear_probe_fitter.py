@@ -0,0 +1,117 @@
+import unittest
+import shutil
+
+import torch
+from torch.utils.data import DataLoader
+
+from pytorch_probing import Interceptor, Prober, collect, CollectedDataset
+from pytorch_probing.prober import LinearProbeFitter
+
+from .utils import TestModel, TestDataset, assert_tensor_almost_equal
+
+
+class TestLinearProbeFitter(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        torch.manual_seed(0)
+
+        self.input_size = 2
+        self.hidden_size = 3
+        self.output_size = 1
+
+        self.test_model = TestModel(self.input_size, self.hidden_size,
+                                     self.output_size, n_hidden=0)
+        self.test_model = self.test_model.eval()
+
+    def tearDown(self) -> None:
+        super().tearDown()
+    
+        self.test_model = None
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree("dataset_fitter", ignore_errors=True)
+
+    def test_ridge(self) -> None:
+        x = torch.randn(200, 4)
+        weight = torch.randn(4, 2)
+        y = x @ weight + 0.5
+
+        fitter = LinearProbeFitter()
+        for batch in range(4):
+            fitter.update({"a":x[batch*50:(batch+1)*50]}, y[batch*50:(batch+1)*50])
+        
+        assert fitter.n_sample == 200
+
+        probe = fitter.fit(0.0)["a"]
+        assert isinstance(probe, torch.nn.Linear)
+        assert_tensor_almost_equal(probe.weight, weight.T, 4)
+        assert_tensor_almost_equal(probe.bias, torch.full([2], 0.5), 4)
+
+        x_centered = x - x.mean(0)
+        alpha = 10.0
+        expected = torch.linalg.solve(x_centered.T @ x_centered + alpha*torch.eye(4), x_centered.T @ (y - y.mean(0)))
+        grid = fitter.fit_grid([0.0, alpha])
+        assert_tensor_almost_equal(grid[alpha]["a"].weight, expected.T, 4)
+
+        probes = fitter.select([0.0, 1.0, 1000.0])
+        assert fitter.selected_alphas["a"] == 0.0
+        assert_tensor_almost_equal(probes["a"].weight, weight.T, 4)
+
+        with self.assertRaises(ValueError):
+            fitter.fit(-1.0)
+        with self.assertRaises(ValueError):
+            fitter.select([1.0, -1.0])
+
+        # Duplicated feature, with a singular covariance
+        x_singular = torch.cat([x, x[:, :1]], 1)
+        fitter = LinearProbeFitter()
+        fitter.update({"a":x_singular}, y)
+        probe = fitter.fit(0.0)["a"]
+
+        x_centered = (x_singular - x_singular.mean(0)).double()
+        expected = torch.linalg.pinv(x_centered) @ (y - y.mean(0)).double()
+        assert_tensor_almost_equal(probe.weight, expected.T.float(), 4)
+
+    def test_lda(self) -> None:
+        n_class = 3
+        labels = torch.arange(300) % n_class
+        means = torch.tensor([[0.0, 0.0], [5.0, 0.0], [0.0, 5.0]])
+        x = means[labels] + 0.5*torch.randn(300, 2)
+
+        fitter = LinearProbeFitter("lda", n_class=n_class)
+        fitter.update({"a":x}, labels)
+
+        probe = fitter.fit(1e-3)["a"]
+        accuracy = (probe(x).argmax(1) == labels).float().mean()
+        assert accuracy > 0.95
+
+        with self.assertRaises(ValueError):
+            LinearProbeFitter("lda")
+
+    def test_interceptor_and_dataset(self) -> None:
+        dataset = TestDataset(self.input_size, 1, 24)
+        dataloader = DataLoader(dataset, batch_size=8)
+        paths = ["linear1", "relu"]
+
+        fitter = LinearProbeFitter()
+        with Interceptor(self.test_model, paths) as interceptor:
+            fitter.update_from_interceptor(interceptor, dataloader)
+
+        dataset_path = collect(self.test_model, paths, dataloader, "dataset_fitter", "fitter", save_target=True)
+        collected_dataset = CollectedDataset(dataset_path, get_target=True)
+
+        fitter2 = LinearProbeFitter()
+        fitter2.update_from_dataset(collected_dataset, batch_size=7)
+
+        probes = fitter.fit(1.0)
+        probes2 = fitter2.fit(1.0)
+        for path in paths:
+            assert_tensor_almost_equal(probes[path].weight, probes2[path].weight, 4)
+
+        prober = Prober(self.test_model, probes)
+        x, y = next(iter(dataloader))
+        _, outputs = prober(x)
+        assert set(outputs.keys()) == set(paths)
+        assert outputs["linear1"].shape == y.shape
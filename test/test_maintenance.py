@@ -0,0 +1,160 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import torch
+from torch.utils.data import DataLoader
+
+from pytorch_probing import collect, CollectedDataset
+from pytorch_probing.collect import transform_datasets
+from pytorch_probing.collect.maintenance import rechunk, convert, merge, main
+
+from .utils import TestModel, TestDataset, assert_tensor_almost_equal
+
+
+class TestMaintenance(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.test_model = TestModel(2, 3, 1).eval()
+        self.n_sample = 10
+        self.test_dataloader = DataLoader(TestDataset(2, 1, self.n_sample), batch_size=3)
+
+        self.save_path = tempfile.mkdtemp()
+        self.dataset_path = collect(self.test_model, ["linear1", "relu"], self.test_dataloader, self.save_path,
+                                    "input", save_input=True, compute_statistics=True)
+
+    def tearDown(self) -> None:
+        super().tearDown()
+
+        shutil.rmtree(self.save_path, ignore_errors=True)
+
+    def assert_same_samples(self, dataset:CollectedDataset, reference:CollectedDataset, offset:int=0) -> None:
+        for index in range(len(reference)):
+            item = dataset[index+offset]
+            expected = reference[index]
+            for path in item[0]:
+                assert_tensor_almost_equal(item[0][path], expected[0][path])
+            assert_tensor_almost_equal(item[1], expected[1])
+
+    def test_rechunk(self) -> None:
+        reference = CollectedDataset(self.dataset_path, get_input=True)
+
+        for num_workers in [0, 2]:
+            output_path = rechunk(self.dataset_path, os.path.join(self.save_path, f"rechunk{num_workers}"), 4,
+                                  num_workers=num_workers)
+            dataset = CollectedDataset(output_path, get_input=True)
+
+            assert dataset.n_chunk == 3
+            assert dataset._info["chunk_sizes"] == [4, 4, 2]
+            assert dataset.complete
+            self.assert_same_samples(dataset, reference)
+
+    def test_convert_and_drop(self) -> None:
+        reference = CollectedDataset(self.dataset_path, get_input=True)
+
+        output_path = convert(self.dataset_path, os.path.join(self.save_path, "memmap"), "memmap")
+        dataset = CollectedDataset(output_path, get_input=True)
+        assert dataset.storage.name == "memmap"
+        self.assert_same_samples(dataset, reference)
+
+        output_path = transform_datasets([self.dataset_path], os.path.join(self.save_path, "dropped"), 
+                                         drop_paths=["relu"])
+        dataset = CollectedDataset(output_path, get_input=True)
+        assert list(dataset[0][0].keys()) == ["linear1"]
+
+        with self.assertRaises(ValueError):
+            transform_datasets([self.dataset_path], os.path.join(self.save_path, "wrong"), keep_paths=["linear2"])
+
+    def test_merge(self) -> None:
+        reference = CollectedDataset(self.dataset_path, get_input=True)
+
+        output_path = merge([self.dataset_path, self.dataset_path], os.path.join(self.save_path, "merged"), 
+                            chunk_size=7)
+        dataset = CollectedDataset(output_path, get_input=True)
+
+        assert len(dataset) == 2*self.n_sample
+        self.assert_same_samples(dataset, reference)
+        self.assert_same_samples(dataset, reference, self.n_sample)
+
+        with open(os.path.join(output_path, "info.json")) as file:
+            info = json.load(file)
+        assert info["source_datasets"] == ["input", "input"]
+
+        statistics = dataset.statistics
+        reference_statistics = reference.statistics
+        assert statistics is not None and reference_statistics is not None
+        assert statistics.count("relu") == 2*self.n_sample
+        assert_tensor_almost_equal(statistics.mean("relu"), reference_statistics.mean("relu"))
+        assert_tensor_almost_equal(statistics.std("relu"), reference_statistics.std("relu"))
+
+    def test_shuffled(self) -> None:
+        shuffled_path = collect(self.test_model, ["linear1", "relu"], self.test_dataloader, self.save_path,
+                                "shuffled", save_input=True, shuffle_buffer=2)
+        
+        output_path = merge([shuffled_path, self.dataset_path], os.path.join(self.save_path, "merged"), 
+                            chunk_size=4, num_workers=2)
+        dataset = CollectedDataset(output_path, get_input=True)
+        original_indices = dataset.original_indices()
+
+        assert dataset.shuffled
+        assert original_indices[:self.n_sample].tolist() == CollectedDataset(shuffled_path).original_indices().tolist()
+        assert original_indices[self.n_sample:].tolist() == list(range(self.n_sample, 2*self.n_sample))
+        for index in range(self.n_sample):
+            assert dataset[index][1][0].item() == original_indices[index].item()
+
+    def test_aliases(self) -> None:
+        model = torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.Identity())
+        dataset_path = collect(model, ["0", "1"], self.test_dataloader, self.save_path, "aliased",
+                               detect_aliases=True)
+
+        output_path = transform_datasets([dataset_path], os.path.join(self.save_path, "aliased_rechunk"), chunk_size=4)
+        dataset = CollectedDataset(output_path)
+        assert dataset.aliases == {"1":"0"}
+        assert_tensor_almost_equal(dataset[5]["1"], CollectedDataset(dataset_path)[5]["0"])
+
+        with self.assertRaises(ValueError):
+            transform_datasets([dataset_path], os.path.join(self.save_path, "aliased_drop"), drop_paths=["0"])
+
+    def test_ragged(self) -> None:
+        x = torch.randn(self.n_sample, 3, 2)
+        lengths = torch.tensor([1, 2, 3, 3, 2, 1, 1, 2, 3, 3])
+        dataloader = DataLoader(torch.utils.data.TensorDataset(x, torch.zeros(self.n_sample)), batch_size=3)
+        dataset_path = collect(torch.nn.Sequential(torch.nn.Linear(2, 3)), ["0"], dataloader, self.save_path, "ragged", 
+                               sequence_mask=lambda batch: lengths[:len(batch)])
+
+        output_path = merge([dataset_path, dataset_path], os.path.join(self.save_path, "ragged_merge"), chunk_size=4)
+        dataset = CollectedDataset(output_path)
+        assert dataset.ragged_paths == ["0"]
+        
+        reference = CollectedDataset(dataset_path)
+        for index in range(len(dataset)):
+            assert_tensor_almost_equal(dataset[index]["0"], reference[index%self.n_sample]["0"])
+
+        with self.assertRaises(ValueError):
+            convert(dataset_path, os.path.join(self.save_path, "ragged_memmap"), "memmap")
+
+    def test_sparse(self) -> None:
+        dataset_path = collect(self.test_model, ["linear1", "relu"], self.test_dataloader, self.save_path, "sparse",
+                               sparse={"relu":"csr", "linear1":2})
+
+        output_path = rechunk(dataset_path, os.path.join(self.save_path, "sparse_rechunk"), 4)
+        dataset = CollectedDataset(output_path)
+        assert dataset.sparse == CollectedDataset(dataset_path).sparse
+
+        reference = CollectedDataset(self.dataset_path)
+        for index in range(self.n_sample):
+            assert_tensor_almost_equal(dataset[index]["relu"], reference[index]["relu"])
+
+    def test_cli(self) -> None:
+        output_path = os.path.join(self.save_path, "cli")
+        assert main([self.dataset_path, "-o", output_path, "--chunk-size", "5", "--storage", "append", 
+                     "--workers", "0"]) == 0
+        
+        dataset = CollectedDataset(output_path)
+        assert dataset.n_chunk == 2
+        assert dataset.storage.name == "append"
+
+        assert main([self.dataset_path, "-o", output_path, "--workers", "0"]) != 0
@@ -0,0 +1,129 @@
+import unittest
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from pytorch_probing import Prober
+from pytorch_probing.prober import ProbeBank, ProbeExecutor
+
+from .utils import TestModel
+
+
+class TestProbeBank(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        torch.manual_seed(0)
+
+        self.input_size = 2
+        self.hidden_size = 3
+        self.output_size = 1
+
+        self.test_model = TestModel(self.input_size, self.hidden_size,
+                                     self.output_size, n_hidden=0)
+        self.test_model = self.test_model.eval()
+
+        x = torch.randn(64, self.input_size)
+        y = x.sum(1, keepdim=True)
+        self.dataloader = DataLoader(TensorDataset(x, y), batch_size=16)
+
+    def tearDown(self) -> None:
+        super().tearDown()
+    
+        self.test_model = None
+
+    def _train(self, single_optimizer:bool) -> ProbeBank:
+        probes = {"linear1":torch.nn.Linear(self.hidden_size, 1), 
+                  "relu":torch.nn.Linear(self.hidden_size, 1)}
+        prober = Prober(self.test_model, probes)
+
+        bank = ProbeBank(prober, lambda params: torch.optim.SGD(params, lr=0.05, foreach=True), 
+                         torch.nn.MSELoss(), single_optimizer=single_optimizer, freeze_backbone=True)
+
+        first_losses = bank.evaluate(self.dataloader)
+        for _ in range(20):
+            for x, y in self.dataloader:
+                losses = bank.step(x, y)
+                assert set(losses.keys()) == {"linear1", "relu"}
+        last_losses = bank.evaluate(self.dataloader)
+
+        for path in probes:
+            assert last_losses[path]["loss"] < first_losses[path]["loss"]
+            assert len(bank.history[path]) == 2
+
+        for parameter in self.test_model.parameters():
+            assert parameter.grad is None
+            assert not parameter.requires_grad
+
+        bank.close()
+        for parameter in self.test_model.parameters():
+            assert parameter.requires_grad
+
+        prober.reduce()
+
+        return bank
+
+    def test_step(self) -> None:
+        self._train(single_optimizer=False)
+
+    def test_single_optimizer(self) -> None:
+        self._train(single_optimizer=True)
+
+    def test_early_stopping(self) -> None:
+        probes = {"linear1":torch.nn.Linear(self.hidden_size, 1), 
+                  "relu":torch.nn.Linear(self.hidden_size, 1)}
+        prober = Prober(self.test_model, probes)
+
+        bank = ProbeBank(prober, lambda params: torch.optim.SGD(params, lr=0.0), 
+                         {"linear1":torch.nn.MSELoss(), "relu":torch.nn.L1Loss()}, patience=2,
+                         metrics={"mae":lambda output, target: (output-target).abs().mean()})
+
+        for _ in range(3):
+            results = bank.evaluate(self.dataloader)
+        assert "mae" in results["relu"]
+        assert bank.stopped_paths == ["linear1", "relu"]
+        assert bank.step(*next(iter(self.dataloader))) == {}
+
+        weight = probes["linear1"].weight.detach().clone()
+        with torch.no_grad():
+            probes["linear1"].weight.add_(1)
+        bank.restore_best()
+        assert torch.equal(probes["linear1"].weight, weight)
+
+        prober.reduce()
+
+    def test_executor(self) -> None:
+        with ProbeExecutor() as executor:
+            prober = Prober(self.test_model, {"relu":torch.nn.Linear(self.hidden_size, 1)}, executor=executor)
+
+            with self.assertRaises(ValueError):
+                ProbeBank(prober, lambda params: torch.optim.SGD(params, lr=0.1), torch.nn.MSELoss())
+
+            prober.reduce()
+
+        prober = Prober(self.test_model, {"relu":torch.nn.Linear(self.hidden_size, 1)}, eager=True)
+        with self.assertRaises(ValueError):
+            ProbeBank(prober, lambda params: torch.optim.SGD(params, lr=0.1), torch.nn.MSELoss())
+        prober.reduce()
+
+    def test_step_skips_stopped(self) -> None:
+        probes = {"linear1":torch.nn.Linear(self.hidden_size, 1), 
+                  "relu":torch.nn.Linear(self.hidden_size, 1)}
+        prober = Prober(self.test_model, probes)
+
+        bank = ProbeBank(prober, lambda params: torch.optim.SGD(params, lr=0.05), torch.nn.MSELoss())
+        bank._stop("linear1")
+
+        n_call = [0]
+        probes["linear1"].register_forward_hook(lambda *args: n_call.__setitem__(0, n_call[0]+1))
+
+        x, y = next(iter(self.dataloader))
+        assert set(bank.step(x, y).keys()) == {"relu"}
+        assert n_call[0] == 0
+
+        # The backbone runs without gradients, even if not frozen
+        for parameter in self.test_model.parameters():
+            assert parameter.requires_grad
+            assert parameter.grad is None
+
+        prober.reduce()
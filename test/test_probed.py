@@ -3,6 +3,8 @@ import os
 import shutil
 import json
 import math
+import time
+import threading
 
 import torch
 from torch.utils.data import DataLoader
@@ -10,6 +12,8 @@ import numpy as np
 from numpy.testing import assert_array_almost_equal
 
 from pytorch_probing import collect, Prober
+from pytorch_probing.interceptor import EveryKSampler
+from pytorch_probing.prober import ProbeExecutor
 
 from .utils import TestModel, assert_tensor_almost_equal
 
@@ -75,4 +79,106 @@ class TestProbed(unittest.TestCase):
         inputs = torch.randn([10, 2])
         outputs = probed_model(inputs)
 
-        assert len(outputs[1]) == 0
\ No newline at end of file
+        assert len(outputs[1]) == 0
+
+    def test_pattern(self) -> None:
+        test_model = TestModel(self.input_size, self.hidden_size, self.output_size, n_hidden=2)
+        probe = torch.nn.Linear(self.hidden_size, 1)
+
+        probed_model = Prober(test_model, {"hidden_layers.*":probe, "linear1":None})
+        assert probed_model.probe_paths == ["hidden_layers.0", "hidden_layers.1", "hidden_layers.2", 
+                                            "hidden_layers.3", "linear1"]
+        assert probed_model.get_probe("hidden_layers.0") is not probed_model.get_probe("hidden_layers.1")
+
+        inputs = torch.randn([10, 2])
+        _, outputs = probed_model(inputs)
+        assert set(outputs.keys()) == set(probed_model.probe_paths)
+        assert outputs["hidden_layers.2"].shape == (10, 1)
+
+    def test_sampler(self) -> None:
+        probe = torch.nn.Linear(self.hidden_size, 1)
+        probed_model = Prober(self.test_model, {"linear1":probe}, sampler=EveryKSampler(2))
+
+        inputs = torch.randn([10, 2])
+        _, outputs = probed_model(inputs)
+        assert outputs["linear1"].shape == (10, 1)
+
+        _, outputs = probed_model(inputs)
+        assert len(outputs) == 0
+
+    def test_executor(self) -> None:
+        probe = torch.nn.Linear(self.hidden_size, 1)
+        results = []
+
+        inputs = torch.randn([10, 2])
+        expected = probe(self.test_model.relu(self.test_model.linear1(inputs)))
+
+        with ProbeExecutor(max_pending=4, callback=results.append) as executor:
+            probed_model = Prober(self.test_model, {"relu":probe}, executor=executor)
+
+            outputs, future = probed_model(inputs)
+            assert_tensor_almost_equal(outputs, self.test_model(inputs))
+            assert probed_model.outputs is None
+            assert probed_model.future is future
+
+            assert_tensor_almost_equal(future.result()["relu"], expected)
+
+            executor.wait()
+            assert len(results) == 1
+
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda: None)
+
+    def test_executor_drop_oldest(self) -> None:
+        event = threading.Event()
+
+        with ProbeExecutor(max_pending=2) as executor:
+            blocking = executor.submit(event.wait)
+            while executor.n_pending != 0:
+                time.sleep(0.001)
+
+            futures = [executor.submit(lambda i=i: i) for i in range(4)]
+            assert executor.n_dropped == 2
+            assert futures[0].cancelled() and futures[1].cancelled()
+
+            event.set()
+            assert blocking.result()
+            assert [future.result() for future in futures[2:]] == [2, 3]
+
+    def test_eager(self) -> None:
+        probe = torch.nn.Linear(self.hidden_size, 1)
+
+        inputs = torch.randn([10, 2])
+        expected = probe(self.test_model.relu(self.test_model.linear1(inputs)))
+        expected_linear1 = self.test_model.linear1(inputs)
+        expected_outputs = self.test_model(inputs)
+
+        probed_model = Prober(self.test_model, {"relu":probe, "linear1":None}, eager=True)
+
+        outputs, probe_outputs = probed_model(inputs)
+        assert probed_model._interceptor_layers["relu"].output is None
+        assert probed_model._interceptor_layers["relu"].consumer_output is None
+
+        assert_tensor_almost_equal(outputs, expected_outputs)
+        assert_tensor_almost_equal(probe_outputs["relu"], expected)
+        assert_tensor_almost_equal(probe_outputs["linear1"], expected_linear1)
+        assert len(list(probed_model.parameters())) == len(list(self.test_model.parameters())) + 2
+
+        with self.assertRaises(ValueError):
+            with ProbeExecutor() as executor:
+                Prober(self.test_model, {"relu":probe}, executor=executor, eager=True)
+
+    def test_resume(self) -> None:
+        probe = torch.nn.Linear(self.hidden_size, 1)
+
+        inputs = torch.randn([10, 2])
+        activation = self.test_model.linear1(inputs)
+        expected = self.test_model(inputs)
+        expected_probe = probe(self.test_model.relu(activation))
+
+        probed_model = Prober(self.test_model, {"relu":probe, "linear1":None})
+        outputs, probe_outputs = probed_model.resume("linear1", activation)
+
+        assert_tensor_almost_equal(outputs, expected)
+        assert_tensor_almost_equal(probe_outputs["relu"], expected_probe)
+        assert "linear1" not in probe_outputs
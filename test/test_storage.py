@@ -0,0 +1,95 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import torch
+from torch.utils.data import DataLoader
+
+from pytorch_probing import collect, CollectedDataset
+from pytorch_probing.collect import IterableCollectedDataset
+
+from .utils import TestModel, TestDataset, assert_tensor_almost_equal
+
+
+class TestStorage(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.test_model = TestModel(2, 3, 1).eval()
+        self.n_sample = 23
+
+        # Uneven chunks, not only the last one
+        batches = [list(range(0, 5)), list(range(5, 7)), list(range(7, 20)), list(range(20, 23))]
+        self.test_dataloader = DataLoader(TestDataset(2, 1, self.n_sample), batch_sampler=batches)
+
+        self.save_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        super().tearDown()
+
+        shutil.rmtree(self.save_path, ignore_errors=True)
+
+    def test_storages(self) -> None:
+        paths = ["linear1", "relu"]
+        datasets = {}
+        dataset_paths = {}
+        for storage in ["torch", "append", "memmap"]:
+            dataset_path = collect(self.test_model, paths, self.test_dataloader, self.save_path, storage,
+                                   save_input=True, save_target=True, storage=storage)
+            dataset_paths[storage] = dataset_path
+            datasets[storage] = CollectedDataset(dataset_path, get_input=True, get_target=True)
+
+        reference = datasets["torch"]
+        assert len(reference) == self.n_sample
+        for index in range(self.n_sample):
+            assert reference[index][1][0].item() == index
+
+        for storage, dataset in datasets.items():
+            assert dataset.storage.name == storage
+            assert len(dataset) == self.n_sample
+
+            for index in range(self.n_sample):
+                item = dataset[index]
+                expected = reference[index]
+                assert_tensor_almost_equal(item[0]["linear1"], expected[0]["linear1"])
+                assert_tensor_almost_equal(item[0]["relu"], expected[0]["relu"])
+                assert_tensor_almost_equal(item[1], expected[1])
+                assert_tensor_almost_equal(item[2], expected[2])
+
+            indices = [22, 0, 6, 7, 3]
+            batch = dataset.get_batch(indices)
+            assert batch[1][:, 0].tolist() == indices
+            for position, index in enumerate(indices):
+                assert_tensor_almost_equal(batch[0]["relu"][position], reference[index][0]["relu"])
+
+            iterable_dataset = IterableCollectedDataset(dataset_paths[storage], get_input=True)
+            assert [sample[1][0].item() for sample in iterable_dataset] == list(range(self.n_sample))
+
+        with self.assertRaises(IndexError):
+            reference[self.n_sample]
+
+    def test_unknown_storage(self) -> None:
+        with self.assertRaises(ValueError):
+            collect(self.test_model, ["linear1"], self.test_dataloader, self.save_path, "unknown", storage="unknown")
+
+    def test_legacy_dataset(self) -> None:
+        dataset_path = os.path.join(self.save_path, "legacy")
+        os.makedirs(dataset_path)
+
+        for chunk_index, use_zipfile in enumerate([True, False]):
+            start = chunk_index*4
+            chunk = {"intercepted_outputs":{"linear1":torch.arange(start, start+4).reshape(4, 1).float()}, 
+                     "index":chunk_index}
+            torch.save(chunk, os.path.join(dataset_path, f"{chunk_index}.pt"), 
+                       _use_new_zipfile_serialization=use_zipfile)
+
+        info = {"dataset_name":"legacy", "n_chunk":2, "n_sample":8, "has_input":False,
+                "has_target":False, "has_prediction":False, "module_name":"TestModel"}
+        with open(os.path.join(dataset_path, "info.json"), "w") as file:
+            json.dump(info, file)
+
+        dataset = CollectedDataset(dataset_path)
+        assert [dataset[index]["linear1"].item() for index in range(8)] == list(range(8))
+        assert dataset.get_batch([7, 1])["linear1"][:, 0].tolist() == [7, 1]
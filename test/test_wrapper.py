@@ -2,7 +2,10 @@ import unittest
 import pprint
 import os
 
-from pytorch_probing import Interceptor
+import torch
+
+from pytorch_probing import Interceptor, Prober
+from pytorch_probing.interceptor import InterceptorLayer
 
 from .utils import TestModel, assert_tensor_almost_equal
 
@@ -43,4 +46,28 @@ class TestWrapper(unittest.TestCase):
         intercepted_model.reduce()
 
         assert self.test_model.a == 1
-        assert self.test_model.b == 2
\ No newline at end of file
+        assert self.test_model.b == 2
+    def test_nested(self) -> None:
+        linear = torch.nn.Linear(2, 2)
+        inner = InterceptorLayer(linear)
+        outer = InterceptorLayer(inner)
+
+        # Delegated twice, through the cached delegate
+        for _ in range(2):
+            assert outer.weight is linear.weight
+            outer.a = 1
+            assert linear.a == 1
+            assert outer.alias_of is None
+
+        # Members of a nested wrapper are not skipped
+        prober = Prober(torch.nn.Sequential(linear), {"0":torch.nn.Linear(2, 1)})
+        intercepted_prober = Interceptor(prober, [])
+        assert intercepted_prober.probe_paths == ["0"]
+        assert intercepted_prober.get_probe("0") is prober.get_probe("0")
+
+        other_linear = torch.nn.Linear(2, 2)
+        inner._module = other_linear
+        assert outer.weight is other_linear.weight
+        outer.a = 2
+        assert other_linear.a == 2
+        assert linear.a == 1